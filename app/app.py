@@ -1,12 +1,12 @@
 import os
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
 
+from . import assets
+from .core import STATIC_MAX_AGE
 from .database import init_db
-from .routers import allocations, auth, bills, files, staff, stats, transactions
+from .routers import allocations, auth, bills, files, staff, statements, stats, transactions
 
 # Initialize API
 app = FastAPI(
@@ -15,7 +15,12 @@ app = FastAPI(
     version="1.0.0",
 )
 
-# 1. CORS Configuration
+# 1. Middleware
+# Oversized uploads are refused from their Content-Length, before the body is read. Registered
+# first so CORS (added next) wraps it and browsers can read the 413.
+app.middleware("http")(files.limit_upload_size)
+
+# CORS Configuration
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allow all origins for dev; restrict in prod
@@ -31,6 +36,7 @@ def on_startup():
     init_db()
     os.makedirs("uploads", exist_ok=True)
     os.makedirs("static", exist_ok=True)  # Ensure static dir exists
+    assets.preload("static")  # Precompress once instead of on the first visits
 
 
 # 3. Include Routers
@@ -40,19 +46,23 @@ app.include_router(stats.router)
 app.include_router(bills.router)
 app.include_router(allocations.router)
 app.include_router(staff.router)
+app.include_router(statements.router)
 app.include_router(files.router, prefix="/files")
 
-# 4. Mount Static Files
-# This allows serving the frontend assets
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# 4. Static Files
+# Served precompressed (gzip/brotli) with content-hash ETags; long-lived caching for /static
+@app.get("/static/{file_path:path}", name="static")
+def read_static(file_path: str, request: Request):
+    return assets.serve(request, assets.safe_join("static", file_path), f"public, max-age={STATIC_MAX_AGE}")
 
 
 # Root Endpoint -> Serve the Frontend
 @app.get("/")
-async def read_root():
+def read_root(request: Request):
     # Make sure static/index.html exists before running
     if os.path.exists("static/index.html"):
-        return FileResponse("static/index.html")
+        # no-cache: the URL never changes, so revalidate every visit (a 304 when unchanged)
+        return assets.serve(request, "static/index.html", "no-cache")
     return {
         "status": "online",
         "system": "SHS Financial Transparency System",
@@ -0,0 +1,109 @@
+"""Static asset serving with precompressed gzip/brotli variants, content-hash ETags and conditional GET. Variants are built once per file (and rebuilt if the file changes on disk)."""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from fastapi import HTTPException, Request, Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip alone still covers every browser
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+_lock = threading.Lock()
+_assets: dict[str, "Asset"] = {}
+
+
+class Asset:
+    def __init__(self, path: str):
+        stat = os.stat(path)
+        with open(path, "rb") as f:
+            body = f.read()
+        self.mtime = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.digest = hashlib.sha256(body).hexdigest()[:32]
+        self.variants = {"identity": body}
+        if self.media_type.startswith(COMPRESSIBLE_TYPES) and len(body) > 1024:
+            gz = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(gz) < len(body):
+                self.variants["gzip"] = gz
+            if brotli is not None:
+                br = brotli.compress(body, quality=11)
+                if len(br) < len(gz):
+                    self.variants["br"] = br
+
+    def etag(self, encoding: str) -> str:
+        """Strong ETag per representation: each encoding of the same content gets its own tag."""
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+    def is_stale(self, path: str) -> bool:
+        stat = os.stat(path)
+        return stat.st_mtime_ns != self.mtime or stat.st_size != self.size
+
+
+def load(path: str) -> Asset:
+    """Return the precompressed asset for `path`, building it on first use or after a change."""
+    with _lock:
+        asset = _assets.get(path)
+    if asset is None or asset.is_stale(path):
+        asset = Asset(path)
+        with _lock:
+            _assets[path] = asset
+    return asset
+
+
+def preload(directory: str):
+    """Build variants for every file under `directory` so the first visitor doesn't pay for compression."""
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                load(os.path.join(root, name))
+            except OSError as e:
+                print(f"⚠️ Asset preload skipped {name}: {e}")
+
+
+def _accepted_encodings(request: Request) -> set[str]:
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        token, _, params = part.strip().partition(";")
+        if token and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            accepted.add(token.lower())
+    return accepted
+
+
+def serve(request: Request, path: str, cache_control: str) -> Response:
+    """Serve a file with the best encoding the client accepts; 304 if its ETag matches."""
+    try:
+        asset = load(path)
+    except (FileNotFoundError, IsADirectoryError):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    accepted = _accepted_encodings(request)
+    encoding = "identity"
+    for candidate in ("br", "gzip"):
+        if candidate in asset.variants and (candidate in accepted or "*" in accepted):
+            encoding = candidate
+            break
+
+    etag = asset.etag(encoding)
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(asset.variants[encoding], media_type=asset.media_type, headers=headers)
+
+
+def safe_join(directory: str, relative: str) -> str:
+    """Resolve `relative` inside `directory`, refusing paths that escape it."""
+    base = os.path.realpath(directory)
+    full = os.path.realpath(os.path.join(base, relative))
+    if full != base and not full.startswith(base + os.sep):
+        raise HTTPException(status_code=404, detail="File not found")
+    return full
@@ -0,0 +1,275 @@
+"""Content-addressed store for proof attachments. A file is named by the SHA-256 of its bytes and kept once under uploads/ab/cd/<digest>, however many transactions attach it; its digest is anchored in immudb's verified key-value store (file:<digest>) so a receipt altered on disk is detected. References are counted from transactions.proof_reference rather than kept as a separate counter.
+
+The attachments table indexes what was uploaded (size, type, digest, uploader, first linked transaction), so listing files and sweeping orphans read the database instead of walking uploads/."""
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from . import queries as q
+
+UPLOAD_DIR = "uploads"
+# Partial uploads live here until hashed, on the same filesystem so the final rename is atomic
+INCOMING_DIR = os.path.join(UPLOAD_DIR, ".incoming")
+# Bytes read per step while copying and hashing
+CHUNK_SIZE = 1024 * 1024
+
+# Accepted content types and the extension their stored name gets
+EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "application/pdf": "pdf"}
+
+_DIGEST_NAME = re.compile(r"([0-9a-f]{64})(\.[a-z0-9]{1,8})?")
+
+TABLE = "attachments"
+COLUMNS = ("name", "sha256", "size", "content_type", "uploaded_by", "txn_id", "uploaded_at")
+
+CREATE_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE} (
+        name VARCHAR[128],
+        sha256 VARCHAR[64],
+        size INTEGER,
+        content_type VARCHAR[64],
+        uploaded_by VARCHAR[256],
+        txn_id INTEGER,
+        uploaded_at TIMESTAMP,
+        PRIMARY KEY name
+    )
+"""
+
+# Names per DELETE ... IN (...) when sweeping
+SWEEP_CHUNK = 200
+
+
+class TooLarge(Exception):
+    pass
+
+
+def digest_of(name: str) -> str | None:
+    """The SHA-256 digest a stored name refers to, or None for a legacy (uuid) upload."""
+    match = _DIGEST_NAME.fullmatch(name or "")
+    return match.group(1) if match else None
+
+
+def path_for(name: str) -> str:
+    """
+    Where `name` (as in files/<name>) lives on disk: uploads/ab/cd/<digest> for content-addressed
+    files, uploads/<name> for uploads made before the store existed.
+    """
+    digest = digest_of(name)
+    if digest is None:
+        return os.path.join(UPLOAD_DIR, name)
+    return os.path.join(UPLOAD_DIR, digest[:2], digest[2:4], digest)
+
+
+def save(fileobj, ext: str, max_bytes: int) -> dict:
+    """
+    Copy `fileobj` into the store, hashing as it goes. Raises TooLarge past `max_bytes`.
+    Returns name (<digest>.<ext>), sha256, size and whether the content was new.
+    """
+    os.makedirs(INCOMING_DIR, exist_ok=True)
+    partial_path = os.path.join(INCOMING_DIR, f"{uuid.uuid4()}.part")
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with open(partial_path, "wb") as buffer:
+            while chunk := fileobj.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise TooLarge()
+                digest.update(chunk)
+                buffer.write(chunk)
+
+        name = f"{digest.hexdigest()}.{ext}"
+        final_path = path_for(name)
+        created = not os.path.exists(final_path)
+        if created:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            # Same bytes always land at the same path, so a racing identical upload is harmless
+            os.replace(partial_path, final_path)
+        return {"name": name, "sha256": digest.hexdigest(), "size": size, "created": created}
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+def _anchor_key(digest: str) -> bytes:
+    return f"file:{digest}".encode("utf-8")
+
+
+def anchor(client, digest: str, size: int, content_type: str):
+    """Record the digest in the verified key-value store (once per content; re-uploads are no-ops)."""
+    key = _anchor_key(digest)
+    try:
+        if client.get(key) is not None:
+            return
+    except Exception:
+        pass  # Missing keys raise on some client versions
+    client.verifiedSet(key, json.dumps({"sha256": digest, "size": size, "content_type": content_type}).encode("utf-8"))
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify(client, name: str) -> dict:
+    """Re-hash the stored file and compare it with the name and the anchored record (verifiedGet checks the proof)."""
+    digest = digest_of(name)
+    anchored = json.loads(client.verifiedGet(_anchor_key(digest)).value.decode("utf-8"))
+    actual = hash_file(path_for(name))
+    return {
+        "verified": actual == digest == anchored["sha256"],
+        "sha256": digest,
+        "actual_sha256": actual,
+        "size": anchored["size"],
+        "content_type": anchored["content_type"],
+    }
+
+
+def references(client, name: str) -> int:
+    """How many transactions attach files/<name> as their proof."""
+    res = client.sqlQuery(
+        q.select("transactions", ("COUNT(*)",), where=("proof_reference",)), {"proof_reference": f"files/{name}"}
+    )
+    return res[0][0] if res else 0
+
+
+def record(client, name: str, sha256: str, size: int, content_type: str, uploaded_by: str):
+    """
+    Add the metadata row for an upload. Uploading existing content again only refreshes uploaded_at,
+    so a file about to be attached isn't swept as an old orphan in the meantime.
+    """
+    un = {"name": name}
+    if client.sqlQuery(q.select(TABLE, ("name",), where=("name",)), un):
+        client.sqlExec(q.update(TABLE, (), where=("name",), now=("uploaded_at",)), un)
+        return
+    client.sqlExec(
+        q.insert(TABLE, COLUMNS[:-1], now=("uploaded_at",)),
+        {"name": name, "sha256": sha256, "size": size, "content_type": content_type, "uploaded_by": uploaded_by or "", "txn_id": 0},
+    )
+
+
+def link(client, proof_reference: str, txn_id: int):
+    """
+    Note the first transaction attaching files/<name>. Called after the ledger write, so a failure is
+    logged rather than failing the request (references are always counted from proof_reference anyway).
+    """
+    if not (proof_reference or "").startswith("files/"):
+        return
+    try:
+        client.sqlExec(
+            q.update(TABLE, ("txn_id",), where=("name", "txn_id = 0")),
+            {"name": proof_reference.removeprefix("files/"), "txn_id": txn_id},
+        )
+    except Exception as e:
+        print(f"⚠️ Attachment link failed: {e}")
+
+
+def referenced_names(client) -> set:
+    """Every files/<name> attached to some transaction, from one read of proof_reference."""
+    rows = client.sqlQuery(q.select("transactions", ("proof_reference",), where=("proof_reference != ''",)))
+    return {ref.removeprefix("files/") for (ref,) in rows if ref and ref.startswith("files/")}
+
+
+def sweep(client, grace_hours: float, dry_run: bool = True) -> dict:
+    """
+    Find (and unless dry_run, delete) attachments no transaction references that were uploaded more
+    than `grace_hours` ago. A stored file shared with a kept name is left on disk.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=grace_hours)
+    referenced = referenced_names(client)
+    all_names = [name for (name,) in client.sqlQuery(q.select(TABLE, ("name",)))]
+    old_rows = client.sqlQuery(
+        q.select(TABLE, ("name", "sha256", "size"), where=("uploaded_at < @cutoff",), order_by="name"), {"cutoff": cutoff}
+    )
+    orphans = [(name, sha256, size) for name, sha256, size in old_rows if name not in referenced]
+    orphan_names = {name for name, _, _ in orphans}
+    kept_paths = {path_for(name) for name in all_names if name not in orphan_names}
+
+    if not dry_run:
+        # Rows first: a file without a row is merely unlisted, a row without its file is broken
+        names = sorted(orphan_names)
+        for start in range(0, len(names), SWEEP_CHUNK):
+            cond, params = q.in_list("name", names[start : start + SWEEP_CHUNK])
+            client.sqlExec(q.delete(TABLE, where=(cond,)), params)
+        for name in names:
+            path = path_for(name)
+            if path not in kept_paths and os.path.isfile(path):
+                os.remove(path)
+
+    return {
+        "dry_run": dry_run,
+        "orphans": [{"name": name, "sha256": sha256, "size": size} for name, sha256, size in orphans],
+        "bytes": sum(size or 0 for _, _, size in orphans),
+    }
+
+
+def _sniff_type(path: str) -> str:
+    with open(path, "rb") as f:
+        head = f.read(8)
+    if head.startswith(b"%PDF"):
+        return "application/pdf"
+    if head.startswith(b"\x89PNG"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    return "application/octet-stream"
+
+
+def backfill(client):
+    """Create the attachments table and register files already in uploads/ (one walk, at migration time)."""
+    client.sqlExec(CREATE_TABLE)
+    first_txn = {}
+    for txn_id, ref in client.sqlQuery(
+        q.select("transactions", ("id", "proof_reference"), where=("proof_reference != ''",), order_by="id")
+    ):
+        if ref and ref.startswith("files/"):
+            first_txn.setdefault(ref.removeprefix("files/"), txn_id)
+    # Stored content sits under its bare digest; the name transactions use carries the extension
+    name_by_digest = {digest_of(name): name for name in first_txn if digest_of(name)}
+
+    rows = []
+    for root, dirs, files in os.walk(UPLOAD_DIR):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for filename in files:
+            path = os.path.join(root, filename)
+            if digest_of(filename) == filename:
+                content_type = _sniff_type(path)
+                name = name_by_digest.get(filename) or f"{filename}.{EXTENSIONS.get(content_type, 'bin')}"
+                sha256 = filename
+            else:
+                name = filename
+                content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                sha256 = hash_file(path)
+            stat = os.stat(path)
+            rows.append((
+                name, sha256, stat.st_size, content_type, "", first_txn.get(name, 0),
+                datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            ))
+
+    for start in range(0, len(rows), SWEEP_CHUNK):
+        chunk = rows[start : start + SWEEP_CHUNK]
+        client.sqlExec(q.insert_many(TABLE, COLUMNS, len(chunk)), q.row_params(COLUMNS, chunk))
+    print(f"  ✅ Registered {len(rows)} existing attachments")
+
+
+if __name__ == "__main__":
+    # Scheduled cleanup, e.g. nightly from cron: python -m app.attachments [--delete]
+    import argparse
+
+    from .core import ATTACHMENT_GRACE_HOURS
+    from .database import get_db_client
+
+    parser = argparse.ArgumentParser(description="Report (or delete) attachments no transaction references.")
+    parser.add_argument("--delete", action="store_true", help="delete orphans instead of only listing them")
+    parser.add_argument("--grace-hours", type=float, default=ATTACHMENT_GRACE_HOURS)
+    args = parser.parse_args()
+    result = sweep(get_db_client(), args.grace_hours, dry_run=not args.delete)
+    for orphan in result["orphans"]:
+        print(f"{orphan['name']}\t{orphan['size']}")
+    print(f"{len(result['orphans'])} orphaned attachments, {result['bytes']} bytes{' deleted' if args.delete else ''}")
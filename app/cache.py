@@ -0,0 +1,97 @@
+"""Response cache for read-heavy GET endpoints. Each cached route depends on one or more scopes (transactions, bills, allocations, users); write paths bump the scope version, which invalidates every entry built from it. Entries live in each worker, but scope versions are shared (see shared.py), so a write in one worker invalidates all of them. Responses carry a strong ETag and conditional requests get 304."""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+from . import shared
+
+MAX_ENTRIES = 256
+# Small values (e.g. one user's profile) are kept apart so they don't evict whole responses
+MAX_VALUES = 2048
+
+_lock = threading.Lock()
+_entries: OrderedDict = OrderedDict()  # key -> (versions, etag, body)
+_values: OrderedDict = OrderedDict()  # key -> (versions, None, value)
+_adapters: dict = {}
+
+
+def version(scope: str) -> str:
+    return shared.token(f"cache-{scope}")
+
+
+def bump(*scopes: str):
+    """Invalidate everything built from these scopes, in every worker. Call after a successful write."""
+    for scope in scopes:
+        shared.bump(f"cache-{scope}")
+
+
+def _key(request: Request) -> str:
+    return request.url.path + "?" + "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _serialize(model, data) -> bytes:
+    adapter = _adapters.get(model)
+    if adapter is None:
+        adapter = _adapters[model] = TypeAdapter(model)
+    return adapter.dump_json(adapter.validate_python(data))
+
+
+def _lookup(entries: OrderedDict, key: str, current: tuple):
+    with _lock:
+        entry = entries.get(key)
+        if entry is not None:
+            entries.move_to_end(key)
+    return entry if entry is not None and entry[0] == current else None
+
+
+def _store(entries: OrderedDict, limit: int, key: str, entry: tuple) -> tuple:
+    with _lock:
+        entries[key] = entry
+        entries.move_to_end(key)
+        while len(entries) > limit:
+            entries.popitem(last=False)
+    return entry
+
+
+def cached_value(key: str, scopes: tuple, build: Callable[[], Any]) -> Any:
+    """
+    `build()` kept under `key` until one of `scopes` changes, for values that aren't whole responses.
+    Callers must not mutate what is returned. Exceptions from build() propagate and nothing is stored.
+    """
+    current = tuple(version(s) for s in scopes)
+    entry = _lookup(_values, key, current)
+    if entry is None:
+        entry = _store(_values, MAX_VALUES, key, (current, None, build()))
+    return entry[2]
+
+
+def cached_response(request: Request, scopes: tuple, model, build: Callable[[], Any]) -> Response:
+    """
+    Serve `build()` (serialized through `model`, like response_model would) from the cache
+    while none of `scopes` changed. Exceptions from build() propagate and nothing is stored.
+    """
+    key = _key(request)
+    current = tuple(version(s) for s in scopes)
+    entry = _lookup(_entries, key, current)
+    if entry is None:
+        body = _serialize(model, build())
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        entry = _store(_entries, MAX_ENTRIES, key, (current, etag, body))
+
+    _, etag, body = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -23,4 +23,41 @@ INITIAL_PRESIDENT_PASS = os.getenv("INITIAL_PRESIDENT_PASS", "president123")
 INITIAL_PROCUREMENT_PASS = os.getenv("INITIAL_PROCUREMENT_PASS", "procurement123")
 INITIAL_DEPT_HEAD_PASS = os.getenv("INITIAL_DEPT_HEAD_PASS", "depthead123")
 INITIAL_BOOKKEEPER_PASS = os.getenv("INITIAL_BOOKKEEPER_PASS", "bookkeeper123")
-INITIAL_STUDENT_PASS = os.getenv("INITIAL_STUDENT_PASS", "student123")
\ No newline at end of file
+INITIAL_STUDENT_PASS = os.getenv("INITIAL_STUDENT_PASS", "student123")
+
+# Multi-worker Coordination
+# Workers on this host share cache versions through small files in this directory.
+SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR", ".shared_state")
+
+# Static Asset Caching
+# Browsers may reuse /static files for this many seconds without revalidating (default: 7 days).
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", 7 * 24 * 3600))
+
+# File Uploads
+# Largest accepted proof attachment in megabytes (default: 10 MB).
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", 10)) * 1024 * 1024)
+# Unreferenced attachments younger than this many hours are kept (the upload precedes its transaction).
+ATTACHMENT_GRACE_HOURS = float(os.getenv("ATTACHMENT_GRACE_HOURS", 24))
+
+# Idempotency Keys
+# Responses to POSTs carrying an Idempotency-Key are replayed for retries within this window (default: 24 hours),
+# keeping at most this many keys (see app/idempotency.py).
+IDEMPOTENCY_TTL_SECONDS = int(float(os.getenv("IDEMPOTENCY_TTL_HOURS", 24)) * 3600)
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", 10000))
+
+# Login Throttling
+# Each username, and each client IP, may make this many /login or /change-password attempts per window
+# (default: 10 and 100 per 5 minutes); further attempts get 429 without hashing anything (see app/throttle.py).
+LOGIN_ATTEMPTS_PER_USER = int(os.getenv("LOGIN_ATTEMPTS_PER_USER", 10))
+LOGIN_ATTEMPTS_PER_IP = int(os.getenv("LOGIN_ATTEMPTS_PER_IP", 100))
+LOGIN_WINDOW_SECONDS = int(float(os.getenv("LOGIN_WINDOW_MINUTES", 5)) * 60)
+# Take the client IP from the last X-Forwarded-For entry; enable only behind exactly one reverse proxy that appends it.
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+
+# Password Hashing
+# scrypt cost for new hashes: N = 2**PASSWORD_SCRYPT_LOG_N (default 2**14), block size r and parallelism p.
+# Each hash records its own parameters; older hashes are upgraded on the user's next successful login.
+# Run login_benchmark.py to see what each cost means for login latency on this machine.
+PASSWORD_SCRYPT_N = 2 ** int(os.getenv("PASSWORD_SCRYPT_LOG_N", 14))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", 8))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", 1))
@@ -1,6 +1,13 @@
+import os
+import socket
+import time
+from datetime import datetime, timezone
+
 from fastapi import HTTPException
 from immudb import ImmudbClient
 
+from . import attachments, ledger, rollups
+from . import queries as q
 from .core import (
     DB_HOST,
     DB_PASSWORD,
@@ -35,7 +42,7 @@ def get_db_client() -> ImmudbClient:
 def _role_table_schema(table_name: str) -> str:
     """Same schema for all role tables (admin, payables, etc.)."""
     return f"""
-            CREATE TABLE {table_name} (
+            CREATE TABLE IF NOT EXISTS {table_name} (
                 id INTEGER AUTO_INCREMENT,
                 username VARCHAR,
                 first_name VARCHAR,
@@ -48,94 +55,190 @@ def _role_table_schema(table_name: str) -> str:
         """
 
 
-def _ensure_new_user_tables(client: ImmudbClient):
-    """
-    - users: id, username, hashed_password, role (student|staff|admin|payables|...), active
-    - students, staff: as before
-    - admin, payables, bookkeeper, vp_finance, president, procurement, dept_head, it: each own table, same columns
-    """
-    # Check if old users table exists (has 'name' column)
+def _drop_legacy_tables(client: ImmudbClient):
+    """Drop the old users table (had a 'name' column) and the old general table."""
     try:
         client.sqlQuery("SELECT id, username, name FROM users LIMIT 1")
         try:
             client.sqlExec("DROP TABLE users")
+            print("  ✅ Dropped old users table")
         except Exception:
             pass
     except Exception:
         pass
 
-    # Create users table if not exists
     try:
-        client.sqlQuery("SELECT id, username, role, active FROM users LIMIT 1")
+        client.sqlExec("DROP TABLE general")
+        print("  ✅ Dropped old general table")
     except Exception:
-        client.sqlExec("""
-            CREATE TABLE users (
-                id INTEGER AUTO_INCREMENT,
-                username VARCHAR,
-                hashed_password VARCHAR,
-                role VARCHAR,
-                active BOOLEAN,
-                PRIMARY KEY id
-            )
-        """)
-        print("  ✅ Created users table")
+        pass
 
-    # Create students table if not exists
-    try:
-        client.sqlQuery("SELECT id FROM students LIMIT 1")
-    except Exception:
-        client.sqlExec("""
-            CREATE TABLE students (
-                id INTEGER AUTO_INCREMENT,
-                username VARCHAR,
-                first_name VARCHAR,
-                middle_name VARCHAR,
-                last_name VARCHAR,
-                gender VARCHAR,
-                strand VARCHAR,
-                section VARCHAR,
-                payment_plan VARCHAR,
-                PRIMARY KEY id
-            )
-        """)
-        print("  ✅ Created students table")
 
-    # Create staff table if not exists
-    try:
-        client.sqlQuery("SELECT id FROM staff LIMIT 1")
-    except Exception:
-        client.sqlExec("""
-            CREATE TABLE staff (
-                id INTEGER AUTO_INCREMENT,
-                username VARCHAR,
-                first_name VARCHAR,
-                middle_name VARCHAR,
-                last_name VARCHAR,
-                gender VARCHAR,
-                position VARCHAR,
-                department VARCHAR,
-                date_hired VARCHAR,
-                status VARCHAR,
-                monthly_salary INTEGER,
-                PRIMARY KEY id
-            )
-        """)
-        print("  ✅ Created staff table")
+def _ensure_new_user_tables(client: ImmudbClient):
+    """
+    - users: id, username, hashed_password, role (student|staff|admin|payables|...), active
+    - students, staff: as before
+    - admin, payables, bookkeeper, vp_finance, president, procurement, dept_head, it: each own table, same columns
+    """
+    client.sqlExec("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER AUTO_INCREMENT,
+            username VARCHAR,
+            hashed_password VARCHAR,
+            role VARCHAR,
+            active BOOLEAN,
+            PRIMARY KEY id
+        )
+    """)
+    client.sqlExec("""
+        CREATE TABLE IF NOT EXISTS students (
+            id INTEGER AUTO_INCREMENT,
+            username VARCHAR,
+            first_name VARCHAR,
+            middle_name VARCHAR,
+            last_name VARCHAR,
+            gender VARCHAR,
+            strand VARCHAR,
+            section VARCHAR,
+            payment_plan VARCHAR,
+            PRIMARY KEY id
+        )
+    """)
+    client.sqlExec("""
+        CREATE TABLE IF NOT EXISTS staff (
+            id INTEGER AUTO_INCREMENT,
+            username VARCHAR,
+            first_name VARCHAR,
+            middle_name VARCHAR,
+            last_name VARCHAR,
+            gender VARCHAR,
+            position VARCHAR,
+            department VARCHAR,
+            date_hired VARCHAR,
+            status VARCHAR,
+            monthly_salary INTEGER,
+            PRIMARY KEY id
+        )
+    """)
+    # One table per role: admin, payables, bookkeeper, vp_finance, president, procurement, dept_head, it
+    for table_name in ROLE_TABLES:
+        client.sqlExec(_role_table_schema(table_name))
+
+
+def _create_tables(client: ImmudbClient):
+    """Every application table, created only if missing."""
+    _ensure_new_user_tables(client)
 
-    # Drop old general table if it exists (migration)
+    client.sqlExec("""
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER AUTO_INCREMENT,
+            created_at TIMESTAMP,
+            recorded_by VARCHAR,
+            txn_type VARCHAR,
+            strand VARCHAR,
+            category VARCHAR,
+            description VARCHAR,
+            amount INTEGER,
+            status VARCHAR,
+            student_id VARCHAR,
+            staff_id VARCHAR,
+            approved_by VARCHAR,
+            approval_date TIMESTAMP,
+            proof_reference VARCHAR,
+            PRIMARY KEY id
+        )
+    """)
+    client.sqlExec("""
+        CREATE TABLE IF NOT EXISTS bills (
+            id INTEGER AUTO_INCREMENT,
+            created_at TIMESTAMP,
+            bill_type VARCHAR,
+            description VARCHAR,
+            total_amount INTEGER,
+            created_by VARCHAR,
+            PRIMARY KEY id
+        )
+    """)
+    client.sqlExec("""
+        CREATE TABLE IF NOT EXISTS bill_assignments (
+            id INTEGER AUTO_INCREMENT,
+            bill_id INTEGER,
+            student_id VARCHAR,
+            amount INTEGER,
+            paid_amount INTEGER,
+            status VARCHAR,
+            PRIMARY KEY id
+        )
+    """)
+    client.sqlExec("""
+        CREATE TABLE IF NOT EXISTS financial_allocations (
+            id INTEGER AUTO_INCREMENT,
+            name VARCHAR,
+            amount INTEGER,
+            PRIMARY KEY id
+        )
+    """)
+    client.sqlExec("""
+        CREATE TABLE IF NOT EXISTS staff_payroll (
+            id INTEGER AUTO_INCREMENT,
+            staff_id VARCHAR,
+            salary_amount INTEGER,
+            updated_at TIMESTAMP,
+            updated_by VARCHAR,
+            PRIMARY KEY id
+        )
+    """)
+    client.sqlExec("""
+        CREATE TABLE IF NOT EXISTS staff_deductions (
+            id INTEGER AUTO_INCREMENT,
+            staff_id VARCHAR,
+            deduction_type VARCHAR,
+            amount INTEGER,
+            PRIMARY KEY id
+        )
+    """)
+
+
+def _add_transactions_staff_id(client: ImmudbClient):
+    """Add staff_id if the transactions table predates it."""
     try:
-        client.sqlExec("DROP TABLE general")
-        print("  ✅ Dropped old general table")
+        client.sqlQuery("SELECT staff_id FROM transactions LIMIT 1")
     except Exception:
-        pass
+        client.sqlExec("ALTER TABLE transactions ADD COLUMN staff_id VARCHAR")
+        print("  ✅ Added staff_id to transactions")
 
-    # Create one table per role: admin, payables, bookkeeper, vp_finance, president, procurement, dept_head, it
-    for table_name in ROLE_TABLES:
-        try:
-            client.sqlQuery(f"SELECT id FROM {table_name} LIMIT 1")
-        except Exception:
-            client.sqlExec(_role_table_schema(table_name))
-            print(f"  ✅ Created {table_name} table")
+
+def _create_indexes(client: ImmudbClient):
+    for table, column in (
+        ("transactions", "student_id"),
+        ("transactions", "staff_id"),
+        ("transactions", "status"),
+        ("bill_assignments", "student_id"),
+        ("staff_payroll", "staff_id"),
+        ("staff_deductions", "staff_id"),
+    ):
+        client.sqlExec(f"CREATE INDEX IF NOT EXISTS ON {table}({column})")
+
+
+def _create_txn_rollup(client: ImmudbClient):
+    """Per-day totals for /stats/trends, backfilled from the existing ledger (see rollups.py)."""
+    rollups.rebuild(client)
+
+
+def _create_transaction_changes(client: ImmudbClient):
+    """Change log the analytics snapshot refreshes from (see ledger.py)."""
+    client.sqlExec(ledger.CREATE_CHANGES_TABLE)
+    client.sqlExec(f"CREATE INDEX IF NOT EXISTS ON {ledger.CHANGES_TABLE}(txn_id)")
+
+
+def _index_transactions_proof_reference(client: ImmudbClient):
+    """Attachment reference counts look transactions up by proof_reference (see attachments.py)."""
+    client.sqlExec("CREATE INDEX IF NOT EXISTS ON transactions(proof_reference)")
+
+
+def _create_attachments(client: ImmudbClient):
+    """Attachment metadata, backfilled from the files already uploaded (see attachments.py)."""
+    attachments.backfill(client)
 
 
 def seed_users(client: ImmudbClient):
@@ -159,149 +262,153 @@ def seed_users(client: ImmudbClient):
                 ("depthead@gmail.com", get_password_hash(INITIAL_DEPT_HEAD_PASS), "dept_head", "Department", "", "Head", "Other", "depthead@gmail.com"),
                 ("bookkeeper@gmail.com", get_password_hash(INITIAL_BOOKKEEPER_PASS), "bookkeeper", "Bookkeeper", "", "Account", "Other", "bookkeeper@gmail.com"),
             ]
-            def _e(s):
-                return (s or "").replace("'", "''")
+            insert_user = q.insert("users", ("username", "hashed_password", "role", "active"))
+            role_columns = ("username", "first_name", "middle_name", "last_name", "gender", "contact_information")
             for username, hashed_pw, role, fn, mn, ln, gender, contact in role_seed:
                 client.sqlExec(
-                    f"INSERT INTO users (username, hashed_password, role, active) "
-                    f"VALUES ('{_e(username)}', '{_e(hashed_pw)}', '{role}', true)"
+                    insert_user,
+                    {"username": username, "hashed_password": hashed_pw, "role": role, "active": True},
                 )
                 client.sqlExec(
-                    f"INSERT INTO {role} (username, first_name, middle_name, last_name, gender, contact_information) "
-                    f"VALUES ('{_e(username)}', '{_e(fn)}', '{_e(mn)}', '{_e(ln)}', '{_e(gender)}', '{_e(contact)}')"
+                    q.insert(role, role_columns),
+                    dict(zip(role_columns, (username, fn, mn, ln, gender, contact))),
                 )
             # One student
-            student_pw = get_password_hash(INITIAL_STUDENT_PASS).replace("'", "''")
             client.sqlExec(
-                f"INSERT INTO users (username, hashed_password, role, active) "
-                f"VALUES ('student@gmail.com', '{student_pw}', 'student', true)"
+                insert_user,
+                {
+                    "username": "student@gmail.com",
+                    "hashed_password": get_password_hash(INITIAL_STUDENT_PASS),
+                    "role": "student",
+                    "active": True,
+                },
             )
-            client.sqlExec("""
-                INSERT INTO students (username, first_name, middle_name, last_name, gender, strand, section, payment_plan)
-                VALUES ('student@gmail.com', 'Student', '', 'Account', 'Other', 'Other', '', 'plan_a')
-            """)
+            student = {
+                "username": "student@gmail.com",
+                "first_name": "Student",
+                "middle_name": "",
+                "last_name": "Account",
+                "gender": "Other",
+                "strand": "Other",
+                "section": "",
+                "payment_plan": "plan_a",
+            }
+            client.sqlExec(q.insert("students", tuple(student)), student)
             print("✅ Default users seeded successfully.")
     except Exception as e:
         print(f"⚠️ Seeding failed: {e}")
+        raise  # Leave the migration pending so the next start retries it
 
 
-def init_db():
-    """Initialize tables and seed data on server startup."""
+# --- MIGRATIONS ---
+# Append-only: (version, name, function). Each runs once per database; the applied versions
+# live in schema_migrations so restarts and extra workers skip straight to serving.
+
+
+MIGRATIONS = [
+    (1, "drop_legacy_tables", _drop_legacy_tables),
+    (2, "create_tables", _create_tables),
+    (3, "add_transactions_staff_id", _add_transactions_staff_id),
+    (4, "create_indexes", _create_indexes),
+    (5, "seed_users", seed_users),
+    (6, "create_txn_rollup", _create_txn_rollup),
+    (7, "create_transaction_changes", _create_transaction_changes),
+    (8, "index_transactions_proof_reference", _index_transactions_proof_reference),
+    (9, "create_attachments", _create_attachments),
+]
+
+# A lock not refreshed for this long is treated as left behind by a crashed worker; the holder
+# refreshes it before every migration step
+MIGRATION_LOCK_STALE_SECONDS = 120
+# Give up (and start anyway) if migrations still aren't done after this long
+MIGRATION_WAIT_SECONDS = 300
+
+
+def _applied_versions(client: ImmudbClient) -> set:
     try:
-        client = get_db_client()
+        return {row[0] for row in client.sqlQuery("SELECT version FROM schema_migrations")}
+    except Exception:
+        return set()
 
-        client.sqlExec("""
-            CREATE TABLE IF NOT EXISTS transactions (
-                id INTEGER AUTO_INCREMENT,
-                created_at TIMESTAMP,
-                recorded_by VARCHAR,
-                txn_type VARCHAR,
-                strand VARCHAR,
-                category VARCHAR,
-                description VARCHAR,
-                amount INTEGER,
-                status VARCHAR,
-                student_id VARCHAR,
-                staff_id VARCHAR,
-                approved_by VARCHAR,
-                approval_date TIMESTAMP,
-                proof_reference VARCHAR,
-                PRIMARY KEY id
-            )
-        """)
 
-        _ensure_new_user_tables(client)
+def _try_lock(client: ImmudbClient, owner: str) -> bool:
+    """Take the migration lock: inserting id=1 fails if another worker already holds it."""
+    try:
+        client.sqlExec(q.insert("schema_lock", ("id", "owner"), now=("acquired_at",)), {"id": 1, "owner": owner})
+        return True
+    except Exception:
+        pass
+    # Break the lock if its holder died mid-migration
+    try:
+        res = client.sqlQuery(q.select("schema_lock", ("acquired_at",), where=("id",)), {"id": 1})
+        acquired_at = res[0][0] if res else None
+        if acquired_at is not None:
+            if acquired_at.tzinfo is None:
+                acquired_at = acquired_at.replace(tzinfo=timezone.utc)
+            if (datetime.now(timezone.utc) - acquired_at).total_seconds() > MIGRATION_LOCK_STALE_SECONDS:
+                print("  ⚠️ Breaking stale migration lock")
+                client.sqlExec(q.delete("schema_lock"), {"id": 1})
+    except Exception:
+        pass
+    return False
 
-        try:
-            client.sqlQuery("SELECT id FROM bills LIMIT 1")
-        except Exception:
-            client.sqlExec("""
-                CREATE TABLE bills (
-                    id INTEGER AUTO_INCREMENT,
-                    created_at TIMESTAMP,
-                    bill_type VARCHAR,
-                    description VARCHAR,
-                    total_amount INTEGER,
-                    created_by VARCHAR,
-                    PRIMARY KEY id
-                )
-            """)
 
-        try:
-            client.sqlQuery("SELECT id FROM bill_assignments LIMIT 1")
-        except Exception:
-            client.sqlExec("""
-                CREATE TABLE bill_assignments (
-                    id INTEGER AUTO_INCREMENT,
-                    bill_id INTEGER,
-                    student_id VARCHAR,
-                    amount INTEGER,
-                    paid_amount INTEGER,
-                    status VARCHAR,
-                    PRIMARY KEY id
-                )
-            """)
+def _heartbeat(client: ImmudbClient, owner: str):
+    """Refresh the lock's acquired_at so waiting workers don't break it while migrations are still running."""
+    res = client.sqlExec(
+        q.update("schema_lock", (), where=("id", "owner"), now=("acquired_at",)), {"id": 1, "owner": owner}
+    )
+    if not res.txs or res.txs[0].updatedRows != 1:
+        raise RuntimeError("Lost the migration lock to another worker")
 
-        try:
-            client.sqlQuery("SELECT id FROM financial_allocations LIMIT 1")
-        except Exception:
-            client.sqlExec("""
-                CREATE TABLE financial_allocations (
-                    id INTEGER AUTO_INCREMENT,
-                    name VARCHAR,
-                    amount INTEGER,
-                    PRIMARY KEY id
-                )
-            """)
 
-        try:
-            client.sqlQuery("SELECT id FROM staff_payroll LIMIT 1")
-        except Exception:
-            client.sqlExec("""
-                CREATE TABLE staff_payroll (
-                    id INTEGER AUTO_INCREMENT,
-                    staff_id VARCHAR,
-                    salary_amount INTEGER,
-                    updated_at TIMESTAMP,
-                    updated_by VARCHAR,
-                    PRIMARY KEY id
-                )
-            """)
-            client.sqlExec("CREATE INDEX ON staff_payroll(staff_id)")
-            print("  ✅ Created staff_payroll table")
-        try:
-            client.sqlQuery("SELECT id FROM staff_deductions LIMIT 1")
-        except Exception:
-            client.sqlExec("""
-                CREATE TABLE staff_deductions (
-                    id INTEGER AUTO_INCREMENT,
-                    staff_id VARCHAR,
-                    deduction_type VARCHAR,
-                    amount INTEGER,
-                    PRIMARY KEY id
-                )
-            """)
-            client.sqlExec("CREATE INDEX ON staff_deductions(staff_id)")
-            print("  ✅ Created staff_deductions table")
+def run_migrations(client: ImmudbClient):
+    """Apply pending migrations once, with one worker migrating while the others wait."""
+    latest = {version for version, _, _ in MIGRATIONS}
+    if latest <= _applied_versions(client):
+        return  # Fast path: up to date, one query
 
+    for stmt in (
+        "CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER, name VARCHAR, applied_at TIMESTAMP, PRIMARY KEY version)",
+        "CREATE TABLE IF NOT EXISTS schema_lock (id INTEGER, owner VARCHAR, acquired_at TIMESTAMP, PRIMARY KEY id)",
+    ):
         try:
-            client.sqlExec("CREATE INDEX ON transactions(student_id)")
-            client.sqlExec("CREATE INDEX ON transactions(staff_id)")
-            client.sqlExec("CREATE INDEX ON transactions(status)")
-            client.sqlExec("CREATE INDEX ON bill_assignments(student_id)")
-        except Exception:
-            pass
-        # Migration: add staff_id if table existed without it
-        try:
-            client.sqlQuery("SELECT staff_id FROM transactions LIMIT 1")
+            client.sqlExec(stmt)
         except Exception:
-            try:
-                client.sqlExec("ALTER TABLE transactions ADD COLUMN staff_id VARCHAR")
-                print("  ✅ Added staff_id to transactions")
-            except Exception:
-                pass
+            pass  # Another worker created it at the same moment
 
-        seed_users(client)
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    deadline = time.monotonic() + MIGRATION_WAIT_SECONDS
+    while not _try_lock(client, owner):
+        if latest <= _applied_versions(client):
+            return  # Another worker finished migrating
+        if time.monotonic() > deadline:
+            raise RuntimeError("Timed out waiting for the migration lock")
+        time.sleep(0.5)
+
+    try:
+        applied = _applied_versions(client)
+        for version, name, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            _heartbeat(client, owner)
+            print(f"  ⏳ Migration {version}: {name}")
+            migrate(client)
+            client.sqlExec(
+                q.insert("schema_migrations", ("version", "name"), now=("applied_at",)),
+                {"version": version, "name": name},
+            )
+    finally:
+        client.sqlExec(q.delete("schema_lock", ("id", "owner")), {"id": 1, "owner": owner})
+
+
+def init_db():
+    """Bring the schema up to date on server startup (no-op when already migrated); raises if it can't."""
+    try:
+        client = get_db_client()
+        run_migrations(client)
         print("✅ Database initialized successfully.")
     except Exception as e:
-        print(f"⚠️ Startup warning (DB might be down or tables exist): {e}")
+        # Serving against a half-migrated schema fails in confusing ways; refuse to start instead
+        print(f"❌ Startup failed (DB might be down or migration failed): {e}")
+        raise
@@ -0,0 +1,89 @@
+"""Staff payroll deductions written as a diff against the stored rows: unchanged items are left alone, changed ones updated in place, and only new or removed items inserted or deleted, all in one immudb transaction. Rewriting every row on each save would grow the append-only history with every edit."""
+from . import queries as q
+
+TABLE = "staff_deductions"
+COLUMNS = ("staff_id", "deduction_type", "amount")
+
+_UPDATE = f"UPDATE {TABLE} SET deduction_type = @set_type{{i}}, amount = @set_amount{{i}} WHERE id = @set_id{{i}}"
+
+
+def item(deduction_type, amount) -> tuple:
+    """(type, cents) as stored: blank types become "Deduction", amounts are pesos."""
+    return ((deduction_type or "").strip() or "Deduction", int(round(float(amount or 0) * 100)))
+
+
+def load(client, staff_id: str | None = None) -> dict:
+    """{staff_id: [(id, type, cents), ...]} in id order, for one staff member or everyone."""
+    where, params = (("staff_id",), {"staff_id": staff_id}) if staff_id else ((), {})
+    rows = {}
+    for row_id, owner, deduction_type, amount in client.sqlQuery(
+        q.select(TABLE, ("id",) + COLUMNS, where=where, order_by="id"), params
+    ):
+        rows.setdefault(owner, []).append((row_id, deduction_type or "", amount or 0))
+    return rows
+
+
+def diff(existing: list, wanted: list) -> tuple[list, list, list]:
+    """
+    (updates [(id, type, cents)], inserts [(type, cents)], deletes [id]) turning `existing` rows into
+    `wanted` items. Rows are matched exactly first, then by type, and leftovers are reused for the
+    remaining items before anything is inserted or deleted.
+    """
+    rows = list(existing)
+    unmatched = []
+    for want in wanted:
+        row = next((r for r in rows if (r[1], r[2]) == want), None)
+        if row is None:
+            unmatched.append(want)
+        else:
+            rows.remove(row)
+
+    updates, untyped = [], []
+    for want in unmatched:
+        row = next((r for r in rows if r[1] == want[0]), None)
+        if row is None:
+            untyped.append(want)
+        else:
+            rows.remove(row)
+            updates.append((row[0], *want))
+
+    inserts = []
+    for want in untyped:
+        if rows:
+            updates.append((rows.pop(0)[0], *want))
+        else:
+            inserts.append(want)
+    return updates, inserts, [r[0] for r in rows]
+
+
+def write(client, changes: dict) -> int:
+    """
+    Apply {staff_id: (updates, inserts, deletes)} from diff() in a single transaction.
+    Returns the number of rows written (0 means nothing changed and nothing was sent).
+    """
+    statements, params = [], {}
+    updates = [update for ups, _, _ in changes.values() for update in ups]
+    for i, (row_id, deduction_type, amount) in enumerate(updates):
+        statements.append(_UPDATE.format(i=i))
+        params.update({f"set_id{i}": row_id, f"set_type{i}": deduction_type, f"set_amount{i}": amount})
+
+    deletes = [row_id for _, _, dels in changes.values() for row_id in dels]
+    if deletes:
+        cond, delete_params = q.in_list("id", deletes, prefix="delete_id")
+        statements.append(f"DELETE FROM {TABLE} WHERE {cond}")
+        params.update(delete_params)
+
+    inserts = [(staff_id, *want) for staff_id, (_, ins, _) in changes.items() for want in ins]
+    if inserts:
+        statements.append(q.insert_many(TABLE, COLUMNS, len(inserts)))
+        params.update(q.row_params(COLUMNS, inserts))
+
+    if statements:
+        client.sqlExec("BEGIN TRANSACTION; " + "; ".join(statements) + "; COMMIT;", params)
+    return len(updates) + len(deletes) + len(inserts)
+
+
+def replace(client, staff_id: str, items: list) -> int:
+    """Make `staff_id`'s deductions equal `items` [(type, cents)], writing only the difference."""
+    existing = load(client, staff_id).get(staff_id, [])
+    return write(client, {staff_id: diff(existing, items)})
@@ -0,0 +1,256 @@
+"""Feed of transaction status changes for Server-Sent Events, shared by every worker on the host. Write paths call publish(), which appends the event to a journal under SHARED_STATE_DIR/events (like the version tokens in shared.py); each worker with SSE subscribers runs one thread that tails the journal and pushes new events onto the subscribers' asyncio queues, so a change made through any worker reaches every stream. Event ids are journal positions, and reconnecting clients resume from Last-Event-ID by replaying the journal from there."""
+import asyncio
+import json
+import os
+import threading
+import uuid
+
+from . import shared
+from .core import SHARED_STATE_DIR
+
+JOURNAL_DIR = os.path.join(SHARED_STATE_DIR, "events")
+
+EPOCH_PATH = os.path.join(JOURNAL_DIR, "epoch")
+LOCK_PATH = os.path.join(JOURNAL_DIR, "journal.lock")
+# The journal is split into segments named after their starting position; a new one is started once
+# the newest reaches SEGMENT_BYTES and only the newest KEEP_SEGMENTS are kept for resuming clients
+SEGMENT_BYTES = 1 << 20
+KEEP_SEGMENTS = 4
+# How often the tail thread looks for events appended by other workers (local ones wake it at once)
+TAIL_POLL_SECONDS = 0.25
+KEEPALIVE_SECONDS = 15
+LOCK_WAIT_SECONDS = 2
+
+# Who sees what: management roles follow the disbursement workflow, recorders see every change,
+# students/staff only changes to their own transactions.
+ALL_EVENTS_ROLES = ("admin", "payables", "bookkeeper", "procurement")
+DISBURSEMENT_ROLES = ("vp_finance", "president", "dept_head")
+
+_lock = threading.Lock()
+_subscribers: set = set()  # (loop, queue)
+_wake = threading.Event()
+_tail_thread = None
+_tail_pos = 0  # Journal position up to which events have been pushed to subscribers
+_epoch = None  # Set up by _journal() on first use, so importing the app writes nothing
+
+
+def _journal() -> str:
+    """
+    Create the journal directory on first use and return the journal's random id, made along with it.
+    Event ids are "<epoch>-<position>", so an id from a journal that was since wiped is never mistaken
+    for a position in the current one.
+    """
+    global _epoch
+    if _epoch is not None:
+        return _epoch
+    os.makedirs(JOURNAL_DIR, exist_ok=True)
+    try:
+        with open(EPOCH_PATH, encoding="utf-8") as f:
+            _epoch = f.read().strip()
+            return _epoch
+    except FileNotFoundError:
+        pass
+    tmp_path = f"{EPOCH_PATH}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(uuid.uuid4().hex[:12])
+    try:
+        os.link(tmp_path, EPOCH_PATH)  # Fails if another worker created it first; theirs wins
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+    with open(EPOCH_PATH, encoding="utf-8") as f:
+        _epoch = f.read().strip()
+    return _epoch
+
+
+def _segments() -> list:
+    """Starting positions of the journal segments on disk, oldest first."""
+    return sorted(int(name[:-6]) for name in os.listdir(JOURNAL_DIR) if name.endswith(".jsonl") and name[:-6].isdigit())
+
+
+def _segment_path(start: int) -> str:
+    return os.path.join(JOURNAL_DIR, f"{start:016d}.jsonl")
+
+
+def _end() -> int:
+    """Journal position just past the last complete write."""
+    segments = _segments()
+    if not segments:
+        return 0
+    try:
+        return segments[-1] + os.path.getsize(_segment_path(segments[-1]))
+    except FileNotFoundError:
+        return _end()  # Rotated away underneath us
+
+
+def _append(line: bytes):
+    """Append one event line to the newest segment, starting a new segment (and dropping old ones) when it's full."""
+    with shared.locked(LOCK_PATH, LOCK_WAIT_SECONDS):
+        segments = _segments() or [0]
+        start = segments[-1]
+        path = _segment_path(start)
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            size = 0
+        if size >= SEGMENT_BYTES:
+            start, path = start + size, _segment_path(start + size)
+            segments.append(start)
+            for old in segments[:-KEEP_SEGMENTS]:
+                try:
+                    os.remove(_segment_path(old))
+                except OSError:
+                    pass  # Windows: a tail thread still has it open; dropped on a later rotation
+        fd = os.open(path, os.O_CREAT | os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+def publish(action: str, txn_id: int, **fields):
+    """Record a transaction change in the journal; every worker's tail thread pushes it to its subscribers."""
+    event = {"action": action, "txn_id": txn_id, **fields}
+    try:
+        _journal()
+        _append((json.dumps(event, default=str) + "\n").encode("utf-8"))
+    except (OSError, TimeoutError) as e:
+        # The change itself is committed; a missed event only leaves clients stale until their next refetch
+        print(f"⚠️ Event publish warning: {e}")
+        return
+    _wake.set()
+
+
+def _read(start: int, offset: int) -> tuple[list, int]:
+    """Complete events in segment `start` from `offset` on, and the offset just past the last one."""
+    with open(_segment_path(start), "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    found = []
+    for line in data.split(b"\n")[:-1]:  # The last piece is empty or a line still being written
+        offset += len(line) + 1
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        position = start + offset
+        found.append({"event_id": f"{_epoch}-{position}", "seq": position, **event})
+    return found, offset
+
+
+def _read_from(position: int) -> list | None:
+    """Every event after journal `position`, or None if that part of the journal is gone (or never existed)."""
+    segments = _segments()
+    if position > _end():
+        return None
+    earlier = [start for start in segments if start <= position]
+    if not earlier:
+        return [] if not segments and position == 0 else None
+    found = []
+    try:
+        first = earlier[-1]
+        for start in segments[segments.index(first):]:
+            events, _ = _read(start, position - start if start == first else 0)
+            found.extend(events)
+    except FileNotFoundError:
+        return None  # Rotated away while we were reading
+    return found
+
+
+def _tail():
+    """Push journal events written by any worker to this worker's subscribers, in order."""
+    global _tail_pos
+    while True:
+        _wake.wait(TAIL_POLL_SECONDS)
+        _wake.clear()
+        try:
+            segments = _segments()
+            current = max([start for start in segments if start <= _tail_pos], default=None)
+            if current is None:
+                if not segments:
+                    continue
+                current = segments[0]  # Our segment was dropped; continue with the oldest one left
+                with _lock:
+                    _tail_pos = current
+            events, offset = _read(current, _tail_pos - current)
+            later = [start for start in segments if start > current]
+            if later and not events:
+                # A newer segment exists, so nothing more is written to this one: move on
+                with _lock:
+                    _tail_pos = later[0]
+                _wake.set()
+                continue
+            with _lock:
+                _tail_pos = current + offset
+                subscribers = list(_subscribers)
+            for event in events:
+                for loop, queue in subscribers:
+                    try:
+                        loop.call_soon_threadsafe(queue.put_nowait, event)
+                    except RuntimeError:
+                        pass  # subscriber's loop already closed
+            if later:
+                _wake.set()
+        except FileNotFoundError:
+            continue  # Rotated underneath us; the next pass picks the right segment
+        except Exception as e:
+            print(f"⚠️ Event tail warning: {e}")
+
+
+def _start_tail():
+    global _tail_thread, _tail_pos
+    if _tail_thread is None:
+        _tail_pos = _end()  # Only events from now on; earlier ones are replayed per subscriber
+        _tail_thread = threading.Thread(target=_tail, name="events-tail", daemon=True)
+        _tail_thread.start()
+
+
+def _parse_id(event_id: str | None):
+    """(epoch, position) from an event id, or None if it isn't one."""
+    epoch, _, n = (event_id or "").rpartition("-")
+    return (epoch, int(n)) if epoch and n.isdigit() else None
+
+
+def subscribe(loop, last_event_id: str | None):
+    """
+    Register a subscriber and return (queue, missed_events, reset).
+    `reset` is True when the client's last id can't be resumed (its part of the journal was already
+    dropped, or the id isn't from this journal) and it should refetch instead of replaying.
+    """
+    queue = asyncio.Queue()
+    epoch = _journal()
+    with _lock:
+        _start_tail()
+        _subscribers.add((loop, queue))
+        if not last_event_id:
+            return queue, [], False
+        parsed = _parse_id(last_event_id)
+        if parsed is None or parsed[0] != epoch or parsed[1] > _tail_pos:
+            return queue, [], True
+        # Under _lock the tail thread can't push anything, so the replay ends exactly where the queue starts
+        missed = _read_from(parsed[1])
+        if missed is None:
+            return queue, [], True
+        return queue, [e for e in missed if e["seq"] <= _tail_pos], False
+
+
+def unsubscribe(loop, queue):
+    with _lock:
+        _subscribers.discard((loop, queue))
+
+
+def visible_to(role: str | None, username: str, event: dict) -> bool:
+    if role in ALL_EVENTS_ROLES:
+        return True
+    if role in DISBURSEMENT_ROLES:
+        return event.get("txn_type") == "Disbursement"
+    if role == "student":
+        return bool(username) and event.get("student_id") == username
+    if role == "staff":
+        return bool(username) and event.get("staff_id") == username
+    return False
+
+
+def format_sse(event: dict) -> str:
+    return f"id: {event['event_id']}\nevent: transaction\ndata: {json.dumps(event, default=str)}\n\n"
@@ -0,0 +1,165 @@
+"""Idempotency-Key support for POST endpoints that create records, so a client retrying after a timeout gets the original result instead of a second posting. Records are small JSON files under SHARED_STATE_DIR/idempotency, visible to every worker like the version tokens in shared.py: the first request with a key claims it by creating its file exclusively, runs, and stores its response there; retries replay the stored response, and a retry arriving while the original is still running waits for it. The store is bounded by age and entry count."""
+import hashlib
+import itertools
+import json
+import os
+import time
+import uuid
+from contextvars import ContextVar
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+
+from .core import IDEMPOTENCY_MAX_KEYS, IDEMPOTENCY_TTL_SECONDS, SHARED_STATE_DIR
+
+STORE_DIR = os.path.join(SHARED_STATE_DIR, "idempotency")
+os.makedirs(STORE_DIR, exist_ok=True)
+
+MAX_KEY_LENGTH = 255
+# A claim still without a response after this long was left by a crashed request and may be taken over
+STALE_CLAIM_SECONDS = 120
+# How long a retry waits for the original request to finish before answering 409
+WAIT_SECONDS = 15
+POLL_SECONDS = 0.05
+# Prune the store once every this many stored responses (per worker)
+PRUNE_EVERY = 50
+
+_stored = itertools.count(1)
+# What the running create() has committed so far (see committed()); None outside run()
+_committed: ContextVar = ContextVar("idempotency_committed", default=None)
+
+
+def committed(record_id=None):
+    """
+    Called by a create function right after its first write commits (again with the id once known).
+    If the request then fails, run() keeps the key and answers retries with the failure instead of
+    letting them create the record a second time.
+    """
+    ids = _committed.get()
+    if ids is not None:
+        ids.append(record_id)
+
+
+def _path(scope: str, actor: str, key: str) -> str:
+    name = hashlib.sha256(f"{scope}\0{actor}\0{key}".encode("utf-8")).hexdigest()
+    return os.path.join(STORE_DIR, f"{name}.json")
+
+
+def _fingerprint(payload) -> str:
+    return hashlib.sha256(json.dumps(jsonable_encoder(payload), sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _read(path: str):
+    """The stored record, or None while the key is only claimed (empty file)."""
+    with open(path, encoding="utf-8") as f:
+        data = f.read()
+    return json.loads(data) if data else None
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _store(path: str, record: dict):
+    # Write then rename, so readers never see a half-written record
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(record, f)
+    os.replace(tmp_path, path)
+
+
+def prune(now: float | None = None):
+    """Drop records older than the TTL, then the oldest ones beyond IDEMPOTENCY_MAX_KEYS."""
+    now = now or time.time()
+    entries = []
+    with os.scandir(STORE_DIR) as it:
+        for entry in it:
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if now - mtime > max(IDEMPOTENCY_TTL_SECONDS, STALE_CLAIM_SECONDS):
+                _remove(entry.path)
+            elif entry.name.endswith(".json"):
+                entries.append((mtime, entry.path))
+    entries.sort()
+    for _, path in entries[: max(0, len(entries) - IDEMPOTENCY_MAX_KEYS)]:
+        _remove(path)
+
+
+def run(scope: str, actor: str, key: str | None, payload, response: Response, create):
+    """
+    Return create()'s result once per (scope, actor, key). Without a key this is just create().
+    A retry with the same payload replays the stored result (marked Idempotent-Replayed: true);
+    the same key with a different payload is a 422. A request that fails before committing anything
+    doesn't consume the key; one that fails after (see committed()) stores a 500 naming what was created.
+    """
+    if not key:
+        return create()
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+
+    path = _path(scope, actor or "", key)
+    fingerprint = _fingerprint(payload)
+    deadline = time.monotonic() + WAIT_SECONDS
+    while True:
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break  # Claimed: this request does the work
+        except FileExistsError:
+            pass
+        try:
+            record = _read(path)
+            age = time.time() - os.path.getmtime(path)
+        except (FileNotFoundError, ValueError):
+            continue  # Released or replaced meanwhile; try again
+        if record is None:
+            if age > STALE_CLAIM_SECONDS:
+                _remove(path)
+                continue
+            if time.monotonic() > deadline:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed")
+            time.sleep(POLL_SECONDS)
+            continue
+        if age > IDEMPOTENCY_TTL_SECONDS:
+            _remove(path)
+            continue
+        if record["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        if "status_code" in record:
+            raise HTTPException(status_code=record["status_code"], detail=record["body"]["detail"], headers={"Idempotent-Replayed": "true"})
+        response.headers["Idempotent-Replayed"] = "true"
+        return record["body"]
+
+    token = _committed.set([])
+    try:
+        body = jsonable_encoder(create())
+    except BaseException as e:
+        written = _committed.get()
+        if not written:
+            _remove(path)  # Nothing was written: let the client retry with the same key
+            raise
+        # Something was committed before the failure; a retry must not post it again
+        ids = [record_id for record_id in written if record_id is not None]
+        created = f"{scope} record {ids[-1]}" if ids else f"a {scope} record"
+        detail = f"Request failed after {created} was created; check it before posting again ({getattr(e, 'detail', e)})"
+        try:
+            _store(path, {"fingerprint": fingerprint, "status_code": 500, "body": {"detail": detail}})
+        except OSError as store_error:
+            print(f"⚠️ Idempotency store warning: {store_error}")
+        if not isinstance(e, Exception):
+            raise
+        raise HTTPException(status_code=500, detail=detail)
+    finally:
+        _committed.reset(token)
+
+    try:
+        _store(path, {"fingerprint": fingerprint, "body": body})
+        if next(_stored) % PRUNE_EVERY == 0:
+            prune()
+    except OSError as e:
+        print(f"⚠️ Idempotency store warning: {e}")
+    return body
@@ -0,0 +1,236 @@
+"""Columnar in-memory snapshot of the transactions ledger for analytics: int64 ids and cents, datetime64 timestamps and int32 codes for the text columns, held as NumPy arrays per worker. It refreshes incrementally: new rows by id watermark, and edited rows from the transaction_changes log that every write path appends to."""
+import copy
+import threading
+
+from . import cache
+from . import queries as q
+
+CHANGES_TABLE = "transaction_changes"
+
+CREATE_CHANGES_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {CHANGES_TABLE} (
+        seq INTEGER AUTO_INCREMENT,
+        txn_id INTEGER,
+        action VARCHAR[32],
+        changed_at TIMESTAMP,
+        PRIMARY KEY seq
+    )
+"""
+
+# Ledger columns held in the snapshot; the text ones are stored as int32 codes
+SNAPSHOT_COLUMNS = ("id", "created_at", "txn_type", "strand", "category", "status", "amount")
+CODED_COLUMNS = ("txn_type", "strand", "category", "status")
+
+# Ids per IN (...) lookup when re-reading edited rows
+REFRESH_CHUNK = 500
+
+
+
+def record(client, txn_ids, action: str):
+    """
+    Append to the change log. Call after the ledger write, next to events.publish(); a failure is
+    logged rather than failing the request (the snapshot still picks up new rows by id).
+    """
+    txn_ids = list(txn_ids)
+    if not txn_ids:
+        return
+    columns = ("txn_id", "action")
+    try:
+        client.sqlExec(
+            q.insert_many(CHANGES_TABLE, columns, len(txn_ids), now=("changed_at",)),
+            q.row_params(columns, [(txn_id, action) for txn_id in txn_ids]),
+        )
+    except Exception as e:
+        print(f"⚠️ Change log write failed: {e}")
+
+
+class Codes:
+    """Dictionary encoding for one text column: value <-> int32 code."""
+
+    def __init__(self):
+        self.values = []
+        self.index = {}
+
+    def encode(self, value) -> int:
+        value = value or ""
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def code(self, value) -> int:
+        """Code for `value`, or -1 if it never occurs (so comparisons match nothing)."""
+        return self.index.get(value or "", -1)
+
+
+def _datetime64(value):
+    if value is None:
+        return "NaT"
+    if isinstance(value, str):
+        return value.replace(" ", "T")[:19]
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return value.replace(microsecond=0)
+
+
+class Snapshot:
+    def __init__(self):
+        import numpy as np
+
+        self.version = None
+        self.change_seq = 0
+        self.codes = {column: Codes() for column in CODED_COLUMNS}
+        self.id = np.empty(0, dtype=np.int64)
+        self.created_at = np.empty(0, dtype="datetime64[s]")
+        self.amount = np.empty(0, dtype=np.int64)
+        for column in CODED_COLUMNS:
+            setattr(self, column, np.empty(0, dtype=np.int32))
+
+    def __len__(self):
+        return len(self.id)
+
+    def _columns(self, rows) -> dict:
+        """Row tuples (in SNAPSHOT_COLUMNS order) -> typed arrays."""
+        import numpy as np
+
+        by_name = dict(zip(SNAPSHOT_COLUMNS, zip(*rows))) if rows else {c: () for c in SNAPSHOT_COLUMNS}
+        columns = {
+            "id": np.array(by_name["id"], dtype=np.int64),
+            "created_at": np.array([_datetime64(v) for v in by_name["created_at"]], dtype="datetime64[s]"),
+            "amount": np.array([v or 0 for v in by_name["amount"]], dtype=np.int64),
+        }
+        for column in CODED_COLUMNS:
+            encode = self.codes[column].encode
+            columns[column] = np.array([encode(v) for v in by_name[column]], dtype=np.int32)
+        return columns
+
+    def append(self, rows):
+        """Add rows with ids above the current watermark (ids are AUTO_INCREMENT, so order is kept)."""
+        import numpy as np
+
+        new = self._columns(sorted(rows))
+        for name, values in new.items():
+            setattr(self, name, np.concatenate([getattr(self, name), values]))
+
+    def replace(self, rows):
+        """Overwrite rows already in the snapshot with their current values."""
+        import numpy as np
+
+        new = self._columns(rows)
+        positions = np.searchsorted(self.id, new["id"])
+        found = (positions < len(self.id)) & (self.id[np.minimum(positions, len(self.id) - 1)] == new["id"])
+        for name, values in new.items():
+            column = getattr(self, name).copy()  # copy-on-write: readers may hold the old arrays
+            column[positions[found]] = values[found]
+            setattr(self, name, column)
+
+    def where(self, column: str, value):
+        """Boolean mask of rows whose coded `column` equals `value`."""
+        return getattr(self, column) == self.codes[column].code(value)
+
+    def sum_by(self, column: str, mask) -> dict:
+        """Exact total cents per value of coded `column` over the rows in `mask` (values with no rows left out)."""
+        import numpy as np
+
+        codes = getattr(self, column)[mask]
+        totals = np.zeros(len(self.codes[column].values), dtype=np.int64)
+        np.add.at(totals, codes, self.amount[mask])
+        present = np.bincount(codes, minlength=len(totals)) > 0
+        return {self.codes[column].values[i]: int(totals[i]) for i in np.flatnonzero(present)}
+
+    def sum_by_month(self, mask) -> dict:
+        """Exact total cents per YYYY-MM of created_at over the rows in `mask`."""
+        import numpy as np
+
+        mask = mask & ~np.isnat(self.created_at)
+        months, inverse = np.unique(self.created_at[mask].astype("datetime64[M]"), return_inverse=True)
+        totals = np.zeros(len(months), dtype=np.int64)
+        np.add.at(totals, inverse, self.amount[mask])
+        return {str(month): int(total) for month, total in zip(months, totals)}
+
+    @property
+    def max_id(self) -> int:
+        return int(self.id[-1]) if len(self.id) else 0
+
+
+def latest_change_seq(client) -> int:
+    res = client.sqlQuery(q.select(CHANGES_TABLE, ("seq",), order_by="seq DESC", limit=1))
+    return res[0][0] if res else 0
+
+
+def changed_since(client, seq: int) -> tuple[int, list]:
+    """(latest seq, sorted distinct txn ids) for change log entries after `seq`."""
+    changes = client.sqlQuery(
+        q.select(CHANGES_TABLE, ("seq", "txn_id"), where=("seq > @seq",), order_by="seq"), {"seq": seq}
+    )
+    if not changes:
+        return seq, []
+    return changes[-1][0], sorted({txn_id for _, txn_id in changes})
+
+
+class Follower:
+    """
+    One per-worker in-memory view of the transactions table, kept current incrementally (the analytics
+    snapshot here, the search index in search.py). The first use reads everything; after that, whenever
+    the transactions cache version has moved, rows named in the change log since the view's change_seq
+    are re-read and passed to view.replace(rows), and rows past its id watermark to view.append(rows).
+    Views have version, change_seq and max_id attributes. With `copy`, each refresh works on copy(view)
+    and swaps it in, so readers never lock; without it the view is refreshed in place and readers must
+    hold `lock` while using it.
+    """
+
+    def __init__(self, columns: tuple, new, copy=None):
+        self.columns = columns
+        self.new = new
+        self.copy = copy
+        self.lock = threading.RLock()
+        self.view = None
+
+    def _refresh(self, view, client):
+        """Replay logged edits, then append rows past the id watermark."""
+        view.change_seq, changed = changed_since(client, view.change_seq)
+        edited = [txn_id for txn_id in changed if txn_id <= view.max_id]
+        for start in range(0, len(edited), REFRESH_CHUNK):
+            id_cond, id_params = q.in_list("id", edited[start : start + REFRESH_CHUNK])
+            view.replace(client.sqlQuery(q.select("transactions", self.columns, where=(id_cond,)), id_params))
+
+        new_rows = client.sqlQuery(
+            q.select("transactions", self.columns, where=("id > @max_id",), order_by="id"), {"max_id": view.max_id}
+        )
+        if new_rows:
+            view.append(new_rows)
+
+    def current(self, connect):
+        """
+        The view, refreshed first if the transactions cache version moved since it was built.
+        `connect` returns a db client and is only called when a refresh is needed.
+        """
+        with self.lock:
+            version = cache.version("transactions")
+            if self.view is not None and self.view.version == version:
+                return self.view
+            client = connect()
+            if self.view is None:
+                view = self.new()
+                # Read the log position first: edits landing during the full load are replayed next time
+                view.change_seq = latest_change_seq(client)
+            else:
+                view = self.copy(self.view) if self.copy else self.view
+            self._refresh(view, client)
+            # Version read before querying, so a write racing with this refresh triggers another one
+            view.version = version
+            self.view = view
+            return view
+
+
+# Refreshed on a copy so requests still reading the current snapshot see consistent columns
+_follower = Follower(SNAPSHOT_COLUMNS, Snapshot, copy=copy.copy)
+
+
+def snapshot(connect) -> Snapshot:
+    """
+    Current snapshot, refreshed if the transactions cache version moved since it was built.
+    `connect` returns a db client and is only called when a refresh is needed.
+    """
+    return _follower.current(connect)
@@ -0,0 +1,62 @@
+"""Parameterized SQL statements for immudb. Values are always passed as named parameters (@name); statement text is built once per shape and cached so hot paths send identical query strings."""
+from functools import lru_cache
+
+
+def _condition(cond: str) -> str:
+    """A bare column name means `column = @column`; anything else is used verbatim."""
+    return f"{cond} = @{cond}" if cond.isidentifier() else cond
+
+
+def _where(where: tuple) -> str:
+    return " WHERE " + " AND ".join(_condition(c) for c in where) if where else ""
+
+
+@lru_cache(maxsize=512)
+def select(table: str, columns: tuple, where: tuple = (), order_by: str = "", limit: int | str | None = None) -> str:
+    """SELECT columns FROM table [WHERE ...] [ORDER BY ...] [LIMIT n | @limit]."""
+    stmt = f"SELECT {', '.join(columns)} FROM {table}{_where(where)}"
+    if order_by:
+        stmt += f" ORDER BY {order_by}"
+    if limit is not None:
+        stmt += f" LIMIT {limit}"
+    return stmt
+
+
+@lru_cache(maxsize=512)
+def insert(table: str, columns: tuple, now: tuple = ()) -> str:
+    """INSERT one row; each column binds @column, columns in `now` are set to NOW()."""
+    names = list(now) + list(columns)
+    values = ["NOW()"] * len(now) + [f"@{c}" for c in columns]
+    return f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join(values)})"
+
+
+@lru_cache(maxsize=512)
+def insert_many(table: str, columns: tuple, count: int, now: tuple = ()) -> str:
+    """INSERT `count` rows in one statement; row i binds @column{i} (see row_params), `now` columns get NOW()."""
+    rows = ["(" + ", ".join(["NOW()"] * len(now) + [f"@{c}{i}" for c in columns]) + ")" for i in range(count)]
+    return f"INSERT INTO {table} ({', '.join(now + columns)}) VALUES {', '.join(rows)}"
+
+
+def row_params(columns: tuple, rows) -> dict:
+    """Params for insert_many: each row is a sequence of values in `columns` order."""
+    return {f"{c}{i}": v for i, row in enumerate(rows) for c, v in zip(columns, row)}
+
+
+@lru_cache(maxsize=512)
+def update(table: str, columns: tuple, where: tuple = ("id",), now: tuple = ()) -> str:
+    """UPDATE table SET column = @column ...; where-columns must not also be SET columns."""
+    sets = [f"{c} = @{c}" for c in columns] + [f"{c} = NOW()" for c in now]
+    return f"UPDATE {table} SET {', '.join(sets)}{_where(where)}"
+
+
+@lru_cache(maxsize=512)
+def delete(table: str, where: tuple = ("id",)) -> str:
+    """DELETE FROM table WHERE ..."""
+    return f"DELETE FROM {table}{_where(where)}"
+
+
+def in_list(column: str, values, prefix: str = "") -> tuple[str, dict]:
+    """`column IN (@p0, @p1, ...)` plus its params, for bulk lookups by key."""
+    name = prefix or column
+    params = {f"{name}{i}": v for i, v in enumerate(values)}
+    return f"{column} IN ({', '.join('@' + k for k in params)})", params
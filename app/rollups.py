@@ -0,0 +1,193 @@
+"""Per-day ledger rollup (txn_rollup): total cents and row count for each day, txn_type, strand, category and status. Every write path that adds a transaction or changes its amount/type/category/status applies the matching deltas, so trend charts read a few rows per day instead of rescanning the ledger."""
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from . import queries as q
+from . import shared
+from .core import SHARED_STATE_DIR
+
+TABLE = "txn_rollup"
+KEY_COLUMNS = ("day", "txn_type", "strand", "category", "status")
+# Transaction columns a bucket is derived from (pass rows as dicts with these keys)
+ROW_COLUMNS = ("created_at", "txn_type", "strand", "category", "status", "amount")
+
+CREATE_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE} (
+        day VARCHAR[10],
+        txn_type VARCHAR[32],
+        strand VARCHAR[64],
+        category VARCHAR[128],
+        status VARCHAR[32],
+        total INTEGER,
+        txn_count INTEGER,
+        PRIMARY KEY (day, txn_type, strand, category, status)
+    )
+"""
+
+# Increment in place: the server adds to the stored value, so concurrent writers never lose updates
+_INCREMENT = (
+    f"UPDATE {TABLE} SET total = total + @delta, txn_count = txn_count + @count "
+    "WHERE day = @day AND txn_type = @txn_type AND strand = @strand AND category = @category AND status = @status"
+)
+
+# Rows per multi-row INSERT when rebuilding
+REBUILD_CHUNK = 100
+# Tries per bucket before giving up on it; concurrent writers to the same bucket conflict now and then
+APPLY_ATTEMPTS = 5
+RETRY_BACKOFF_SECONDS = 0.02
+
+# Days whose buckets missed an update: one empty marker file per day, shared by all workers,
+# recomputed from the ledger by repair() before the rollup is read
+DIRTY_DIR = os.path.join(SHARED_STATE_DIR, "rollup_dirty")
+os.makedirs(DIRTY_DIR, exist_ok=True)
+# Held shared by write paths from their ledger write through apply() (see writing()) and exclusively
+# by repair(), so the transactions a day is recomputed from have all had their deltas applied
+LOCK_PATH = os.path.join(SHARED_STATE_DIR, "rollup.lock")
+WRITE_LOCK_WAIT_SECONDS = 30
+# A repair that can't get in this soon (steady writes) is left for the next read
+REPAIR_LOCK_WAIT_SECONDS = 5
+
+
+def bucket(row: dict) -> tuple:
+    """Rollup key for a transaction. Days are the UTC date of created_at, like monthly_collections."""
+    return (
+        str(row["created_at"])[:10],
+        row["txn_type"] or "",
+        row["strand"] or "",
+        row["category"] or "",
+        row["status"] or "",
+    )
+
+
+def change(deltas: dict, row: dict, sign: int = 1):
+    """Accumulate one transaction entering (sign=1) or leaving (sign=-1) its bucket into `deltas`."""
+    key = bucket(row)
+    total, count = deltas.get(key, (0, 0))
+    deltas[key] = (total + sign * int(row["amount"] or 0), count + sign)
+
+
+def move(deltas: dict, row: dict, new_status: str):
+    """Accumulate a status change (the transaction leaves its current-status bucket for the new one)."""
+    change(deltas, row, sign=-1)
+    change(deltas, {**row, "status": new_status})
+
+
+def _updated_rows(result) -> int:
+    return sum(tx.updatedRows for tx in getattr(result, "txs", []))
+
+
+def _apply_bucket(client, key: tuple, amount: int, count: int):
+    params = {**dict(zip(KEY_COLUMNS, key)), "delta": amount, "count": count}
+    for attempt in range(APPLY_ATTEMPTS):
+        try:
+            if _updated_rows(client.sqlExec(_INCREMENT, params)):
+                return
+            client.sqlExec(
+                q.insert(TABLE, KEY_COLUMNS + ("total", "txn_count")),
+                {**dict(zip(KEY_COLUMNS, key)), "total": amount, "txn_count": count},
+            )
+            return
+        except Exception as e:
+            # A write conflict, or another worker created the bucket first: increment it next time round
+            error = e
+            time.sleep(RETRY_BACKOFF_SECONDS * (attempt + 1))
+    raise RuntimeError(f"bucket {key} could not be updated: {error}")
+
+
+def mark_dirty(day: str):
+    """Have the next repair() recompute `day` from the ledger."""
+    try:
+        with open(os.path.join(DIRTY_DIR, day), "w"):
+            pass
+    except OSError as e:
+        print(f"⚠️ Could not mark rollup day {day} dirty: {e}")
+
+
+def writing():
+    """
+    Hold around a ledger write and the apply() of its deltas. Concurrent writers share it; repair()
+    waits for them, so a transaction committed before its scan is never applied again after it.
+    """
+    return shared.locked(LOCK_PATH, WRITE_LOCK_WAIT_SECONDS, exclusive=False)
+
+
+def apply(client, deltas: dict):
+    """
+    Add {bucket: (amount_cents, count)} to the rollup. Called after the ledger write has committed,
+    inside the same writing() block, so a bucket that still fails after retrying doesn't fail the request: its day is marked dirty
+    and recomputed by repair() before the rollup is next read.
+    """
+    for key, (amount, count) in deltas.items():
+        if not amount and not count:
+            continue
+        try:
+            _apply_bucket(client, key, amount, count)
+        except Exception as e:
+            print(f"⚠️ Rollup update failed: {e}")
+            mark_dirty(key[0])
+
+
+def _recompute_day(client, day: str):
+    """Replace the buckets of `day` with totals read from that day's transactions."""
+    start = datetime.fromisoformat(day).replace(tzinfo=timezone.utc)
+    totals = defaultdict(lambda: [0, 0])
+    for row in client.sqlQuery(
+        q.select("transactions", ROW_COLUMNS, where=("created_at >= @start", "created_at < @end")),
+        {"start": start, "end": start + timedelta(days=1)},
+    ):
+        row = dict(zip(ROW_COLUMNS, row))
+        key = bucket(row)
+        if key[0] == day:
+            entry = totals[key]
+            entry[0] += int(row["amount"] or 0)
+            entry[1] += 1
+    columns = KEY_COLUMNS + ("total", "txn_count")
+    rows = [(*key, total, count) for key, (total, count) in totals.items()]
+    # Replace the day's buckets in one transaction, so readers never see it half-rebuilt
+    stmt = f"BEGIN TRANSACTION; {q.delete(TABLE, where=('day',))}; "
+    if rows:
+        stmt += f"{q.insert_many(TABLE, columns, len(rows))}; "
+    client.sqlExec(stmt + "COMMIT;", {"day": day, **q.row_params(columns, rows)})
+
+
+def repair(client):
+    """Recompute the buckets of days marked dirty by apply(). Cheap when there are none."""
+    if not os.listdir(DIRTY_DIR):
+        return
+    try:
+        with shared.locked(LOCK_PATH, REPAIR_LOCK_WAIT_SECONDS):
+            # Listed under the lock: a concurrent repair that got here first has already unmarked its days
+            days = sorted(os.listdir(DIRTY_DIR))
+            for day in days:
+                _recompute_day(client, day)
+                os.remove(os.path.join(DIRTY_DIR, day))
+    except TimeoutError:
+        print(f"⚠️ Rollup repair postponed: {TABLE} is busy")
+        return
+    except Exception as e:
+        print(f"⚠️ Rollup repair failed: {e}")  # Days not yet repaired stay marked
+        return
+    if days:
+        print(f"  ✅ Repaired {TABLE} for {len(days)} day(s)")
+
+
+def rebuild(client):
+    """(Re)create the rollup from a full scan of transactions."""
+    client.sqlExec(CREATE_TABLE)
+    client.sqlExec(q.delete(TABLE, where=()))
+
+    totals = defaultdict(lambda: [0, 0])
+    for row in client.sqlQuery(q.select("transactions", ROW_COLUMNS)):
+        row = dict(zip(ROW_COLUMNS, row))
+        entry = totals[bucket(row)]
+        entry[0] += int(row["amount"] or 0)
+        entry[1] += 1
+
+    rows = [(*key, total, count) for key, (total, count) in totals.items()]
+    columns = KEY_COLUMNS + ("total", "txn_count")
+    for start in range(0, len(rows), REBUILD_CHUNK):
+        chunk = rows[start : start + REBUILD_CHUNK]
+        client.sqlExec(q.insert_many(TABLE, columns, len(chunk)), q.row_params(columns, chunk))
+    print(f"  ✅ Rebuilt {TABLE} ({len(rows)} buckets)")
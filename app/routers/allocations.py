@@ -1,7 +1,9 @@
 from typing import List
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 
+from .. import cache, ledger
+from .. import queries as q
 from ..database import get_db_client
 from ..routers.transactions import ensure_admin
 
@@ -14,42 +16,70 @@ class AllocationItem(BaseModel):
     amount: float
 
 
+class AllocationLine(AllocationItem):
+    percentage: float = 0.0  # Share of the planned total
+    actual: float = 0.0  # Tuition collected so far, split by the same share
+
+
 class AllocationResponse(BaseModel):
-    items: List[AllocationItem]
+    items: List[AllocationLine]
     total_tuition: float
+    collected_tuition: float = 0.0
 
 
-@router.get("/allocations", response_model=AllocationResponse)
-def get_allocations():
-    """Get all financial allocation items."""
+def _read_allocations() -> tuple:
+    """(id, name, cents) rows; empty if the table doesn't exist yet."""
     client = get_db_client()
     try:
-        # Try to get allocations from database
-        try:
-            result = client.sqlQuery(
-                "SELECT id, name, amount FROM financial_allocations ORDER BY id ASC"
-            )
-            items = []
-            total = 0.0
-            for row in result:
-                amount = row[2] / 100.0  # Convert from cents
-                items.append({
-                    "id": row[0],
-                    "name": row[1],
-                    "amount": amount
-                })
-                total += amount
-            
-            return {
-                "items": items,
-                "total_tuition": total
-            }
-        except Exception:
-            # Table doesn't exist or no data, return empty
-            return {
-                "items": [],
-                "total_tuition": 0.0
-            }
+        result = client.sqlQuery(
+            q.select("financial_allocations", ("id", "name", "amount"), order_by="id ASC")
+        )
+    except Exception:
+        # Table doesn't exist or no data, return empty
+        return ()
+    return tuple((row[0], row[1], row[2]) for row in result)
+
+
+def _collected_tuition_cents() -> int:
+    """Tuition Fee collections, counted like /stats (pending ones don't count), from the ledger snapshot."""
+    snap = ledger.snapshot(get_db_client)
+    tuition = snap.where("txn_type", "Collection") & snap.where("category", "Tuition Fee") & ~snap.where("status", "Pending")
+    return int(snap.amount[tuition].sum())
+
+
+def _load_allocations():
+    # The plan only changes through the endpoints below; a new transaction just refreshes the snapshot
+    rows = cache.cached_value("allocations", ("allocations",), _read_allocations)
+    total_cents = sum(cents for _, _, cents in rows)
+    collected_cents = _collected_tuition_cents()
+    items = []
+    for item_id, name, cents in rows:
+        share = cents / total_cents if total_cents else 0.0
+        items.append({
+            "id": item_id,
+            "name": name,
+            "amount": cents / 100.0,  # Convert from cents
+            "percentage": round(share * 100, 2),
+            "actual": round(collected_cents * share) / 100.0,
+        })
+
+    return {
+        "items": items,
+        "total_tuition": total_cents / 100.0,
+        "collected_tuition": collected_cents / 100.0,
+    }
+
+
+@router.get("/allocations", response_model=AllocationResponse)
+def get_allocations(request: Request):
+    """
+    All financial allocation items with their share of the plan and of the tuition actually
+    collected so far. Cached with an ETag until an allocation or a transaction changes.
+    """
+    try:
+        return cache.cached_response(request, ("allocations", "transactions"), AllocationResponse, _load_allocations)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Get allocations error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -70,14 +100,16 @@ def create_allocation(req: AllocationCreateRequest):
         
         amount_cents = int(item.amount * 100)
         
-        query = f"""
-            INSERT INTO financial_allocations (name, amount)
-            VALUES ('{item.name}', {amount_cents})
-        """
-        client.sqlExec(query)
+        client.sqlExec(
+            q.insert("financial_allocations", ("name", "amount")),
+            {"name": item.name, "amount": amount_cents},
+        )
         
         # Get the created item
-        res = client.sqlQuery("SELECT id, name, amount FROM financial_allocations ORDER BY id DESC LIMIT 1")
+        res = client.sqlQuery(
+            q.select("financial_allocations", ("id", "name", "amount"), order_by="id DESC", limit=1)
+        )
+        cache.bump("allocations")
         if not res:
             raise HTTPException(status_code=500, detail="Allocation created but could not be retrieved")
         
@@ -106,12 +138,11 @@ def update_allocation(item_id: int, req: AllocationUpdateRequest):
         
         amount_cents = int(item.amount * 100)
         
-        query = f"""
-            UPDATE financial_allocations
-            SET name = '{item.name}', amount = {amount_cents}
-            WHERE id = {item_id}
-        """
-        client.sqlExec(query)
+        client.sqlExec(
+            q.update("financial_allocations", ("name", "amount")),
+            {"name": item.name, "amount": amount_cents, "id": item_id},
+        )
+        cache.bump("allocations")
         
         return {
             "id": item_id,
@@ -134,7 +165,8 @@ def delete_allocation(item_id: int, username: str):
     try:
         ensure_admin(client, username)
         
-        client.sqlExec(f"DELETE FROM financial_allocations WHERE id = {item_id}")
+        client.sqlExec(q.delete("financial_allocations"), {"id": item_id})
+        cache.bump("allocations")
         
         return {"message": "Allocation deleted successfully"}
     except Exception as e:
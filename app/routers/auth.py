@@ -1,9 +1,14 @@
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
-from fastapi import APIRouter, File, HTTPException, UploadFile
+from fastapi import APIRouter, File, HTTPException, Request, UploadFile
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 
+from .. import cache, deductions, throttle
+from .. import queries as q
 from ..database import get_db_client, ROLE_TABLES
+from ..routers.transactions import ensure_role
 from ..schemas import (
     LoginRequest,
     LoginResponse,
@@ -12,13 +17,21 @@ from ..schemas import (
     UserResponse,
     UserUpdate,
 )
-from ..utils import get_password_hash, verify_password
+from ..utils import get_password_hash, get_password_hashes, needs_rehash, verify_password
 
 router = APIRouter(tags=["Authentication & Users"])
 
+# Threads doing login work off the response path: upgrading hashes made with other scrypt parameters
+LOGIN_THREADS = 4
+_login_pool = ThreadPoolExecutor(max_workers=LOGIN_THREADS, thread_name_prefix="login")
+# Roles that may look at login throttling
+THROTTLE_ROLES = ["admin", "it"]
 
-def _esc(s: str) -> str:
-    return (s or "").replace("'", "''")
+STUDENT_COLUMNS = ("first_name", "middle_name", "last_name", "gender", "strand", "section", "payment_plan")
+STAFF_COLUMNS = ("first_name", "middle_name", "last_name", "gender", "position", "department", "date_hired", "status", "monthly_salary")
+ROLE_TABLE_COLUMNS = ("first_name", "middle_name", "last_name", "gender", "contact_information")
+# Usernames per IN (...) lookup when importing students
+IMPORT_CHUNK = 500
 
 
 def _name_from_parts(first_name: str | None, middle_name: str | None, last_name: str | None) -> str:
@@ -27,11 +40,13 @@ def _name_from_parts(first_name: str | None, middle_name: str | None, last_name:
 
 
 @router.post("/login", response_model=LoginResponse)
-def login(creds: LoginRequest):
+def login(creds: LoginRequest, request: Request):
+    throttle.check(request, creds.username)
     client = get_db_client()
     try:
         result = client.sqlQuery(
-            f"SELECT hashed_password, role, active FROM users WHERE username = '{_esc(creds.username)}'"
+            q.select("users", ("hashed_password", "role", "active"), where=("username",)),
+            {"username": creds.username},
         )
         if not result:
             return {"success": False, "message": "User not found"}
@@ -42,46 +57,21 @@ def login(creds: LoginRequest):
 
         if not verify_password(creds.password, stored_hash):
             return {"success": False, "message": "Invalid password"}
-
-        un = _esc(creds.username)
-        name = ""
-        first_name = last_name = strand = payment_plan = None
-
-        if role == "student":
-            row = client.sqlQuery(f"SELECT first_name, middle_name, last_name, gender, strand, payment_plan FROM students WHERE username = '{un}'")
-            if row:
-                r = row[0]
-                first_name = r[0] if len(r) > 0 else None
-                last_name = r[2] if len(r) > 2 else None
-                name = _name_from_parts(r[0], r[1] if len(r) > 1 else None, r[2] if len(r) > 2 else None)
-                strand = r[4] if len(r) > 4 else None
-                payment_plan = r[5] if len(r) > 5 else None
-        elif role == "staff":
-            row = client.sqlQuery(f"SELECT first_name, middle_name, last_name FROM staff WHERE username = '{un}'")
-            if row:
-                r = row[0]
-                first_name = r[0] if len(r) > 0 else None
-                last_name = r[2] if len(r) > 2 else None
-                name = _name_from_parts(r[0], r[1] if len(r) > 1 else None, r[2] if len(r) > 2 else None)
-        elif role in ROLE_TABLES:
-            row = client.sqlQuery(f"SELECT first_name, middle_name, last_name, gender, contact_information FROM {role} WHERE username = '{un}'")
-            if row:
-                r = row[0]
-                first_name = r[0] if len(r) > 0 else None
-                last_name = r[2] if len(r) > 2 else None
-                name = _name_from_parts(r[0], r[1] if len(r) > 1 else None, r[2] if len(r) > 2 else None)
-
-        if not name:
-            name = creds.username
+        throttle.succeeded(request, creds.username)
+        # Only once the password checks out, so guessed logins cost no profile queries
+        profile = _cached_profile(creds.username, client)
+        if needs_rehash(stored_hash):
+            _login_pool.submit(_upgrade_hash, client, creds.username, creds.password, stored_hash)
 
         return {
             "success": True,
             "role": role,
-            "name": name,
-            "first_name": first_name,
-            "last_name": last_name,
-            "strand": strand,
-            "payment_plan": payment_plan,
+            "name": profile["name"],
+            "first_name": profile["first_name"],
+            "last_name": profile["last_name"],
+            "strand": profile["strand"],
+            "payment_plan": profile["payment_plan"],
+            "profile": profile,
             "message": "Login successful",
         }
     except Exception as e:
@@ -89,13 +79,38 @@ def login(creds: LoginRequest):
         return {"success": False, "message": "Login failed"}
 
 
+def _upgrade_hash(client, username: str, password: str, old_hash: str):
+    """Re-hash a just-verified password at the configured cost (only if the hash hasn't changed meanwhile)."""
+    try:
+        client.sqlExec(
+            q.update("users", ("hashed_password",), where=("username", "hashed_password = @old_hash")),
+            {"hashed_password": get_password_hash(password), "username": username, "old_hash": old_hash},
+        )
+    except Exception as e:
+        print(f"⚠️ Password rehash failed for {username}: {e}")
+
+
+@router.get("/login/throttle")
+def get_login_throttle(username: str):
+    """Throttled login/change-password attempts so far and the usernames/IPs currently out of attempts."""
+    client = get_db_client()
+    try:
+        ensure_role(client, username, THROTTLE_ROLES)
+        return throttle.stats()
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Throttle Stats Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # --- USER MANAGEMENT ---
 
 
 def _fetch_role_row(client, username: str, role: str):
-    un = _esc(username)
+    un = {"username": username}
     if role == "student":
-        r = client.sqlQuery(f"SELECT first_name, middle_name, last_name, gender, strand, section, payment_plan FROM students WHERE username = '{un}'")
+        r = client.sqlQuery(q.select("students", STUDENT_COLUMNS, where=("username",)), un)
         if r:
             row = r[0]
             return {
@@ -108,7 +123,7 @@ def _fetch_role_row(client, username: str, role: str):
                 "position": None, "department": None, "date_hired": None, "status": None, "monthly_salary": None,
             }
     elif role == "staff":
-        r = client.sqlQuery(f"SELECT first_name, middle_name, last_name, gender, position, department, date_hired, status, monthly_salary FROM staff WHERE username = '{un}'")
+        r = client.sqlQuery(q.select("staff", STAFF_COLUMNS, where=("username",)), un)
         if r:
             row = r[0]
             return {
@@ -123,7 +138,7 @@ def _fetch_role_row(client, username: str, role: str):
                 "contact_info": None, "gen_role": None,
             }
     elif role in ROLE_TABLES:
-        r = client.sqlQuery(f"SELECT first_name, middle_name, last_name, gender, contact_information FROM {role} WHERE username = '{un}'")
+        r = client.sqlQuery(q.select(role, ROLE_TABLE_COLUMNS, where=("username",)), un)
         if r:
             row = r[0]
             return {
@@ -137,42 +152,48 @@ def _fetch_role_row(client, username: str, role: str):
     return None
 
 
+def _load_users():
+    client = get_db_client()
+    result = client.sqlQuery(q.select("users", ("username", "role", "active")))
+    users = []
+    for row in result:
+        username, role, active = row[0], row[1], row[2]
+        profile = _fetch_role_row(client, username, role)
+        if profile:
+            name = _name_from_parts(profile.get("first_name"), profile.get("middle_name"), profile.get("last_name")) or username
+        else:
+            name = username
+        user_data = {
+            "username": username,
+            "role": role,
+            "name": name,
+            "active": active,
+            "first_name": profile.get("first_name") if profile else None,
+            "middle_name": profile.get("middle_name") if profile else None,
+            "last_name": profile.get("last_name") if profile else None,
+            "contact_info": profile.get("contact_info") if profile else None,
+            "gender": profile.get("gender") if profile else None,
+            "strand": profile.get("strand") if profile else None,
+            "section": profile.get("section") if profile else None,
+            "payment_plan": profile.get("payment_plan") if profile else None,
+            "gen_role": profile.get("gen_role") if profile else None,
+            "position": profile.get("position") if profile else None,
+            "department": profile.get("department") if profile else None,
+            "date_hired": profile.get("date_hired") if profile else None,
+            "status": profile.get("status") if profile else None,
+            "monthly_salary": profile.get("monthly_salary") if profile else None,
+        }
+        users.append(user_data)
+    return users
+
+
 @router.get("/users", response_model=List[UserResponse])
-def get_users():
+def get_users(request: Request):
     """List all users (users + role table data)."""
-    client = get_db_client()
     try:
-        result = client.sqlQuery("SELECT username, role, active FROM users")
-        users = []
-        for row in result:
-            username, role, active = row[0], row[1], row[2]
-            profile = _fetch_role_row(client, username, role)
-            if profile:
-                name = _name_from_parts(profile.get("first_name"), profile.get("middle_name"), profile.get("last_name")) or username
-            else:
-                name = username
-            user_data = {
-                "username": username,
-                "role": role,
-                "name": name,
-                "active": active,
-                "first_name": profile.get("first_name") if profile else None,
-                "middle_name": profile.get("middle_name") if profile else None,
-                "last_name": profile.get("last_name") if profile else None,
-                "contact_info": profile.get("contact_info") if profile else None,
-                "gender": profile.get("gender") if profile else None,
-                "strand": profile.get("strand") if profile else None,
-                "section": profile.get("section") if profile else None,
-                "payment_plan": profile.get("payment_plan") if profile else None,
-                "gen_role": profile.get("gen_role") if profile else None,
-                "position": profile.get("position") if profile else None,
-                "department": profile.get("department") if profile else None,
-                "date_hired": profile.get("date_hired") if profile else None,
-                "status": profile.get("status") if profile else None,
-                "monthly_salary": profile.get("monthly_salary") if profile else None,
-            }
-            users.append(user_data)
-        return users
+        return cache.cached_response(request, ("users",), List[UserResponse], _load_users)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -182,7 +203,7 @@ def create_user(user: UserCreate):
     """Create a new user (users + role table row)."""
     client = get_db_client()
     try:
-        check = client.sqlQuery(f"SELECT id FROM users WHERE username = '{_esc(user.username)}'")
+        check = client.sqlQuery(q.select("users", ("id",), where=("username",)), {"username": user.username})
         if check:
             raise HTTPException(status_code=400, detail="Username already exists")
 
@@ -190,38 +211,33 @@ def create_user(user: UserCreate):
         hashed_pw = get_password_hash(password_to_use)
 
         client.sqlExec(
-            f"INSERT INTO users (username, hashed_password, role, active) "
-            f"VALUES ('{_esc(user.username)}', '{_esc(hashed_pw)}', '{_esc(user.role)}', {str(user.active).lower()})"
+            q.insert("users", ("username", "hashed_password", "role", "active")),
+            {"username": user.username, "hashed_password": hashed_pw, "role": user.role, "active": user.active},
         )
 
-        fn, mn, ln = user.first_name or "", user.middle_name or "", user.last_name or ""
+        row = {
+            "username": user.username,
+            "first_name": user.first_name or "",
+            "middle_name": user.middle_name or "",
+            "last_name": user.last_name or "",
+            "gender": user.gender or "",
+        }
         if user.role == "student":
-            section = getattr(user, "section", None) or ""
-            payment_plan = (user.payment_plan or "plan_a") if getattr(user, "payment_plan", None) else "plan_a"
-            client.sqlExec(
-                f"INSERT INTO students (username, first_name, middle_name, last_name, gender, strand, section, payment_plan) "
-                f"VALUES ('{_esc(user.username)}', '{_esc(fn)}', '{_esc(mn)}', '{_esc(ln)}', "
-                f"'{_esc(user.gender or "")}', '{_esc(user.strand or "")}', '{_esc(section)}', '{_esc(payment_plan)}')"
-            )
+            row["strand"] = user.strand or ""
+            row["section"] = getattr(user, "section", None) or ""
+            row["payment_plan"] = (user.payment_plan or "plan_a") if getattr(user, "payment_plan", None) else "plan_a"
+            client.sqlExec(q.insert("students", tuple(row)), row)
         elif user.role == "staff":
-            pos = getattr(user, "position", None) or ""
-            dept = getattr(user, "department", None) or ""
-            dh = getattr(user, "date_hired", None) or ""
-            st = getattr(user, "status", None) or ""
+            row["position"] = getattr(user, "position", None) or ""
+            row["department"] = getattr(user, "department", None) or ""
+            row["date_hired"] = getattr(user, "date_hired", None) or ""
+            row["status"] = getattr(user, "status", None) or ""
             sal = getattr(user, "monthly_salary", None)
-            sal_val = int(sal) if sal is not None else 0
-            client.sqlExec(
-                f"INSERT INTO staff (username, first_name, middle_name, last_name, gender, position, department, date_hired, status, monthly_salary) "
-                f"VALUES ('{_esc(user.username)}', '{_esc(fn)}', '{_esc(mn)}', '{_esc(ln)}', '{_esc(user.gender or "")}', "
-                f"'{_esc(pos)}', '{_esc(dept)}', '{_esc(dh)}', '{_esc(st)}', {sal_val})"
-            )
+            row["monthly_salary"] = int(sal) if sal is not None else 0
+            client.sqlExec(q.insert("staff", tuple(row)), row)
         elif user.role in ROLE_TABLES:
-            contact = user.contact_info or ""
-            client.sqlExec(
-                f"INSERT INTO {user.role} (username, first_name, middle_name, last_name, gender, contact_information) "
-                f"VALUES ('{_esc(user.username)}', '{_esc(fn)}', '{_esc(mn)}', '{_esc(ln)}', "
-                f"'{_esc(user.gender or "")}', '{_esc(contact)}')"
-            )
+            row["contact_information"] = user.contact_info or ""
+            client.sqlExec(q.insert(user.role, tuple(row)), row)
 
         name = _name_from_parts(user.first_name, user.middle_name, user.last_name) or user.username
         resp = {
@@ -244,6 +260,7 @@ def create_user(user: UserCreate):
             "status": getattr(user, "status", None),
             "monthly_salary": getattr(user, "monthly_salary", None),
         }
+        cache.bump("users")
         return resp
     except HTTPException:
         raise
@@ -256,98 +273,85 @@ def update_user(username: str, user: UserUpdate):
     """Update user (users + role table)."""
     client = get_db_client()
     try:
-        check = client.sqlQuery(f"SELECT id, role FROM users WHERE username = '{_esc(username)}'")
+        check = client.sqlQuery(q.select("users", ("id", "role"), where=("username",)), {"username": username})
         if not check:
             raise HTTPException(status_code=404, detail="User not found")
         current_role = check[0][1]
-        un = _esc(username)
+        un = {"username": username}
 
-        updates = []
+        updates = {}
         if user.role:
-            updates.append(f"role = '{_esc(user.role)}'")
+            updates["role"] = user.role
         if user.active is not None:
-            updates.append(f"active = {str(user.active).lower()}")
+            updates["active"] = user.active
         if user.password:
-            updates.append(f"hashed_password = '{_esc(get_password_hash(user.password))}'")
+            updates["hashed_password"] = get_password_hash(user.password)
         if updates:
-            client.sqlExec(f"UPDATE users SET {', '.join(updates)} WHERE username = '{un}'")
+            client.sqlExec(q.update("users", tuple(updates), where=("username",)), {**updates, **un})
 
         # Update role table (current role)
         role = user.role or current_role
         if role == "student":
-            up = []
+            up = {}
             if user.first_name is not None:
-                up.append(f"first_name = '{_esc(user.first_name)}'")
+                up["first_name"] = user.first_name
             if user.middle_name is not None:
-                up.append(f"middle_name = '{_esc(user.middle_name)}'")
+                up["middle_name"] = user.middle_name
             if user.last_name is not None:
-                up.append(f"last_name = '{_esc(user.last_name)}'")
+                up["last_name"] = user.last_name
             if user.gender is not None:
-                up.append(f"gender = '{_esc(user.gender)}'")
+                up["gender"] = user.gender
             if user.strand is not None:
-                up.append(f"strand = '{_esc(user.strand)}'")
+                up["strand"] = user.strand
             if getattr(user, "section", None) is not None:
-                up.append(f"section = '{_esc(user.section)}'")
+                up["section"] = user.section
             if user.payment_plan is not None:
                 if user.payment_plan not in ("", "plan_a", "plan_b", "plan_c"):
                     raise HTTPException(status_code=400, detail="payment_plan must be plan_a, plan_b, or plan_c")
-                up.append(f"payment_plan = '{_esc(user.payment_plan)}'")
+                up["payment_plan"] = user.payment_plan
             if up:
-                client.sqlExec(f"UPDATE students SET {', '.join(up)} WHERE username = '{un}'")
+                client.sqlExec(q.update("students", tuple(up), where=("username",)), {**up, **un})
         elif role == "staff":
-            up = []
+            up = {}
             if user.first_name is not None:
-                up.append(f"first_name = '{_esc(user.first_name)}'")
+                up["first_name"] = user.first_name
             if user.middle_name is not None:
-                up.append(f"middle_name = '{_esc(user.middle_name)}'")
+                up["middle_name"] = user.middle_name
             if user.last_name is not None:
-                up.append(f"last_name = '{_esc(user.last_name)}'")
+                up["last_name"] = user.last_name
             if user.gender is not None:
-                up.append(f"gender = '{_esc(user.gender)}'")
+                up["gender"] = user.gender
             if getattr(user, "position", None) is not None:
-                up.append(f"position = '{_esc(user.position)}'")
+                up["position"] = user.position
             if getattr(user, "department", None) is not None:
-                up.append(f"department = '{_esc(user.department)}'")
+                up["department"] = user.department
             if getattr(user, "date_hired", None) is not None:
-                up.append(f"date_hired = '{_esc(user.date_hired)}'")
+                up["date_hired"] = user.date_hired
             if getattr(user, "status", None) is not None:
-                up.append(f"status = '{_esc(user.status)}'")
+                up["status"] = user.status
             if getattr(user, "monthly_salary", None) is not None:
-                up.append(f"monthly_salary = {int(user.monthly_salary)}")
+                up["monthly_salary"] = int(user.monthly_salary)
             if up:
-                client.sqlExec(f"UPDATE staff SET {', '.join(up)} WHERE username = '{un}'")
-            # Staff deductions (payroll): replace all for this staff
-            deductions = getattr(user, "deductions", None)
-            if deductions is not None and isinstance(deductions, list) and len(deductions) >= 0:
-                try:
-                    client.sqlExec(f"DELETE FROM staff_deductions WHERE staff_id = '{un}'")
-                except Exception:
-                    pass
-                for d in deductions:
-                    dtype = (getattr(d, "deduction_type", None) or (d.get("deduction_type") if isinstance(d, dict) else None) or "").strip() or "Deduction"
-                    amt = getattr(d, "amount", None)
-                    if amt is None and isinstance(d, dict):
-                        amt = d.get("amount", 0)
-                    amt = float(amt or 0)
-                    amt_cents = int(round(amt * 100))
-                    client.sqlExec(
-                        f"INSERT INTO staff_deductions (staff_id, deduction_type, amount) VALUES ('{un}', '{_esc(str(dtype))}', {amt_cents})"
-                    )
+                client.sqlExec(q.update("staff", tuple(up), where=("username",)), {**up, **un})
+            # Staff deductions (payroll): write only what changed
+            if user.deductions is not None:
+                deductions.replace(client, username, [deductions.item(d.deduction_type, d.amount) for d in user.deductions])
         elif role in ROLE_TABLES:
-            up = []
+            up = {}
             if user.first_name is not None:
-                up.append(f"first_name = '{_esc(user.first_name)}'")
+                up["first_name"] = user.first_name
             if user.middle_name is not None:
-                up.append(f"middle_name = '{_esc(user.middle_name)}'")
+                up["middle_name"] = user.middle_name
             if user.last_name is not None:
-                up.append(f"last_name = '{_esc(user.last_name)}'")
+                up["last_name"] = user.last_name
             if user.gender is not None:
-                up.append(f"gender = '{_esc(user.gender)}'")
+                up["gender"] = user.gender
             if user.contact_info is not None:
-                up.append(f"contact_information = '{_esc(user.contact_info)}'")
+                up["contact_information"] = user.contact_info
             if up:
-                client.sqlExec(f"UPDATE {role} SET {', '.join(up)} WHERE username = '{un}'")
+                client.sqlExec(q.update(role, tuple(up), where=("username",)), {**up, **un})
 
+        cache.bump("users")
         return {"message": "User updated successfully"}
     except HTTPException:
         raise
@@ -359,13 +363,9 @@ class ProfileRequest(BaseModel):
     username: str
 
 
-def _get_user_profile(username: str):
-    """Fetch user profile from users + role table."""
-    client = get_db_client()
-    if not username:
-        raise HTTPException(status_code=400, detail="Username is required")
-    un = _esc(username)
-    result = client.sqlQuery(f"SELECT username, role FROM users WHERE username = '{un}'")
+def _load_profile(client, username: str) -> dict:
+    """Profile from users + role table."""
+    result = client.sqlQuery(q.select("users", ("username", "role"), where=("username",)), {"username": username})
     if not result:
         raise HTTPException(status_code=404, detail=f"User '{username}' not found")
     role = result[0][1]
@@ -395,6 +395,23 @@ def _get_user_profile(username: str):
     return out
 
 
+def _cached_profile(username: str, client=None) -> dict:
+    """
+    The user's profile, kept per user until a user write bumps the users scope (create, update,
+    profile edits, import, delete). Connects to the database only on a miss.
+    """
+    return cache.cached_value(
+        f"profile:{username}", ("users",), lambda: _load_profile(client or get_db_client(), username)
+    )
+
+
+def _get_user_profile(username: str):
+    """Fetch user profile from users + role table."""
+    if not username:
+        raise HTTPException(status_code=400, detail="Username is required")
+    return dict(_cached_profile(username))
+
+
 @router.post("/profile")
 def get_current_user_profile(req: ProfileRequest):
     """Get current user's profile."""
@@ -419,61 +436,62 @@ def update_user_profile(req: ProfileUpdateRequest):
     username = req.username
     profile = req.profile
     try:
-        result = client.sqlQuery(f"SELECT role FROM users WHERE username = '{_esc(username)}'")
+        result = client.sqlQuery(q.select("users", ("role",), where=("username",)), {"username": username})
         if not result:
             raise HTTPException(status_code=404, detail="User not found")
         role = result[0][0]
-        un = _esc(username)
+        un = {"username": username}
 
         if role == "student":
-            up = []
+            up = {}
             if profile.first_name is not None:
-                up.append(f"first_name = '{_esc(profile.first_name)}'")
+                up["first_name"] = profile.first_name
             if profile.middle_name is not None:
-                up.append(f"middle_name = '{_esc(profile.middle_name)}'")
+                up["middle_name"] = profile.middle_name
             if profile.last_name is not None:
-                up.append(f"last_name = '{_esc(profile.last_name)}'")
+                up["last_name"] = profile.last_name
             if profile.contact_info is not None:
                 pass  # students don't have contact_info in table; we use section or leave it
             if profile.gender is not None:
-                up.append(f"gender = '{_esc(profile.gender)}'")
+                up["gender"] = profile.gender
             if profile.payment_plan is not None:
                 if profile.payment_plan not in ("", "plan_a", "plan_b", "plan_c"):
                     raise HTTPException(status_code=400, detail="payment_plan must be plan_a, plan_b, or plan_c")
-                up.append(f"payment_plan = '{_esc(profile.payment_plan)}'")
+                up["payment_plan"] = profile.payment_plan
             if profile.strand is not None:
-                up.append(f"strand = '{_esc(profile.strand)}'")
+                up["strand"] = profile.strand
             if getattr(profile, "section", None) is not None:
-                up.append(f"section = '{_esc(profile.section)}'")
+                up["section"] = profile.section
             if up:
-                client.sqlExec(f"UPDATE students SET {', '.join(up)} WHERE username = '{un}'")
+                client.sqlExec(q.update("students", tuple(up), where=("username",)), {**up, **un})
         elif role == "staff":
-            up = []
+            up = {}
             if profile.first_name is not None:
-                up.append(f"first_name = '{_esc(profile.first_name)}'")
+                up["first_name"] = profile.first_name
             if profile.middle_name is not None:
-                up.append(f"middle_name = '{_esc(profile.middle_name)}'")
+                up["middle_name"] = profile.middle_name
             if profile.last_name is not None:
-                up.append(f"last_name = '{_esc(profile.last_name)}'")
+                up["last_name"] = profile.last_name
             if profile.gender is not None:
-                up.append(f"gender = '{_esc(profile.gender)}'")
+                up["gender"] = profile.gender
             if up:
-                client.sqlExec(f"UPDATE staff SET {', '.join(up)} WHERE username = '{un}'")
+                client.sqlExec(q.update("staff", tuple(up), where=("username",)), {**up, **un})
         elif role in ROLE_TABLES:
-            up = []
+            up = {}
             if profile.first_name is not None:
-                up.append(f"first_name = '{_esc(profile.first_name)}'")
+                up["first_name"] = profile.first_name
             if profile.middle_name is not None:
-                up.append(f"middle_name = '{_esc(profile.middle_name)}'")
+                up["middle_name"] = profile.middle_name
             if profile.last_name is not None:
-                up.append(f"last_name = '{_esc(profile.last_name)}'")
+                up["last_name"] = profile.last_name
             if profile.gender is not None:
-                up.append(f"gender = '{_esc(profile.gender)}'")
+                up["gender"] = profile.gender
             if profile.contact_info is not None:
-                up.append(f"contact_information = '{_esc(profile.contact_info)}'")
+                up["contact_information"] = profile.contact_info
             if up:
-                client.sqlExec(f"UPDATE {role} SET {', '.join(up)} WHERE username = '{un}'")
+                client.sqlExec(q.update(role, tuple(up), where=("username",)), {**up, **un})
 
+        cache.bump("users")
         return {"message": "Profile updated successfully"}
     except HTTPException:
         raise
@@ -488,17 +506,24 @@ class PasswordChangeRequest(BaseModel):
 
 
 @router.put("/change-password")
-def change_password(req: PasswordChangeRequest):
+def change_password(req: PasswordChangeRequest, request: Request):
     """Change current user's password."""
+    throttle.check(request, req.username)
     client = get_db_client()
     try:
-        result = client.sqlQuery(f"SELECT hashed_password FROM users WHERE username = '{_esc(req.username)}'")
+        result = client.sqlQuery(
+            q.select("users", ("hashed_password",), where=("username",)), {"username": req.username}
+        )
         if not result:
             raise HTTPException(status_code=404, detail="User not found")
         if not verify_password(req.current_password, result[0][0]):
             raise HTTPException(status_code=400, detail="Current password is incorrect")
+        throttle.succeeded(request, req.username)
         new_hash = get_password_hash(req.new_password)
-        client.sqlExec(f"UPDATE users SET hashed_password = '{_esc(new_hash)}' WHERE username = '{_esc(req.username)}'")
+        client.sqlExec(
+            q.update("users", ("hashed_password",), where=("username",)),
+            {"hashed_password": new_hash, "username": req.username},
+        )
         return {"message": "Password changed successfully"}
     except HTTPException:
         raise
@@ -556,11 +581,12 @@ async def import_students_excel(file: UploadFile = File(...)):
             return "" if v is None else str(v).strip()
 
         client = get_db_client()
-        hashed_pw = get_password_hash("123")
         created = 0
         skipped = []
         errors = []
 
+        # Read every row first, so passwords are hashed together and only for students that are new
+        parsed = []
         for row_idx, row in enumerate(rows[1:], start=2):
             if not any(v is not None and str(v).strip() for v in row):
                 continue
@@ -568,33 +594,51 @@ async def import_students_excel(file: UploadFile = File(...)):
             if not username:
                 errors.append(f"Row {row_idx}: missing student_id/username")
                 continue
-            last_name = get_cell(row, "last_name")
-            first_name = get_cell(row, "first_name")
-            middle_name = get_cell(row, "middle_name")
-            gender = get_cell(row, "gender")
-            strand_val = get_cell(row, "strand")
-            section_val = get_cell(row, "section")
             payment_plan_val = get_cell(row, "payment_plan") or "plan_a"
             if payment_plan_val not in ("plan_a", "plan_b", "plan_c"):
                 payment_plan_val = "plan_a"
+            student_row = {
+                "username": username,
+                "first_name": get_cell(row, "first_name"),
+                "middle_name": get_cell(row, "middle_name"),
+                "last_name": get_cell(row, "last_name"),
+                "gender": get_cell(row, "gender"),
+                "strand": get_cell(row, "strand"),
+                "section": get_cell(row, "section"),
+                "payment_plan": payment_plan_val,
+            }
+            parsed.append((row_idx, student_row))
+
+        existing = set()
+        usernames = sorted({student_row["username"] for _, student_row in parsed})
+        for start in range(0, len(usernames), IMPORT_CHUNK):
+            cond, params = q.in_list("username", usernames[start : start + IMPORT_CHUNK])
+            existing.update(u for (u,) in client.sqlQuery(q.select("users", ("username",), where=(cond,)), params))
+        new_rows = []
+        for row_idx, student_row in parsed:
+            if student_row["username"] in existing:
+                skipped.append(student_row["username"])
+            else:
+                existing.add(student_row["username"])  # A repeated row in the sheet is skipped too
+                new_rows.append((row_idx, student_row))
+
+        # Everyone starts with "123", but each hash gets its own salt: one shared hash would show at a
+        # glance that all these accounts have the same password, and crack them all at once
+        hashes = await run_in_threadpool(get_password_hashes, ["123"] * len(new_rows))
+        for (row_idx, student_row), hashed_pw in zip(new_rows, hashes):
+            username = student_row["username"]
             try:
-                check = client.sqlQuery(f"SELECT id FROM users WHERE username = '{_esc(username)}'")
-                if check:
-                    skipped.append(username)
-                    continue
-                client.sqlExec(
-                    f"INSERT INTO users (username, hashed_password, role, active) "
-                    f"VALUES ('{_esc(username)}', '{hashed_pw}', 'student', true)"
-                )
                 client.sqlExec(
-                    f"INSERT INTO students (username, first_name, middle_name, last_name, gender, strand, section, payment_plan) "
-                    f"VALUES ('{_esc(username)}', '{_esc(first_name)}', '{_esc(middle_name)}', '{_esc(last_name)}', "
-                    f"'{_esc(gender)}', '{_esc(strand_val)}', '{_esc(section_val)}', '{_esc(payment_plan_val)}')"
+                    q.insert("users", ("username", "hashed_password", "role", "active")),
+                    {"username": username, "hashed_password": hashed_pw, "role": "student", "active": True},
                 )
+                client.sqlExec(q.insert("students", tuple(student_row)), student_row)
                 created += 1
             except Exception as e:
                 errors.append(f"Row {row_idx} ({username}): {str(e)}")
 
+        if created:
+            cache.bump("users")
         return {
             "success": True,
             "created": created,
@@ -613,18 +657,19 @@ def delete_user(username: str):
     """Delete a user (remove from role table then users)."""
     client = get_db_client()
     try:
-        check = client.sqlQuery(f"SELECT id, role FROM users WHERE username = '{_esc(username)}'")
+        un = {"username": username}
+        check = client.sqlQuery(q.select("users", ("id", "role"), where=("username",)), un)
         if not check:
             raise HTTPException(status_code=404, detail="User not found")
         role = check[0][1]
-        un = _esc(username)
         if role == "student":
-            client.sqlExec(f"DELETE FROM students WHERE username = '{un}'")
+            client.sqlExec(q.delete("students", where=("username",)), un)
         elif role == "staff":
-            client.sqlExec(f"DELETE FROM staff WHERE username = '{un}'")
+            client.sqlExec(q.delete("staff", where=("username",)), un)
         elif role in ROLE_TABLES:
-            client.sqlExec(f"DELETE FROM {role} WHERE username = '{un}'")
-        client.sqlExec(f"DELETE FROM users WHERE username = '{un}'")
+            client.sqlExec(q.delete(role, where=("username",)), un)
+        client.sqlExec(q.delete("users", where=("username",)), un)
+        cache.bump("users")
         return {"message": "User deleted successfully"}
     except HTTPException:
         raise
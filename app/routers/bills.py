@@ -1,12 +1,23 @@
 from typing import List, Optional
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Request, Response
 from pydantic import BaseModel
 
+from .. import cache, idempotency
+from .. import queries as q
 from ..database import get_db_client
 from ..routers.transactions import ensure_role
 
 router = APIRouter(tags=["Bills"])
 
+ASSIGNMENT_COLUMNS = ("id", "bill_id", "student_id", "amount", "paid_amount", "status")
+
+STUDENT_BILLS_QUERY = """
+    SELECT ba.id, ba.bill_id, ba.student_id, ba.amount, ba.paid_amount, ba.status, b.bill_type
+    FROM bill_assignments ba
+    LEFT JOIN bills b ON ba.bill_id = b.id
+    WHERE ba.student_id = @student_id
+"""
+
 
 class BillCreate(BaseModel):
     bill_type: str  # "Tuition" or "College Funds"
@@ -37,8 +48,12 @@ class BillResponse(BaseModel):
 
 
 @router.post("/bills", response_model=BillResponse)
-def create_bill(bill: BillCreate):
-    """Create a bill and assign it to students. Only Payables Associate can create bills."""
+def create_bill(bill: BillCreate, response: Response, idempotency_key: Optional[str] = Header(None)):
+    """Create a bill and assign it to students. Only Payables Associate can create bills. Retries may send the same Idempotency-Key."""
+    return idempotency.run("bills", bill.created_by, idempotency_key, bill, response, lambda: _create_bill(bill))
+
+
+def _create_bill(bill: BillCreate):
     client = get_db_client()
     try:
         ensure_role(client, bill.created_by, ["payables", "admin"])
@@ -48,31 +63,43 @@ def create_bill(bill: BillCreate):
         per_student_cents = amount_cents // len(bill.student_ids) if bill.student_ids else 0
         
         # Insert bill
-        query = f"""
-            INSERT INTO bills (created_at, bill_type, description, total_amount, created_by)
-            VALUES (NOW(), '{bill.bill_type}', '{bill.description}', {amount_cents}, '{bill.created_by}')
-        """
-        client.sqlExec(query)
+        client.sqlExec(
+            q.insert("bills", ("bill_type", "description", "total_amount", "created_by"), now=("created_at",)),
+            {
+                "bill_type": bill.bill_type,
+                "description": bill.description,
+                "total_amount": amount_cents,
+                "created_by": bill.created_by,
+            },
+        )
+        idempotency.committed()
         
         # Get the created bill ID
-        res = client.sqlQuery("SELECT id, created_at FROM bills ORDER BY id DESC LIMIT 1")
+        res = client.sqlQuery(
+            q.select("bills", ("id", "created_at"), where=("created_by",), order_by="id DESC", limit=1),
+            {"created_by": bill.created_by},
+        )
         if not res:
             raise HTTPException(status_code=500, detail="Bill created but could not be retrieved")
         
         bill_id = res[0][0]
         created_at = res[0][1]
+        idempotency.committed(bill_id)
         
         # Create assignments for each student
         assignments = []
         for student_id in bill.student_ids:
-            assign_query = f"""
-                INSERT INTO bill_assignments (bill_id, student_id, amount, paid_amount, status)
-                VALUES ({bill_id}, '{student_id}', {per_student_cents}, 0, 'Pending')
-            """
-            client.sqlExec(assign_query)
+            assign_params = {"bill_id": bill_id, "student_id": student_id}
+            client.sqlExec(
+                q.insert("bill_assignments", ("bill_id", "student_id", "amount", "paid_amount", "status")),
+                {**assign_params, "amount": per_student_cents, "paid_amount": 0, "status": "Pending"},
+            )
             
             # Get assignment ID
-            assign_res = client.sqlQuery(f"SELECT id FROM bill_assignments WHERE bill_id={bill_id} AND student_id='{student_id}' ORDER BY id DESC LIMIT 1")
+            assign_res = client.sqlQuery(
+                q.select("bill_assignments", ("id",), where=("bill_id", "student_id"), order_by="id DESC", limit=1),
+                assign_params,
+            )
             if assign_res:
                 assignments.append({
                     "id": assign_res[0][0],
@@ -83,6 +110,7 @@ def create_bill(bill: BillCreate):
                     "status": "Pending"
                 })
         
+        cache.bump("bills")
         return {
             "id": bill_id,
             "created_at": str(created_at),
@@ -97,44 +125,49 @@ def create_bill(bill: BillCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/bills", response_model=List[BillResponse])
-def get_bills():
-    """Get all bills. Only Payables Associate and Admin can view."""
+def _load_bills():
     client = get_db_client()
-    try:
-        res = client.sqlQuery("SELECT id, created_at, bill_type, description, total_amount, created_by FROM bills ORDER BY id DESC")
+    res = client.sqlQuery("SELECT id, created_at, bill_type, description, total_amount, created_by FROM bills ORDER BY id DESC")
+
+    bills = []
+    for row in res:
+        bill_id = row[0]
+        # Get assignments for this bill
+        assign_res = client.sqlQuery(
+            q.select("bill_assignments", ASSIGNMENT_COLUMNS, where=("bill_id",)), {"bill_id": bill_id}
+        )
         
-        bills = []
-        for row in res:
-            bill_id = row[0]
-            # Get assignments for this bill
-            assign_res = client.sqlQuery(f"""
-                SELECT id, bill_id, student_id, amount, paid_amount, status
-                FROM bill_assignments WHERE bill_id = {bill_id}
-            """)
-            
-            assignments = []
-            for a in assign_res:
-                assignments.append({
-                    "id": a[0],
-                    "bill_id": a[1],
-                    "student_id": a[2],
-                    "amount": a[3] / 100.0,
-                    "paid_amount": a[4] / 100.0,
-                    "status": a[5]
-                })
-            
-            bills.append({
-                "id": row[0],
-                "created_at": str(row[1]),
-                "bill_type": row[2],
-                "description": row[3],
-                "total_amount": row[4] / 100.0,
-                "created_by": row[5],
-                "assignments": assignments
+        assignments = []
+        for a in assign_res:
+            assignments.append({
+                "id": a[0],
+                "bill_id": a[1],
+                "student_id": a[2],
+                "amount": a[3] / 100.0,
+                "paid_amount": a[4] / 100.0,
+                "status": a[5]
             })
         
-        return bills
+        bills.append({
+            "id": row[0],
+            "created_at": str(row[1]),
+            "bill_type": row[2],
+            "description": row[3],
+            "total_amount": row[4] / 100.0,
+            "created_by": row[5],
+            "assignments": assignments
+        })
+    
+    return bills
+
+
+@router.get("/bills", response_model=List[BillResponse])
+def get_bills(request: Request):
+    """Get all bills. Only Payables Associate and Admin can view."""
+    try:
+        return cache.cached_response(request, ("bills",), List[BillResponse], _load_bills)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Get bills error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -145,12 +178,7 @@ def get_student_bills(student_id: str):
     """Get all bills for a specific student."""
     client = get_db_client()
     try:
-        res = client.sqlQuery(f"""
-            SELECT ba.id, ba.bill_id, ba.student_id, ba.amount, ba.paid_amount, ba.status, b.bill_type
-            FROM bill_assignments ba
-            LEFT JOIN bills b ON ba.bill_id = b.id
-            WHERE ba.student_id = '{student_id}'
-        """)
+        res = client.sqlQuery(STUDENT_BILLS_QUERY, {"student_id": student_id})
         
         assignments = []
         for row in res:
@@ -176,7 +204,9 @@ def update_payment(assignment_id: int, payment_amount: float):
     client = get_db_client()
     try:
         # Get current assignment
-        res = client.sqlQuery(f"SELECT amount, paid_amount FROM bill_assignments WHERE id = {assignment_id}")
+        res = client.sqlQuery(
+            q.select("bill_assignments", ("amount", "paid_amount"), where=("id",)), {"id": assignment_id}
+        )
         if not res:
             raise HTTPException(status_code=404, detail="Bill assignment not found")
         
@@ -188,12 +218,12 @@ def update_payment(assignment_id: int, payment_amount: float):
         # Update paid amount
         status = "Paid" if new_paid >= current_amount else "Partial"
         
-        client.sqlExec(f"""
-            UPDATE bill_assignments
-            SET paid_amount = {new_paid}, status = '{status}'
-            WHERE id = {assignment_id}
-        """)
+        client.sqlExec(
+            q.update("bill_assignments", ("paid_amount", "status")),
+            {"paid_amount": new_paid, "status": status, "id": assignment_id},
+        )
         
+        cache.bump("bills")
         return {"success": True, "new_paid_amount": new_paid / 100.0, "status": status}
     except Exception as e:
         print(f"Update payment error: {e}")
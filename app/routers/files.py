@@ -1,54 +1,200 @@
+import mimetypes
 import os
-import shutil
-import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
 
-from fastapi import APIRouter, File, HTTPException, UploadFile
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, File, HTTPException, Request, Response, UploadFile
+from fastapi.responses import FileResponse, JSONResponse
+
+from .. import attachments
+from .. import queries as q
+from ..assets import safe_join
+from ..core import ATTACHMENT_GRACE_HOURS, MAX_UPLOAD_BYTES
+from ..database import get_db_client
+from .transactions import ensure_role
 
 router = APIRouter(tags=["Files"])
 
 # Create a local directory to store images
-UPLOAD_DIR = "uploads"
+UPLOAD_DIR = attachments.UPLOAD_DIR
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+ALLOWED_TYPES = attachments.EXTENSIONS
+# Roles that may list attachments; sweeping orphans is admin only
+LIST_ROLES = ["admin", "it", "bookkeeper"]
+MAX_LIST = 1000
+# A file name never changes content (digests, or uuids for older uploads), so browsers may keep them for good
+FILE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# upload_file's full path (the router is mounted under /files in app.py)
+UPLOAD_PATH = "/files/upload"
+# Multipart framing (boundary, part headers, other fields) allowed on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def _too_large_detail() -> str:
+    return f"File is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=_too_large_detail())
+
+
+async def limit_upload_size(request: Request, call_next):
+    """
+    HTTP middleware: refuse an upload whose Content-Length is already over the limit, before FastAPI
+    parses (and spools to disk) the multipart body; dependencies only run after the form is read.
+    Uploads without a Content-Length are still cut off while saving (see upload_file).
+    """
+    if request.method == "POST" and request.url.path == UPLOAD_PATH:
+        try:
+            length = int(request.headers.get("content-length", ""))
+        except ValueError:
+            length = None
+        if length is not None and length > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD:
+            return JSONResponse(status_code=413, content={"detail": _too_large_detail()}, headers={"Connection": "close"})
+    return await call_next(request)
+
 
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+def upload_file(file: UploadFile = File(...), username: Optional[str] = None):
     """
-    Receives a file, saves it with a unique ID, and returns the path.
+    Receives a file, stores it under its SHA-256 digest, and returns the path.
+    The same receipt uploaded again maps to the same path and is stored once.
     """
+    # Validate file type
+    if file.content_type not in ALLOWED_TYPES:
+        raise HTTPException(status_code=400, detail="Only JPEG, PNG, or PDF files are allowed")
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise _too_large()
+
     try:
-        # Validate file type
-        allowed_types = ["image/jpeg", "image/png", "application/pdf"]
-        if file.content_type not in allowed_types:
-            raise HTTPException(
-                status_code=400, detail="Only JPEG, PNG, or PDF files are allowed"
-            )
-
-        # Generate unique filename
-        file_ext = file.filename.split(".")[-1]
-        new_name = f"{uuid.uuid4()}.{file_ext}"
-        file_path = os.path.join(UPLOAD_DIR, new_name)
-
-        # Save the file to disk
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Return the path relative to the API URL
-        # e.g., if API_URL is localhost:8000, this returns 'files/filename.png'
-        # The frontend will append this to API_URL
-        return {"path": f"files/{new_name}"}
+        stored = attachments.save(file.file, ALLOWED_TYPES[file.content_type], MAX_UPLOAD_BYTES)
+    except attachments.TooLarge:
+        raise _too_large()
     except Exception as e:
         print(f"Upload Error: {e}")
         raise HTTPException(status_code=500, detail="File upload failed")
 
+    # Anchor the digest in immudb so later tampering with the file is detectable, and index the upload.
+    # The file is already stored, so a database problem here is logged rather than failing the upload.
+    try:
+        client = get_db_client()
+    except Exception as e:
+        print(f"⚠️ Attachment anchor warning: {e}")
+        client = None
+    if client is not None:
+        try:
+            attachments.anchor(client, stored["sha256"], stored["size"], file.content_type)
+        except Exception as e:
+            print(f"⚠️ Attachment anchor warning: {e}")
+        try:
+            attachments.record(client, stored["name"], stored["sha256"], stored["size"], file.content_type, username)
+        except Exception as e:
+            print(f"⚠️ Attachment metadata warning: {e}")
+
+    # Return the path relative to the API URL
+    # e.g., if API_URL is localhost:8000, this returns 'files/<sha256>.pdf'
+    # The frontend will append this to API_URL
+    return {
+        "path": f"files/{stored['name']}",
+        "size": stored["size"],
+        "sha256": stored["sha256"],
+        "deduplicated": not stored["created"],
+    }
+
+
+@router.get("")
+def list_files(
+    username: str,
+    uploaded_by: Optional[str] = None,
+    txn_id: Optional[int] = None,
+    unlinked: bool = False,
+    limit: int = 200,
+):
+    """Uploaded attachments, newest first, from the metadata index. unlinked=true lists those never attached to a transaction."""
+    client = get_db_client()
+    ensure_role(client, username, LIST_ROLES)
+    filters = {"uploaded_by": uploaded_by, "txn_id": 0 if unlinked else txn_id}
+    params = {k: v for k, v in filters.items() if v is not None}
+    params["limit"] = max(1, min(limit, MAX_LIST))
+    try:
+        rows = client.sqlQuery(
+            q.select(attachments.TABLE, attachments.COLUMNS, where=tuple(k for k in params if k != "limit"), order_by="uploaded_at DESC", limit="@limit"),
+            params,
+        )
+    except Exception as e:
+        print(f"List Files Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return [
+        {**dict(zip(attachments.COLUMNS, row)), "path": f"files/{row[0]}", "uploaded_at": str(row[6])}
+        for row in rows
+    ]
+
+
+@router.post("/sweep")
+def sweep_files(username: str, dry_run: bool = True, grace_hours: float = ATTACHMENT_GRACE_HOURS):
+    """
+    Attachments no transaction references, uploaded more than grace_hours ago. With dry_run=false they
+    are deleted. Admin only; the same sweep runs from the command line with python -m app.attachments.
+    """
+    client = get_db_client()
+    ensure_role(client, username, ["admin"])
+    try:
+        return attachments.sweep(client, grace_hours, dry_run=dry_run)
+    except Exception as e:
+        print(f"Sweep Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/{filename}/verify")
+def verify_file(filename: str):
+    """Check a stored attachment against its anchored digest, and how many transactions attach it."""
+    if attachments.digest_of(filename) is None:
+        raise HTTPException(status_code=400, detail="Only content-addressed attachments can be verified")
+    if not os.path.isfile(attachments.path_for(filename)):
+        raise HTTPException(status_code=404, detail="File not found")
+    client = get_db_client()
+    try:
+        result = attachments.verify(client, filename)
+    except Exception as e:
+        # Missing anchor or a failed proof
+        raise HTTPException(status_code=400, detail=f"Verification Failed: {str(e)}")
+    return {**result, "references": attachments.references(client, filename)}
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return if_none_match.strip() == "*" or etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
 
 @router.get("/{filename}")
-async def get_file(filename: str):
+def get_file(filename: str, request: Request):
     """
-    Serve the file back to the browser.
+    Serve the file back to the browser. Supports Range requests (PDF viewers fetch pages on demand)
+    and conditional GET; the ETag is the content digest (the uuid for older uploads).
     """
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    if os.path.exists(file_path):
-        return FileResponse(file_path)
-    raise HTTPException(status_code=404, detail="File not found")
+    digest = attachments.digest_of(filename)
+    # Older uuid uploads sit directly in uploads/; never let such a name escape it
+    file_path = attachments.path_for(filename) if digest else safe_join(UPLOAD_DIR, filename)
+    try:
+        stat = os.stat(file_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(status_code=404, detail="File not found")
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    etag = f'"{digest or os.path.splitext(filename)[0]}"'
+    headers = {"ETag": etag, "Cache-Control": FILE_CACHE_CONTROL}
+    if _not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers={**headers, "Last-Modified": formatdate(stat.st_mtime, usegmt=True)})
+    # FileResponse answers Range / If-Range itself (206 with Content-Range, 416 when unsatisfiable)
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    return FileResponse(file_path, headers=headers, media_type=media_type, stat_result=stat)
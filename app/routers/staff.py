@@ -1,19 +1,23 @@
-"""Staff payroll summary and deductions: GET (staff own or admin/payables any), PUT (admin/payables only). Salary amount derived from staff.monthly_salary."""
+"""Staff payroll summary and deductions: GET (staff own or admin/payables any), PUT (admin/payables only), plus bulk deductions and the monthly payroll run for all active staff. Salary amount derived from staff.monthly_salary."""
+import csv
+import io
+import json
+import os
+from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Response
 from pydantic import BaseModel
 
+from .. import cache, deductions, events, ledger, rollups, shared
+from .. import queries as q
+from ..core import SHARED_STATE_DIR
 from ..database import get_db_client
 from .transactions import ensure_role
 
 router = APIRouter(tags=["Staff Payroll"])
 
 
-def _esc(s: str) -> str:
-    return (s or "").replace("'", "''")
-
-
 class DeductionItem(BaseModel):
     deduction_type: str
     amount: float
@@ -24,6 +28,29 @@ class StaffPayrollUpdate(BaseModel):
     deductions: Optional[List[DeductionItem]] = None
 
 
+class PayrollRunRequest(BaseModel):
+    period: Optional[str] = None  # YYYY-MM, defaults to the current month
+    post_disbursements: bool = False
+
+
+class BulkDeductionRequest(BaseModel):
+    deduction_type: str
+    amount: Optional[float] = None  # fixed amount per staff member
+    rate: Optional[float] = None  # percent of monthly salary
+    remove: bool = False  # drop this deduction type from everyone instead
+
+
+PAYROLL_ROLES = ["admin", "payables"]
+# Posted payroll is a Pending "Teacher Salary" disbursement per staff member, described "Payroll YYYY-MM"
+PAYROLL_CATEGORY = "Teacher Salary"
+# Rows per multi-row INSERT when posting
+POST_CHUNK = 100
+# Posting runs for one period take turns on a lock file here, so two runs can't both see "not posted yet"
+POST_LOCK_DIR = os.path.join(SHARED_STATE_DIR, "payroll")
+# How long a run waits for another run posting the same period
+POST_LOCK_WAIT_SECONDS = 30
+
+
 @router.get("/staff/{staff_id}/payroll", response_model=dict)
 def get_staff_payroll(
     staff_id: str,
@@ -42,18 +69,21 @@ def get_staff_payroll(
     if role not in ("staff", "admin", "payables") and role is not None:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    sid = _esc(staff_id)
     # Salary amount derived from staff.monthly_salary (staff table)
     salary_amount = 0.0
     try:
-        staff_row = client.sqlQuery(f"SELECT monthly_salary FROM staff WHERE username = '{sid}' LIMIT 1")
+        staff_row = client.sqlQuery(
+            q.select("staff", ("monthly_salary",), where=("username",), limit=1), {"username": staff_id}
+        )
         if staff_row and len(staff_row[0]) > 0 and staff_row[0][0] is not None:
             salary_amount = float(staff_row[0][0])
     except Exception:
         pass
     if salary_amount <= 0:
         try:
-            row = client.sqlQuery(f"SELECT salary_amount FROM staff_payroll WHERE staff_id = '{sid}' LIMIT 1")
+            row = client.sqlQuery(
+                q.select("staff_payroll", ("salary_amount",), where=("staff_id",), limit=1), {"staff_id": staff_id}
+            )
             if row and row[0][0] is not None:
                 salary_amount = int(row[0][0]) / 100.0
         except Exception:
@@ -62,7 +92,8 @@ def get_staff_payroll(
     ded_rows = []
     try:
         ded_rows = client.sqlQuery(
-            f"SELECT id, deduction_type, amount FROM staff_deductions WHERE staff_id = '{sid}' ORDER BY id"
+            q.select("staff_deductions", ("id", "deduction_type", "amount"), where=("staff_id",), order_by="id"),
+            {"staff_id": staff_id},
         )
     except Exception:
         pass
@@ -88,33 +119,283 @@ def update_staff_payroll(
     client = get_db_client()
     ensure_role(client, current_username or "guest", ["admin", "payables"])
 
-    sid = _esc(staff_id)
     updates = []
-    un = _esc(current_username or "admin")
 
     if payload.salary_amount is not None:
         salary_int = int(round(payload.salary_amount))
         try:
             client.sqlExec(
-                f"UPDATE staff SET monthly_salary = {salary_int} WHERE username = '{sid}'"
+                q.update("staff", ("monthly_salary",), where=("username",)),
+                {"monthly_salary": salary_int, "username": staff_id},
             )
             updates.append("salary_amount")
+            cache.bump("users")
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to update monthly_salary: {e}")
 
     if payload.deductions is not None:
         try:
-            client.sqlExec(f"DELETE FROM staff_deductions WHERE staff_id = '{sid}'")
-        except Exception:
-            pass
-        for d in payload.deductions:
-            type_str = (d.deduction_type or "").strip()
-            if not type_str:
-                type_str = "Deduction"
-            amt_cents = int(round((d.amount or 0) * 100))
-            client.sqlExec(
-                f"INSERT INTO staff_deductions (staff_id, deduction_type, amount) VALUES ('{sid}', '{_esc(type_str)}', {amt_cents})"
-            )
+            deductions.replace(client, staff_id, [deductions.item(d.deduction_type, d.amount) for d in payload.deductions])
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to update deductions: {e}")
         updates.append("deductions")
 
     return {"message": "Payroll updated", "updated": updates}
+
+
+def _payroll_period(period: Optional[str]) -> str:
+    if not period:
+        return datetime.now().strftime("%Y-%m")
+    try:
+        return datetime.strptime(period, "%Y-%m").strftime("%Y-%m")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="period must be YYYY-MM")
+
+
+def _active_staff(client) -> set:
+    return {
+        row[0]
+        for row in client.sqlQuery(q.select("users", ("username",), where=("role", "active")), {"role": "staff", "active": True})
+    }
+
+
+def _fallback_salaries(client) -> dict:
+    """Salary (cents) from staff_payroll, used when staff.monthly_salary is unset; the latest row per staff wins."""
+    return {staff_id: cents for staff_id, cents in client.sqlQuery(q.select("staff_payroll", ("staff_id", "salary_amount"), order_by="id"))}
+
+
+def _gross_cents(monthly_salary, fallback_cents) -> int:
+    return int(monthly_salary) * 100 if monthly_salary and monthly_salary > 0 else int(fallback_cents or 0)
+
+
+@router.post("/staff/deductions/bulk")
+def apply_bulk_deduction(payload: BulkDeductionRequest, current_username: Optional[str] = Query(None, alias="current_username")):
+    """
+    Set (or with remove, drop) one deduction type for every active staff member: a fixed amount, or
+    a rate as a percent of monthly salary. Only staff whose deduction actually changes are written,
+    all in one transaction. Admin or payables only.
+    """
+    deduction_type = (payload.deduction_type or "").strip()
+    if not deduction_type:
+        raise HTTPException(status_code=400, detail="deduction_type is required")
+    if not payload.remove and (payload.amount is None) == (payload.rate is None):
+        raise HTTPException(status_code=400, detail="Give either amount or rate")
+
+    client = get_db_client()
+    ensure_role(client, current_username or "guest", PAYROLL_ROLES)
+    try:
+        active = _active_staff(client)
+        fallback = _fallback_salaries(client)
+        existing = deductions.load(client)
+        changes = {}
+        for username, monthly_salary in client.sqlQuery(q.select("staff", ("username", "monthly_salary"), order_by="id")):
+            if username not in active:
+                continue
+            rows = existing.get(username, [])
+            wanted = [(t, a) for _, t, a in rows if t != deduction_type]
+            if not payload.remove:
+                if payload.rate is not None:
+                    cents = int(round(_gross_cents(monthly_salary, fallback.get(username)) * payload.rate / 100))
+                else:
+                    cents = deductions.item(deduction_type, payload.amount)[1]
+                wanted.append((deduction_type, cents))
+            change = deductions.diff(rows, wanted)
+            if any(change):
+                changes[username] = change
+        written = deductions.write(client, changes)
+        return {"message": "Deduction applied", "staff_updated": len(changes), "rows_written": written}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Bulk Deduction Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _load_payroll(client, period: str) -> tuple[dict, dict]:
+    """
+    Gross, deductions and net for every active staff member, from one bulk read each of users, staff,
+    staff_payroll, staff_deductions and this period's payroll disbursements. Amounts are worked out
+    in cents, the same way as get_staff_payroll. Returns the register and {staff_id: net pay in cents}.
+    """
+    description = f"Payroll {period}"
+    active = _active_staff(client)
+    staff_rows = client.sqlQuery(
+        q.select("staff", ("username", "first_name", "middle_name", "last_name", "position", "department", "monthly_salary"), order_by="id")
+    )
+    fallback = _fallback_salaries(client)
+    deductions_by_staff = deductions.load(client)
+    posted = {
+        staff_id: (txn_id, status)
+        for txn_id, staff_id, status in client.sqlQuery(
+            q.select("transactions", ("id", "staff_id", "status"), where=("category", "description"), order_by="id"),
+            {"category": PAYROLL_CATEGORY, "description": description},
+        )
+        if status not in ("Voided", "Rejected")  # Those can be posted again
+    }
+
+    entries, net_cents = [], {}
+    for username, first, middle, last, position, department, monthly_salary in staff_rows:
+        if username not in active:
+            continue
+        gross = _gross_cents(monthly_salary, fallback.get(username))
+        items = deductions_by_staff.get(username, [])
+        total_deductions = sum(amount for _, _, amount in items)
+        txn_id, txn_status = posted.get(username, (None, None))
+        net_cents[username] = max(0, gross - total_deductions)
+        entries.append({
+            "staff_id": username,
+            "name": " ".join(p for p in (first, middle, last) if p) or username,
+            "position": position,
+            "department": department,
+            "gross": gross / 100.0,
+            "deductions": [{"deduction_type": t, "amount": a / 100.0} for _, t, a in items],
+            "total_deductions": total_deductions / 100.0,
+            "net_pay": net_cents[username] / 100.0,
+            "transaction_id": txn_id,
+            "transaction_status": txn_status,
+        })
+
+    return {
+        "period": period,
+        "staff": entries,
+        "total_gross": sum(e["gross"] for e in entries),
+        "total_deductions": sum(e["total_deductions"] for e in entries),
+        "total_net": sum(e["net_pay"] for e in entries),
+        "posted": 0,
+    }, net_cents
+
+
+def _post_payroll(client, register: dict, net_cents: dict, recorded_by: str) -> int:
+    """
+    Post one Pending disbursement per staff member with net pay and nothing posted yet this period.
+    Call with the period's posting lock held and a register loaded under it (see run_payroll).
+    """
+    description = f"Payroll {register['period']}"
+    to_post = [e for e in register["staff"] if net_cents[e["staff_id"]] > 0 and e["transaction_id"] is None]
+    if not to_post:
+        return 0
+
+    columns = (
+        "recorded_by", "txn_type", "strand", "category", "description", "amount",
+        "status", "student_id", "staff_id", "proof_reference",
+    )
+    with rollups.writing():
+        for start in range(0, len(to_post), POST_CHUNK):
+            chunk = to_post[start : start + POST_CHUNK]
+            rows = [
+                (recorded_by, "Disbursement", "", PAYROLL_CATEGORY, description, net_cents[e["staff_id"]], "Pending", "", e["staff_id"], "")
+                for e in chunk
+            ]
+            client.sqlExec(q.insert_many("transactions", columns, len(rows), now=("created_at",)), q.row_params(columns, rows))
+
+        # Read back the generated ids (latest per staff member, in case of an earlier voided run)
+        created = {}
+        for txn_id, staff_id, created_at, amount in client.sqlQuery(
+            q.select("transactions", ("id", "staff_id", "created_at", "amount"), where=("category", "description", "recorded_by", "status"), order_by="id"),
+            {"category": PAYROLL_CATEGORY, "description": description, "recorded_by": recorded_by, "status": "Pending"},
+        ):
+            created[staff_id] = (txn_id, created_at, amount)
+
+        deltas = {}
+        posted_ids = []
+        for entry in to_post:
+            if entry["staff_id"] not in created:
+                continue
+            txn_id, created_at, amount = created[entry["staff_id"]]
+            entry["transaction_id"], entry["transaction_status"] = txn_id, "Pending"
+            posted_ids.append(txn_id)
+            rollups.change(deltas, {
+                "created_at": created_at, "txn_type": "Disbursement", "strand": "",
+                "category": PAYROLL_CATEGORY, "status": "Pending", "amount": amount,
+            })
+        rollups.apply(client, deltas)
+    ledger.record(client, posted_ids, "created")
+    cache.bump("transactions")
+
+    # Ledger keys for the new disbursements in one setAll, like POST /transactions/batch
+    try:
+        client.setAll({
+            f"txn:{txn_id}".encode("utf-8"): json.dumps({
+                "id": txn_id, "recorded_by": recorded_by, "amount": amount / 100.0, "type": "Disbursement",
+                "timestamp": str(created_at), "desc": description, "initial_status": "Pending",
+            }).encode("utf-8")
+            for txn_id, created_at, amount in created.values()
+            if txn_id in posted_ids
+        })
+    except Exception as e:
+        print(f"⚠️ Verification Storage Warning: {e}")
+
+    for entry in to_post:
+        if entry["transaction_id"] in posted_ids:
+            events.publish(
+                "created", entry["transaction_id"], txn_type="Disbursement", status="Pending", amount=entry["net_pay"],
+                student_id="", staff_id=entry["staff_id"], actor=recorded_by,
+            )
+    return len(posted_ids)
+
+
+@router.post("/staff/payroll/run", response_model=dict)
+def run_payroll(payload: PayrollRunRequest, current_username: Optional[str] = Query(None, alias="current_username")):
+    """
+    Payroll for all active staff for one month. With post_disbursements, also records each net pay
+    as a Pending "Teacher Salary" disbursement (skipping staff already posted for that month), ready
+    for the usual approval workflow (see PUT /transactions/approve-batch). Admin or payables only.
+    """
+    period = _payroll_period(payload.period)
+    client = get_db_client()
+    ensure_role(client, current_username or "guest", PAYROLL_ROLES)
+    try:
+        if not payload.post_disbursements:
+            return _load_payroll(client, period)[0]
+        os.makedirs(POST_LOCK_DIR, exist_ok=True)
+        try:
+            with shared.locked(os.path.join(POST_LOCK_DIR, f"{period}.lock"), POST_LOCK_WAIT_SECONDS):
+                # Loaded under the lock, so what an earlier run just posted counts as posted
+                register, net_cents = _load_payroll(client, period)
+                register["posted"] = _post_payroll(client, register, net_cents, current_username)
+        except TimeoutError:
+            raise HTTPException(status_code=409, detail=f"Payroll for {period} is being posted by another request; try again shortly")
+        return register
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Payroll Run Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/staff/payroll/register")
+def export_payroll_register(
+    current_username: Optional[str] = Query(None, alias="current_username"),
+    period: Optional[str] = None,
+):
+    """Payroll register for one month as CSV (one row per staff member, deductions itemized). Admin or payables only."""
+    period = _payroll_period(period)
+    client = get_db_client()
+    ensure_role(client, current_username or "guest", PAYROLL_ROLES)
+    try:
+        register, _ = _load_payroll(client, period)
+    except Exception as e:
+        print(f"Payroll Register Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    deduction_types = sorted({d["deduction_type"] for e in register["staff"] for d in e["deductions"]})
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["Payroll Register", period])
+    writer.writerow(["Staff ID", "Name", "Position", "Department", "Gross Pay", *deduction_types, "Total Deductions", "Net Pay", "Transaction", "Status"])
+    for e in register["staff"]:
+        by_type = {}
+        for d in e["deductions"]:
+            by_type[d["deduction_type"]] = by_type.get(d["deduction_type"], 0) + d["amount"]
+        writer.writerow([
+            e["staff_id"], e["name"], e["position"] or "", e["department"] or "", f"{e['gross']:.2f}",
+            *(f"{by_type.get(t, 0):.2f}" for t in deduction_types),
+            f"{e['total_deductions']:.2f}", f"{e['net_pay']:.2f}",
+            f"TX-{e['transaction_id']:05d}" if e["transaction_id"] else "", e["transaction_status"] or "",
+        ])
+    writer.writerow(["Total", "", "", "", f"{register['total_gross']:.2f}", *("" for _ in deduction_types), f"{register['total_deductions']:.2f}", f"{register['total_net']:.2f}", "", ""])
+    return Response(
+        content=out.getvalue().encode("utf-8-sig"),  # BOM so Excel on Windows reads UTF-8
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="payroll-register-{period}.csv"'},
+    )
@@ -0,0 +1,184 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Response
+
+from .. import queries as q
+from .. import statements
+from ..database import get_db_client
+from ..routers.transactions import ensure_role, get_user_role
+from ..schemas import StatementResponse
+
+router = APIRouter(tags=["Statements"])
+
+# Roles that may pull any student's statement (students may pull their own)
+STATEMENT_ROLES = ["admin", "payables", "bookkeeper"]
+# Students per IN (...) lookup
+CHUNK_SIZE = 500
+# Payments in these states are listed but don't count towards Total Paid
+UNCOUNTED_STATUSES = ("Pending", "Rejected", "Voided")
+
+STUDENT_COLUMNS = ("username", "first_name", "middle_name", "last_name", "strand", "section", "payment_plan")
+PAYMENT_COLUMNS = ("id", "created_at", "student_id", "category", "description", "amount", "status", "proof_reference")
+
+ASSIGNMENTS_QUERY = """
+    SELECT ba.id, ba.bill_id, ba.student_id, ba.amount, ba.paid_amount, ba.status, b.bill_type, b.description, b.created_at
+    FROM bill_assignments ba
+    LEFT JOIN bills b ON ba.bill_id = b.id
+    WHERE {condition}
+"""
+
+
+def _chunks(values):
+    for start in range(0, len(values), CHUNK_SIZE):
+        yield values[start : start + CHUNK_SIZE]
+
+
+def _tuition_allocations(client):
+    """(name, share) of each financial allocation item; shares sum to 1."""
+    try:
+        rows = client.sqlQuery(q.select("financial_allocations", ("name", "amount"), order_by="id ASC"))
+    except Exception:
+        return []  # No allocations table yet
+    total = sum(amount for _, amount in rows)
+    return [(name, amount / total) for name, amount in rows] if total else []
+
+
+def _load_statements(client, students) -> list:
+    """
+    Statements for `students` (STUDENT_COLUMNS rows) from bulk reads: one query per chunk of students
+    for bill assignments and for payments, plus one for the allocation items.
+    """
+    student_ids = [row[0] for row in students]
+    by_student = {
+        row[0]: {
+            "student_id": row[0],
+            "name": " ".join(part for part in row[1:4] if part) or row[0],
+            "strand": row[4],
+            "section": row[5],
+            "payment_plan": row[6],
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M"),
+            "bills": [],
+            "payments": [],
+            "allocations": [],
+        }
+        for row in students
+    }
+
+    for chunk in _chunks(student_ids):
+        cond, params = q.in_list("ba.student_id", chunk, prefix="student_id")
+        for row in client.sqlQuery(ASSIGNMENTS_QUERY.format(condition=cond), params):
+            assignment_id, bill_id, student_id, amount, paid, status, bill_type, description, billed_on = row
+            by_student[student_id]["bills"].append({
+                "assignment_id": assignment_id,
+                "bill_id": bill_id,
+                "bill_type": bill_type,
+                "description": description,
+                "billed_on": str(billed_on)[:10] if billed_on else "",
+                "amount": amount / 100.0,
+                "paid_amount": paid / 100.0,
+                "balance": (amount - paid) / 100.0,
+                "status": status,
+            })
+
+        cond, params = q.in_list("student_id", chunk)
+        for row in client.sqlQuery(
+            q.select("transactions", PAYMENT_COLUMNS, where=(cond, "txn_type"), order_by="id"),
+            {**params, "txn_type": "Collection"},
+        ):
+            txn_id, created_at, student_id, category, description, amount, status, proof_reference = row
+            by_student[student_id]["payments"].append({
+                "txn_id": txn_id,
+                "date": str(created_at)[:10],
+                "category": category,
+                "description": description,
+                "amount": amount / 100.0,
+                "status": status,
+                "proof_reference": proof_reference,
+            })
+
+    allocations = _tuition_allocations(client)
+    for statement in by_student.values():
+        statement["bills"].sort(key=lambda b: (b["billed_on"], b["assignment_id"]))
+        statement["total_billed"] = sum(b["amount"] for b in statement["bills"])
+        statement["balance"] = sum(b["balance"] for b in statement["bills"])
+        statement["total_paid"] = sum(
+            p["amount"] for p in statement["payments"] if p["status"] not in UNCOUNTED_STATUSES
+        )
+        # The student's tuition split the same way as the school's allocation plan
+        tuition = sum(b["amount"] for b in statement["bills"] if b["bill_type"] == "Tuition")
+        if tuition:
+            statement["allocations"] = [{"name": name, "amount": round(tuition * share, 2)} for name, share in allocations]
+    return [by_student[student_id] for student_id in student_ids]
+
+
+def _statement_response(statement: dict, fmt: str):
+    if fmt == "json":
+        return statement
+    media_type = "text/html" if fmt == "html" else "text/csv"
+    return Response(
+        content=statements.render(statement, fmt),
+        media_type=f"{media_type}; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="statement-{statement["student_id"]}.{fmt}"'},
+    )
+
+
+@router.get("/statements/batch")
+def download_statements_batch(username: str, strand: Optional[str] = None, section: Optional[str] = None, format: str = "html"):
+    """
+    Statements for every student in a strand and/or section as a zip (one HTML or CSV file per
+    student plus summary.csv). Reads are bulk; large batches render in parallel worker processes.
+    """
+    if format not in statements.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(statements.FORMATS)}")
+    if not strand and not section:
+        raise HTTPException(status_code=400, detail="Give a strand, a section, or both")
+
+    client = get_db_client()
+    try:
+        ensure_role(client, username, STATEMENT_ROLES)
+        filters = {"strand": strand, "section": section}
+        params = {k: v for k, v in filters.items() if v}
+        students = client.sqlQuery(
+            q.select("students", STUDENT_COLUMNS, where=tuple(params), order_by="id"), params
+        )
+        if not students:
+            raise HTTPException(status_code=404, detail="No students match")
+
+        archive = statements.build_archive(_load_statements(client, students), format)
+        label = "-".join(v for v in (strand, section) if v)
+        filename = f"statements-{label}-{datetime.now():%Y%m%d}.zip".replace(" ", "_")
+        return Response(
+            content=archive,
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Statement Batch Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/statements/{student_id}", response_model=StatementResponse)
+def get_statement(student_id: str, username: str, format: str = "json"):
+    """A student's statement of account: bills with balances, payments and where their tuition goes."""
+    if format not in ("json",) + statements.FORMATS:
+        raise HTTPException(status_code=400, detail="format must be json, html or csv")
+
+    client = get_db_client()
+    try:
+        if username != student_id:
+            ensure_role(client, username, STATEMENT_ROLES)
+        elif get_user_role(client, username) != "student":
+            raise HTTPException(status_code=403, detail="Access denied")
+
+        students = client.sqlQuery(q.select("students", STUDENT_COLUMNS, where=("username",)), {"username": student_id})
+        if not students:
+            raise HTTPException(status_code=404, detail="Student not found")
+        return _statement_response(_load_statements(client, students[:1])[0], format)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Statement Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,83 +1,49 @@
-from fastapi import APIRouter
+from datetime import date, timedelta
+from typing import Optional
 
+from fastapi import APIRouter, HTTPException, Query, Request
+
+from .. import ledger, rollups
+from .. import queries as q
+from ..cache import cached_response
 from ..database import get_db_client
-from ..schemas import DashboardStats
+from ..schemas import BreakdownResponse, DashboardStats, TrendsResponse
 
 router = APIRouter(tags=["Statistics"])
 
 
+def _compute_stats():
+    # Columnar copy of the ledger, refreshed incrementally (see ledger.py)
+    snap = ledger.snapshot(get_db_client)
+
+    pending_mask = snap.where("status", "Pending")
+    counted = ~pending_mask
+    collections = counted & snap.where("txn_type", "Collection")
+    disbursements = counted & snap.where("txn_type", "Disbursement")
+
+    # Amounts are integer cents; sum exactly, convert to float at the end
+    def pesos(totals):
+        return {(category or "Uncategorized"): cents / 100.0 for category, cents in totals.items()}
+
+    collections_by_category = pesos(snap.sum_by("category", collections))
+    disbursements_by_category = pesos(snap.sum_by("category", disbursements))
+
+    return {
+        "total_tuition": collections_by_category.get("Tuition Fee", 0.0),
+        "total_misc": collections_by_category.get("Miscellaneous Fee", 0.0),
+        "total_org": collections_by_category.get("Organization Fund", 0.0),
+        "total_expenses": int(snap.amount[disbursements].sum()) / 100.0,
+        "pending_count": int(pending_mask.sum()),
+        "collections_by_category": collections_by_category,
+        "disbursements_by_category": disbursements_by_category,
+        "monthly_collections": pesos(snap.sum_by_month(collections)),
+    }
+
+
 @router.get("/stats", response_model=DashboardStats)
-def get_stats():
-    client = get_db_client()
+def get_stats(request: Request):
     try:
-        # We fetch minimal columns needed for calculation including date for monthly trends
-        result = client.sqlQuery(
-            "SELECT txn_type, category, amount, status, created_at FROM transactions"
-        )
-
-        tuition = 0.0
-        misc = 0.0
-        org = 0.0
-        expenses = 0.0
-        pending = 0
-
-        collections_by_category = {}
-        disbursements_by_category = {}
-
-        def bump(map_obj, key, amt):
-            map_obj[key] = map_obj.get(key, 0) + amt
-
-        for row in result:
-            txn_type = row[0]
-            category = row[1] or "Uncategorized"
-            # Amount is stored as integer cents in DB, convert to float
-            amount = row[2] / 100.0
-            status = row[3]
-
-            if status == "Pending":
-                pending += 1
-                continue
-
-            if txn_type == "Disbursement":
-                expenses += amount
-                bump(disbursements_by_category, category, amount)
-            elif txn_type == "Collection":
-                if category == "Tuition Fee":
-                    tuition += amount
-                elif category == "Miscellaneous Fee":
-                    misc += amount
-                elif category == "Organization Fund":
-                    org += amount
-                bump(collections_by_category, category, amount)
-
-        # Calculate monthly collection trends
-        monthly_collections = {}
-        for row in result:
-            txn_type = row[0]
-            amount = row[2] / 100.0
-            status = row[3]
-            created_at = row[4] if len(row) > 4 else None
-            
-            if txn_type == "Collection" and status != "Pending" and created_at:
-                # Extract month from timestamp (YYYY-MM format)
-                try:
-                    created_at_str = str(created_at)
-                    if len(created_at_str) >= 7:
-                        month_key = created_at_str[:7]  # Get YYYY-MM
-                        monthly_collections[month_key] = monthly_collections.get(month_key, 0) + amount
-                except Exception:
-                    pass
-        
-        return {
-            "total_tuition": tuition,
-            "total_misc": misc,
-            "total_org": org,
-            "total_expenses": expenses,
-            "pending_count": pending,
-            "collections_by_category": collections_by_category,
-            "disbursements_by_category": disbursements_by_category,
-            "monthly_collections": monthly_collections,
-        }
+        return cached_response(request, ("transactions",), DashboardStats, _compute_stats)
     except Exception as e:
         print(f"Stats Error: {e}")
         # Return zeros on error so the dashboard doesn't crash completely
@@ -91,3 +57,188 @@ def get_stats():
             "disbursements_by_category": {},
             "monthly_collections": {},
         }
+
+
+GRANULARITIES = ("day", "week", "month")
+
+
+def _period(day: str, granularity: str) -> str:
+    if granularity == "month":
+        return day[:7]
+    if granularity == "week":
+        d = date.fromisoformat(day)
+        return (d - timedelta(days=d.weekday())).isoformat()  # Monday
+    return day
+
+
+def _parse_day(value: Optional[str], name: str) -> Optional[str]:
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value[:10]).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"'{name}' must be a date (YYYY-MM-DD)")
+
+
+def _compute_trends(from_day, to_day, granularity, txn_type, category, status):
+    client = get_db_client()
+    rollups.repair(client)  # Days whose rollup update failed are recomputed first
+    where, params = [], {}
+    if from_day:
+        where.append("day >= @from_day")
+        params["from_day"] = from_day
+    if to_day:
+        where.append("day <= @to_day")
+        params["to_day"] = to_day
+    if txn_type:
+        where.append("txn_type")
+        params["txn_type"] = txn_type
+    if category:
+        where.append("category")
+        params["category"] = category
+    if status:
+        where.append("status")
+        params["status"] = status
+    else:
+        # Same rule as /stats: pending transactions don't count yet
+        where.append("status != @pending")
+        params["pending"] = "Pending"
+
+    points = {}
+    for day, row_type, total, count in client.sqlQuery(
+        q.select(rollups.TABLE, ("day", "txn_type", "total", "txn_count"), where=tuple(where)), params
+    ):
+        if not total and not count:
+            continue
+        point = points.setdefault(
+            _period(day, granularity), {"period": _period(day, granularity), "total": 0.0, "count": 0, "by_type": {}}
+        )
+        point["total"] += total / 100.0
+        point["count"] += count
+        point["by_type"][row_type] = point["by_type"].get(row_type, 0) + total / 100.0
+
+    ordered = [points[p] for p in sorted(points)]
+    return {
+        "granularity": granularity,
+        "from_date": from_day,
+        "to_date": to_day,
+        "total": sum(p["total"] for p in ordered),
+        "points": ordered,
+    }
+
+
+@router.get("/stats/trends", response_model=TrendsResponse)
+def get_trends(
+    request: Request,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    granularity: str = "month",
+    txn_type: Optional[str] = None,
+    category: Optional[str] = None,
+    status: Optional[str] = None,
+):
+    """
+    Collection/disbursement totals per day, week (keyed by its Monday) or month between `from` and `to`
+    (inclusive, UTC dates), read from the txn_rollup table instead of the ledger.
+    """
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    from_day = _parse_day(from_date, "from")
+    to_day = _parse_day(to_date, "to")
+    try:
+        return cached_response(
+            request,
+            ("transactions",),
+            TrendsResponse,
+            lambda: _compute_trends(from_day, to_day, granularity, txn_type, category, status),
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Trends Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+BREAKDOWN_DIMENSIONS = ("strand", "category", "txn_type", "status", "month")
+
+
+def _compute_breakdown(dimensions, from_day, to_day, filters):
+    client = get_db_client()
+    rollups.repair(client)  # Days whose rollup update failed are recomputed first
+    where, params = [], {}
+    if from_day:
+        where.append("day >= @from_day")
+        params["from_day"] = from_day
+    if to_day:
+        where.append("day <= @to_day")
+        params["to_day"] = to_day
+    for column, value in filters.items():
+        if value:
+            where.append(column)
+            params[column] = value
+    if not filters.get("status") and "status" not in dimensions:
+        # Same rule as /stats: pending transactions don't count yet
+        where.append("status != @pending")
+        params["pending"] = "Pending"
+
+    # Sum integer cents and only convert at the end, so totals are exact
+    groups = {}
+    rows = client.sqlQuery(q.select(rollups.TABLE, rollups.KEY_COLUMNS + ("total", "txn_count"), where=tuple(where)), params)
+    for day, txn_type, strand, category, status, total, count in rows:
+        if not total and not count:
+            continue
+        values = {"strand": strand, "category": category, "txn_type": txn_type, "status": status, "month": day[:7]}
+        key = tuple(values[d] for d in dimensions)
+        entry = groups.setdefault(key, [0, 0])
+        entry[0] += total
+        entry[1] += count
+
+    return {
+        "group_by": list(dimensions),
+        "total": sum(t for t, _ in groups.values()) / 100.0,
+        "count": sum(c for _, c in groups.values()),
+        "groups": [
+            {"key": dict(zip(dimensions, key)), "total": total / 100.0, "count": count}
+            for key, (total, count) in sorted(groups.items())
+        ],
+    }
+
+
+@router.get("/stats/breakdown", response_model=BreakdownResponse)
+def get_breakdown(
+    request: Request,
+    group_by: str = "strand,category",
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    txn_type: Optional[str] = None,
+    strand: Optional[str] = None,
+    category: Optional[str] = None,
+    status: Optional[str] = None,
+):
+    """
+    Whole-ledger totals grouped by any comma-separated combination of strand, category, txn_type,
+    status and month, read from the txn_rollup table. Pending transactions are left out unless
+    grouping or filtering by status.
+    """
+    dimensions = tuple(dict.fromkeys(d.strip() for d in group_by.split(",") if d.strip()))
+    unknown = [d for d in dimensions if d not in BREAKDOWN_DIMENSIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown group_by {', '.join(unknown)}; use any of: {', '.join(BREAKDOWN_DIMENSIONS)}",
+        )
+    from_day = _parse_day(from_date, "from")
+    to_day = _parse_day(to_date, "to")
+    filters = {"txn_type": txn_type, "strand": strand, "category": category, "status": status}
+    try:
+        return cached_response(
+            request,
+            ("transactions",),
+            BreakdownResponse,
+            lambda: _compute_breakdown(dimensions, from_day, to_day, filters),
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Breakdown Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,15 +1,25 @@
+import asyncio
 import binascii
+import csv
 import hashlib
+import io
 import json
 from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
 
+from .. import attachments, cache, events, idempotency, ledger, rollups, search
+from .. import queries as q
 from ..database import get_db_client
 from ..schemas import (
     AdminActionRequest,
     ApprovalRequest,
+    BatchApprovalRequest,
+    TransactionChanges,
     TransactionCreate,
     TransactionResponse,
     TransactionUpdateAdmin,
@@ -17,17 +27,31 @@ from ..schemas import (
 
 router = APIRouter(tags=["Transactions"])
 
+TXN_COLUMNS = (
+    "id", "created_at", "recorded_by", "txn_type", "strand", "category",
+    "description", "amount", "status", "student_id", "staff_id", "approved_by",
+    "approval_date", "proof_reference",
+)
+TXN_COLUMNS_NO_STAFF = tuple(c for c in TXN_COLUMNS if c != "staff_id")
+# What status-changing paths read first: workflow/event fields plus what the rollup needs
+TXN_STATE_COLUMNS = ("student_id", "staff_id") + rollups.ROW_COLUMNS
 
-def _esc(s: str) -> str:
-    return (s or "").replace("'", "''")
+MAX_BATCH_SIZE = 500
+# Roles in the approval workflow (see _next_status)
+APPROVER_ROLES = ("admin", "vp_finance", "president")
+# Rows per multi-row INSERT in POST /transactions/batch
+BATCH_INSERT_CHUNK = 100
+BATCH_TXN_TYPES = ("Collection", "Disbursement")
+MAX_CHANGES = 1000
+MAX_SEARCH_RESULTS = 200
 
 
 def get_user_role(client, username: str):
     """Get user role and active status (role is stored directly in users: admin, payables, student, staff, etc.)."""
     try:
-        un = _esc(username)
         res = client.sqlQuery(
-            f"SELECT role, active FROM users WHERE username = '{un}'"
+            q.select("users", ("role", "active"), where=("username",)),
+            {"username": username},
         )
         if not res or not res[0][1]:  # Not found or not active
             return None
@@ -53,8 +77,26 @@ def ensure_role(client, username: str, allowed_roles: list):
         )
 
 
+def _cents(amount: float) -> int:
+    """Pesos to integer cents, rounded (int(20.29 * 100) would give 2028)."""
+    return int(round(amount * 100))
+
+
+def _inserted_ids(result, table: str) -> list:
+    """Ids auto-assigned to the rows of one multi-row INSERT, from its sqlExec result (consecutive within the statement)."""
+    txs = getattr(result, "txs", None)
+    if not txs or table not in txs[0].firstInsertedPKs:
+        return []
+    return list(range(txs[0].firstInsertedPKs[table].n, txs[0].lastInsertedPKs[table].n + 1))
+
+
 @router.post("/transactions", response_model=TransactionResponse)
-def create_transaction(txn: TransactionCreate):
+def create_transaction(txn: TransactionCreate, response: Response, idempotency_key: Optional[str] = Header(None)):
+    """Record a transaction. A retry carrying the same Idempotency-Key header gets the original result back."""
+    return idempotency.run("transactions", txn.recorded_by, idempotency_key, txn, response, lambda: _create_transaction(txn))
+
+
+def _create_transaction(txn: TransactionCreate):
     client = get_db_client()
     try:
         # Role-based permission: Only Payables Associate, Bookkeeper, Procurement, and Admin can create transactions
@@ -68,55 +110,68 @@ def create_transaction(txn: TransactionCreate):
             status = "Approved"  # Collections are auto-approved
 
         # Convert float to integer cents for storage
-        amount_cents = int(txn.amount * 100)
-
-        query = f"""
-            INSERT INTO transactions (
-                created_at, recorded_by, txn_type, strand, category,
-                description, amount, status, student_id, staff_id, proof_reference
-            ) VALUES (
-                NOW(), '{txn.recorded_by}', '{txn.txn_type}', '{txn.strand}', '{txn.category}',
-                '{txn.description}', {amount_cents}, '{status}', '{txn.student_id or ""}', '{txn.staff_id or ""}', '{txn.proof_reference or ""}'
+        amount_cents = _cents(txn.amount)
+
+        params = {
+            "recorded_by": txn.recorded_by,
+            "txn_type": txn.txn_type,
+            "strand": txn.strand,
+            "category": txn.category,
+            "description": txn.description,
+            "amount": amount_cents,
+            "status": status,
+            "student_id": txn.student_id or "",
+            "staff_id": txn.staff_id or "",
+            "proof_reference": txn.proof_reference or "",
+        }
+        with rollups.writing():
+            try:
+                client.sqlExec(q.insert("transactions", tuple(params), now=("created_at",)), params)
+            except Exception:
+                # Old schema without staff_id
+                params.pop("staff_id")
+                client.sqlExec(q.insert("transactions", tuple(params), now=("created_at",)), params)
+            idempotency.committed()
+
+            # Fetch back the latest transaction for this user to get the generated ID
+            res = client.sqlQuery(
+                q.select("transactions", ("id", "created_at"), where=("recorded_by",), order_by="id DESC", limit=1),
+                {"recorded_by": txn.recorded_by},
             )
-        """
-        try:
-            client.sqlExec(query)
-        except Exception:
-            query_old = f"""
-                INSERT INTO transactions (
-                    created_at, recorded_by, txn_type, strand, category,
-                    description, amount, status, student_id, proof_reference
-                ) VALUES (
-                    NOW(), '{txn.recorded_by}', '{txn.txn_type}', '{txn.strand}', '{txn.category}',
-                    '{txn.description}', {amount_cents}, '{status}', '{txn.student_id or ""}', '{txn.proof_reference or ""}'
+
+            if not res:
+                raise HTTPException(
+                    status_code=500,
+                    detail="Transaction created but could not be retrieved",
                 )
-            """
-            client.sqlExec(query_old)
 
-        # Fetch back the latest transaction for this user to get the generated ID
-        res = client.sqlQuery(
-            f"SELECT id, created_at FROM transactions WHERE recorded_by='{txn.recorded_by}' ORDER BY id DESC LIMIT 1"
+            new_id = res[0][0]
+            created_at = res[0][1]
+            idempotency.committed(new_id)
+            deltas = {}
+            rollups.change(deltas, {**params, "created_at": created_at})
+            rollups.apply(client, deltas)
+        ledger.record(client, [new_id], "created")
+        attachments.link(client, txn.proof_reference, new_id)
+        cache.bump("transactions")
+        events.publish(
+            "created", new_id, txn_type=txn.txn_type, status=status, amount=txn.amount,
+            student_id=txn.student_id, staff_id=txn.staff_id, actor=txn.recorded_by,
         )
 
-        if not res:
-            raise HTTPException(
-                status_code=500,
-                detail="Transaction created but could not be retrieved",
-            )
-
-        new_id = res[0][0]
-        created_at = res[0][1]
-
         # If this is a Collection transaction with a student_id, update bill balances
         if txn.txn_type == "Collection" and txn.student_id:
             try:
                 # Get all pending/partial bill assignments for this student
-                bill_res = client.sqlQuery(f"""
-                    SELECT id, amount, paid_amount
-                    FROM bill_assignments
-                    WHERE student_id = '{txn.student_id}' AND status IN ('Pending', 'Partial')
-                    ORDER BY id ASC
-                """)
+                bill_res = client.sqlQuery(
+                    q.select(
+                        "bill_assignments",
+                        ("id", "amount", "paid_amount"),
+                        where=("student_id", "status IN ('Pending', 'Partial')"),
+                        order_by="id ASC",
+                    ),
+                    {"student_id": txn.student_id},
+                )
                 
                 remaining_payment = amount_cents
                 for bill_assignment in bill_res:
@@ -133,13 +188,13 @@ def create_transaction(txn: TransactionCreate):
                         new_paid = paid_amount + payment_to_apply
                         new_status = "Paid" if new_paid >= bill_amount else "Partial"
                         
-                        client.sqlExec(f"""
-                            UPDATE bill_assignments
-                            SET paid_amount = {new_paid}, status = '{new_status}'
-                            WHERE id = {assignment_id}
-                        """)
+                        client.sqlExec(
+                            q.update("bill_assignments", ("paid_amount", "status")),
+                            {"paid_amount": new_paid, "status": new_status, "id": assignment_id},
+                        )
                         
                         remaining_payment -= payment_to_apply
+                cache.bump("bills")
             except Exception as e:
                 print(f"⚠️  Bill balance update warning: {e}")
                 # Don't fail the transaction if bill update fails
@@ -192,6 +247,249 @@ def create_transaction(txn: TransactionCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _parse_batch_csv(text: str) -> list:
+    """CSV rows as (line number, dict) keyed by the lowercased header (same names as TransactionCreate)."""
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or not {"txn_type", "amount"} <= {(h or "").strip().lower() for h in reader.fieldnames}:
+        raise HTTPException(status_code=400, detail="CSV needs a header row with at least txn_type and amount")
+    entries = []
+    for row in reader:
+        values = {(k or "").strip().lower(): (v or "").strip() for k, v in row.items() if k}
+        if any(values.values()):
+            entries.append((reader.line_num, values))
+    return entries
+
+
+def _validate_batch(client, recorded_by: str, entries: list) -> tuple[list, dict]:
+    """Validate every entry together: ([(row, TransactionCreate)], {row: error}). Student ids are checked in bulk."""
+    valid, errors = [], {}
+    for row, values in entries:
+        try:
+            txn = TransactionCreate.model_validate(
+                {"strand": "", "category": "", "description": "", **{k: v for k, v in values.items() if v != ""}, "recorded_by": recorded_by}
+            )
+        except ValidationError as e:
+            first = e.errors()[0]
+            errors[row] = f"{'.'.join(str(p) for p in first['loc'])}: {first['msg']}"
+            continue
+        if txn.txn_type not in BATCH_TXN_TYPES:
+            errors[row] = f"txn_type must be one of: {', '.join(BATCH_TXN_TYPES)}"
+        elif txn.amount <= 0:
+            errors[row] = "amount must be positive"
+        else:
+            valid.append((row, txn))
+
+    student_ids = sorted({txn.student_id for _, txn in valid if txn.student_id})
+    known = set()
+    for start in range(0, len(student_ids), MAX_BATCH_SIZE):
+        cond, params = q.in_list("username", student_ids[start : start + MAX_BATCH_SIZE])
+        known.update(r[0] for r in client.sqlQuery(q.select("students", ("username",), where=(cond,)), params))
+    for row, txn in valid:
+        if txn.student_id and txn.student_id not in known:
+            errors[row] = f"Unknown student: {txn.student_id}"
+    return [(row, txn) for row, txn in valid if row not in errors], errors
+
+
+def _allocate_payments(client, payments: list):
+    """
+    Apply collections [(student_id, cents)] to their oldest Pending/Partial bill assignments, like
+    create_transaction does one at a time: one bulk read, then one UPDATE per assignment that changed,
+    committed together.
+    """
+    student_ids = sorted({student_id for student_id, _ in payments})
+    open_bills = {}
+    for start in range(0, len(student_ids), MAX_BATCH_SIZE):
+        cond, params = q.in_list("student_id", student_ids[start : start + MAX_BATCH_SIZE])
+        for assignment_id, student_id, amount, paid in client.sqlQuery(
+            q.select("bill_assignments", ("id", "student_id", "amount", "paid_amount"), where=(cond, "status IN ('Pending', 'Partial')"), order_by="id ASC"),
+            params,
+        ):
+            open_bills.setdefault(student_id, []).append([assignment_id, amount, paid])
+
+    changed = {}
+    for student_id, cents in payments:
+        for assignment in open_bills.get(student_id, []):
+            if cents <= 0:
+                break
+            assignment_id, amount, paid = assignment
+            applied = min(cents, amount - paid)
+            if applied > 0:
+                assignment[2] = paid + applied
+                changed[assignment_id] = (assignment[2], "Paid" if assignment[2] >= amount else "Partial")
+                cents -= applied
+
+    statements, params = [], {}
+    for i, (assignment_id, (paid, status)) in enumerate(changed.items()):
+        statements.append(f"UPDATE bill_assignments SET paid_amount = @paid{i}, status = @status{i} WHERE id = @id{i}")
+        params.update({f"paid{i}": paid, f"status{i}": status, f"id{i}": assignment_id})
+    if statements:
+        client.sqlExec("BEGIN TRANSACTION; " + "; ".join(statements) + "; COMMIT;", params)
+        cache.bump("bills")
+
+
+def _create_batch(recorded_by: str, entries: list) -> dict:
+    if not entries:
+        return {"created": 0, "failed": 0, "results": []}
+    if len(entries) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} transactions per batch")
+
+    client = get_db_client()
+    try:
+        ensure_role(client, recorded_by, ["payables", "bookkeeper", "procurement", "admin"])
+        valid, errors = _validate_batch(client, recorded_by, entries)
+
+        columns = ("recorded_by", "txn_type", "strand", "category", "description", "amount", "status", "student_id", "staff_id", "proof_reference")
+        rows = [
+            (
+                recorded_by, txn.txn_type, txn.strand, txn.category, txn.description, _cents(txn.amount),
+                # Only Disbursement requires the approval workflow; collections are auto-approved
+                "Pending" if txn.txn_type == "Disbursement" else "Approved",
+                txn.student_id or "", txn.staff_id or "", txn.proof_reference or "",
+            )
+            for _, txn in valid
+        ]
+        # Each chunk is its own transaction; a failed chunk fails only its rows
+        with rollups.writing():
+            inserted, saved = [], []
+            for start in range(0, len(rows), BATCH_INSERT_CHUNK):
+                chunk = rows[start : start + BATCH_INSERT_CHUNK]
+                chunk_valid = valid[start : start + BATCH_INSERT_CHUNK]
+                try:
+                    result = client.sqlExec(q.insert_many("transactions", columns, len(chunk), now=("created_at",)), q.row_params(columns, chunk))
+                except Exception as e:
+                    print(f"Batch Txn Insert Error: {e}")
+                    for row, _ in chunk_valid:
+                        errors[row] = f"Insert failed: {e}"
+                    continue
+                inserted.extend(chunk_valid)
+                # The chunk's ids come back with its result, in row order
+                ids = _inserted_ids(result, "transactions")
+                if len(ids) != len(chunk):
+                    print(f"⚠️ Batch Txn Insert Warning: expected {len(chunk)} ids, got {len(ids)}")
+                    continue
+                created_at = dict(client.sqlQuery(
+                    q.select("transactions", ("id", "created_at"), where=("id >= @first_id", "id <= @last_id")),
+                    {"first_id": ids[0], "last_id": ids[-1]},
+                ))
+                for (row, txn), values, txn_id in zip(chunk_valid, chunk, ids):
+                    saved.append((row, txn, dict(zip(columns, values)), txn_id, created_at.get(txn_id)))
+
+            deltas = {}
+            for _, _, params, _, created_at in saved:
+                rollups.change(deltas, {**params, "created_at": created_at})
+            rollups.apply(client, deltas)
+        ledger.record(client, [txn_id for _, _, _, txn_id, _ in saved], "created")
+        for _, txn, _, txn_id, _ in saved:
+            attachments.link(client, txn.proof_reference, txn_id)
+        cache.bump("transactions")
+
+        payments = [(txn.student_id, params["amount"]) for _, txn, params, _, _ in saved if txn.txn_type == "Collection" and txn.student_id]
+        if payments:
+            try:
+                _allocate_payments(client, payments)
+            except Exception as e:
+                print(f"⚠️  Bill balance update warning: {e}")
+
+        # Ledger keys for every new transaction in one setAll (the same txn:<id> entries /verify checks)
+        try:
+            client.setAll({
+                f"txn:{txn_id}".encode("utf-8"): json.dumps({
+                    "id": txn_id, "recorded_by": recorded_by, "amount": txn.amount, "type": txn.txn_type,
+                    "timestamp": str(created_at), "desc": txn.description, "initial_status": params["status"],
+                }).encode("utf-8")
+                for _, txn, params, txn_id, created_at in saved
+            })
+            stored = True
+        except Exception as e:
+            print(f"⚠️ Verification Storage Warning: {e}")
+            stored = False
+
+        results = {row: {"row": row, "success": False, "detail": detail} for row, detail in errors.items()}
+        for row, txn, params, txn_id, _ in saved:
+            events.publish(
+                "created", txn_id, txn_type=txn.txn_type, status=params["status"], amount=txn.amount,
+                student_id=txn.student_id, staff_id=txn.staff_id, actor=recorded_by,
+            )
+            results[row] = {
+                "row": row, "success": True, "id": txn_id, "status": params["status"],
+                # setAll writes the keys without a verification proof, unlike the verifiedSet in create_transaction
+                "tx_hash": f"KEY-{txn_id}" if stored else f"PENDING-{txn_id}",
+            }
+        for row, _ in inserted:
+            results.setdefault(row, {"row": row, "success": False, "detail": "Inserted but could not be read back"})
+        return {
+            "created": len(saved),
+            "failed": len(entries) - len(saved),
+            "results": [results[row] for row, _ in entries],
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Batch Txn Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/transactions/batch")
+async def create_transactions_batch(request: Request, recorded_by: Optional[str] = None):
+    """
+    Post up to MAX_BATCH_SIZE transactions at once (e.g. a day's receipts): a JSON body
+    {"recorded_by": ..., "transactions": [TransactionCreate fields, ...]}, or a CSV upload (multipart
+    field "file", or a text/csv body) with TransactionCreate column names and recorded_by as a query or
+    form field. Rows are validated together and authorized once; valid ones are inserted in chunks,
+    applied to bills in bulk and get their ledger keys in one setAll. Each row reports its own outcome
+    ("row" is the position in the list, or the CSV line number).
+    """
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=400, detail="Upload the CSV as the 'file' field")
+            recorded_by = form.get("recorded_by") or recorded_by
+            entries = _parse_batch_csv((await upload.read()).decode("utf-8-sig"))
+        elif content_type.startswith("text/csv"):
+            entries = _parse_batch_csv((await request.body()).decode("utf-8-sig"))
+        else:
+            payload = await request.json()
+            recorded_by = payload.get("recorded_by") or recorded_by
+            items = payload.get("transactions")
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                raise HTTPException(status_code=400, detail="transactions must be a list of objects")
+            entries = list(enumerate(items, start=1))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV must be UTF-8")
+    except (ValueError, AttributeError):
+        raise HTTPException(status_code=400, detail="Body must be a JSON object or a CSV file")
+    if not recorded_by:
+        raise HTTPException(status_code=400, detail="recorded_by is required")
+    return await run_in_threadpool(_create_batch, recorded_by, entries)
+
+
+def _txn_response(row, has_staff_col: bool = True) -> dict:
+    """A TXN_COLUMNS (or TXN_COLUMNS_NO_STAFF) row as a TransactionResponse dict, with its content hash."""
+    content_str = f"{row[0]}|{row[1]}|{row[2]}|{row[3]}|{row[7]}|{row[8]}"
+    tx_hash_bytes = hashlib.sha256(content_str.encode()).digest()
+    tx_hash = binascii.hexlify(tx_hash_bytes).decode("utf-8")
+    if has_staff_col:
+        # 0 id, 1 created_at, 2 recorded_by, 3 txn_type, 4 strand, 5 category, 6 description, 7 amount, 8 status, 9 student_id, 10 staff_id, 11 approved_by, 12 approval_date, 13 proof_reference
+        return {
+            "id": row[0], "created_at": str(row[1]), "recorded_by": row[2], "txn_type": row[3], "strand": row[4],
+            "category": row[5], "description": row[6], "amount": row[7] / 100.0, "status": row[8],
+            "student_id": row[9], "staff_id": row[10] if len(row) > 10 else None,
+            "approved_by": row[11] if len(row) > 11 else None, "approval_date": str(row[12]) if len(row) > 12 and row[12] else None,
+            "proof_reference": row[13] if len(row) > 13 else None, "tx_hash": tx_hash,
+        }
+    # 0 id, 1 created_at, 2 recorded_by, 3 txn_type, 4 strand, 5 category, 6 description, 7 amount, 8 status, 9 student_id, 10 approved_by, 11 approval_date, 12 proof_reference
+    return {
+        "id": row[0], "created_at": str(row[1]), "recorded_by": row[2], "txn_type": row[3], "strand": row[4],
+        "category": row[5], "description": row[6], "amount": row[7] / 100.0, "status": row[8],
+        "student_id": row[9], "staff_id": None,
+        "approved_by": row[10] if len(row) > 10 else None, "approval_date": str(row[11]) if len(row) > 11 and row[11] else None,
+        "proof_reference": row[12] if len(row) > 12 else None, "tx_hash": tx_hash,
+    }
+
+
 @router.get("/transactions", response_model=List[TransactionResponse])
 def get_transactions(
     student_id: Optional[str] = None,
@@ -201,74 +499,156 @@ def get_transactions(
 ):
     client = get_db_client()
     try:
-        conditions = []
-        if student_id:
-            conditions.append(f"student_id = '{_esc(student_id)}'")
-        if staff_id:
-            conditions.append(f"staff_id = '{_esc(staff_id)}'")
-        if status:
-            conditions.append(f"status = '{status}'")
-
-        where_clause = ""
-        if conditions:
-            where_clause = " WHERE " + " AND ".join(conditions)
+        filters = {"student_id": student_id, "staff_id": staff_id, "status": status}
+        params = {k: v for k, v in filters.items() if v}
+        where = tuple(params)
+        params["limit"] = limit
 
         # Try with staff_id (new schema); fallback without it for old DBs
-        query_with_staff = f"""
-            SELECT
-                id, created_at, recorded_by, txn_type, strand, category,
-                description, amount, status, student_id, staff_id, approved_by,
-                approval_date, proof_reference
-            FROM transactions
-            {where_clause}
-            ORDER BY created_at DESC LIMIT {limit}
-        """
-        query_without_staff = f"""
-            SELECT
-                id, created_at, recorded_by, txn_type, strand, category,
-                description, amount, status, student_id, approved_by,
-                approval_date, proof_reference
-            FROM transactions
-            {where_clause}
-            ORDER BY created_at DESC LIMIT {limit}
-        """
         try:
-            result = client.sqlQuery(query_with_staff)
+            result = client.sqlQuery(
+                q.select("transactions", TXN_COLUMNS, where=where, order_by="created_at DESC", limit="@limit"),
+                params,
+            )
             has_staff_col = True
         except Exception:
-            result = client.sqlQuery(query_without_staff)
+            result = client.sqlQuery(
+                q.select("transactions", TXN_COLUMNS_NO_STAFF, where=where, order_by="created_at DESC", limit="@limit"),
+                params,
+            )
             has_staff_col = False
 
-        txns = []
-        for row in result:
-            content_str = f"{row[0]}|{row[1]}|{row[2]}|{row[3]}|{row[7]}|{row[8]}"
-            tx_hash_bytes = hashlib.sha256(content_str.encode()).digest()
-            tx_hash = binascii.hexlify(tx_hash_bytes).decode("utf-8")
-            if has_staff_col:
-                # 0 id, 1 created_at, 2 recorded_by, 3 txn_type, 4 strand, 5 category, 6 description, 7 amount, 8 status, 9 student_id, 10 staff_id, 11 approved_by, 12 approval_date, 13 proof_reference
-                txns.append({
-                    "id": row[0], "created_at": str(row[1]), "recorded_by": row[2], "txn_type": row[3], "strand": row[4],
-                    "category": row[5], "description": row[6], "amount": row[7] / 100.0, "status": row[8],
-                    "student_id": row[9], "staff_id": row[10] if len(row) > 10 else None,
-                    "approved_by": row[11] if len(row) > 11 else None, "approval_date": str(row[12]) if len(row) > 12 and row[12] else None,
-                    "proof_reference": row[13] if len(row) > 13 else None, "tx_hash": tx_hash,
-                })
-            else:
-                # 0 id, 1 created_at, 2 recorded_by, 3 txn_type, 4 strand, 5 category, 6 description, 7 amount, 8 status, 9 student_id, 10 approved_by, 11 approval_date, 12 proof_reference
-                txns.append({
-                    "id": row[0], "created_at": str(row[1]), "recorded_by": row[2], "txn_type": row[3], "strand": row[4],
-                    "category": row[5], "description": row[6], "amount": row[7] / 100.0, "status": row[8],
-                    "student_id": row[9], "staff_id": None,
-                    "approved_by": row[10] if len(row) > 10 else None, "approval_date": str(row[11]) if len(row) > 11 and row[11] else None,
-                    "proof_reference": row[12] if len(row) > 12 else None, "tx_hash": tx_hash,
-                })
-        return txns
+        return [_txn_response(row, has_staff_col) for row in result]
 
     except Exception as e:
         print(f"Fetch Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _fetch_txns(client, txn_ids) -> list:
+    """Full rows for `txn_ids` in MAX_BATCH_SIZE chunks (one IN (...) query each), ordered by id."""
+    rows = []
+    for start in range(0, len(txn_ids), MAX_BATCH_SIZE):
+        id_cond, id_params = q.in_list("id", txn_ids[start : start + MAX_BATCH_SIZE])
+        rows.extend(client.sqlQuery(q.select("transactions", TXN_COLUMNS, where=(id_cond,)), id_params))
+    return sorted(rows)
+
+
+@router.get("/transactions/changes", response_model=TransactionChanges)
+def get_transaction_changes(since_id: int = 0, since_seq: Optional[int] = None, limit: int = MAX_CHANGES):
+    """
+    Incremental sync feed: transactions inserted after `since_id` plus transactions approved, voided,
+    edited or acknowledged after change log position `since_seq` (the transaction_changes log), in
+    their current state. Start with since_id=0, then pass back next_since_id/next_since_seq; keep
+    calling while has_more. At most `limit` inserts and `limit` log entries are read per call. Rows
+    can repeat across calls, so apply them by id.
+    """
+    limit = max(1, min(limit, MAX_CHANGES))
+    if since_id > 0 and since_seq is None:
+        raise HTTPException(status_code=400, detail="since_seq is required with since_id (pass back next_since_seq)")
+
+    client = get_db_client()
+    try:
+        # Edits first, so the rows read below are at least as new as the logged changes
+        if since_seq is None:
+            # Full sync: every row comes back as an insert; only the log position is needed
+            latest = client.sqlQuery(q.select(ledger.CHANGES_TABLE, ("seq",), order_by="seq DESC", limit=1))
+            next_seq, changes = (latest[0][0] if latest else 0), []
+        else:
+            changes = client.sqlQuery(
+                q.select(ledger.CHANGES_TABLE, ("seq", "txn_id"), where=("seq > @since_seq",), order_by="seq", limit="@limit"),
+                {"since_seq": since_seq, "limit": limit},
+            )
+            next_seq = changes[-1][0] if changes else since_seq
+        inserted = client.sqlQuery(
+            q.select("transactions", TXN_COLUMNS, where=("id > @since_id",), order_by="id", limit="@limit"),
+            {"since_id": since_id, "limit": limit},
+        )
+
+        edited = sorted({txn_id for _, txn_id in changes if txn_id <= since_id})
+        rows = _fetch_txns(client, edited) + list(inserted)
+        return {
+            "transactions": [_txn_response(row) for row in rows],
+            "next_since_id": inserted[-1][0] if inserted else since_id,
+            "next_since_seq": next_seq,
+            "has_more": len(inserted) == limit or len(changes) == limit,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Changes Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/transactions/search", response_model=List[TransactionResponse])
+def search_transactions(text: str = Query(..., alias="q"), limit: int = 50):
+    """
+    Full-text search over description, category, proof_reference and the people involved
+    (recorded_by, student_id, staff_id, approved_by). Every word must match, as a whole word or a
+    prefix ('sup' finds 'supplies'); best matches first. Served from an in-memory index (see search.py).
+    """
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+    try:
+        txn_ids = search.search(get_db_client, text, limit)
+        if not txn_ids:
+            return []
+        rows = {row[0]: row for row in _fetch_txns(get_db_client(), txn_ids)}
+        return [_txn_response(rows[txn_id]) for txn_id in txn_ids if txn_id in rows]
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Search Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/transactions/events")
+async def transaction_events(request: Request, username: str, last_event_id: Optional[str] = None):
+    """
+    Server-Sent Events feed of transaction changes (created, status changes, edits, acknowledgements),
+    filtered by the viewer's role. Replaces polling /transactions?status=... for approval queues.
+    Resumes from the Last-Event-ID header (EventSource sends it on reconnect) or ?last_event_id=.
+    """
+    client = await run_in_threadpool(get_db_client)
+    role = await run_in_threadpool(get_user_role, client, username)
+    if not role:
+        raise HTTPException(status_code=403, detail="Invalid user")
+
+    last_event_id = request.headers.get("last-event-id") or last_event_id
+
+    loop = asyncio.get_running_loop()
+    queue, missed, reset = await run_in_threadpool(events.subscribe, loop, last_event_id)
+
+    async def stream():
+        # Events published by any worker arrive on the queue (see events.py), so a reset is only
+        # needed when the client's last id can no longer be resumed
+        try:
+            yield "retry: 3000\n\n"
+            if reset:
+                # Too far behind (or unknown id): client should refetch its lists
+                yield "event: reset\ndata: {}\n\n"
+            for event in missed:
+                if events.visible_to(role, username, event):
+                    yield events.format_sse(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), events.KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                if events.visible_to(role, username, event):
+                    yield events.format_sse(event)
+        finally:
+            events.unsubscribe(loop, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/verify/{txn_id}")
 def verify_transaction_integrity(txn_id: int):
     """
@@ -296,74 +676,158 @@ def verify_transaction_integrity(txn_id: int):
         raise HTTPException(status_code=400, detail=f"Verification Failed: {str(e)}")
 
 
-@router.put("/transactions/{txn_id}/approve")
-def approve_transaction(txn_id: int, approval: ApprovalRequest):
+def _next_status(user_role: str | None, txn_type: str, current_status: str, action: str) -> str:
     """
     Multi-level Approval Workflow:
     - VP Finance: Can endorse pending disbursements (status: "Pending" → "Endorsed")
     - President: Has final say - can approve/reject both Pending and Endorsed disbursements
     - Admin: Can approve/reject any transaction
+    Raises 403 when the role may not act on this transaction.
     """
+    if not user_role:
+        raise HTTPException(status_code=403, detail="Invalid user")
+
+    if action == "Reject":
+        return "Rejected"
+    if user_role == "admin":
+        # Admin can directly approve/reject anything
+        return "Approved" if action == "Approve" else "Rejected"
+    if user_role == "vp_finance":
+        # VP Finance can endorse disbursements (marks as endorsed, but doesn't approve)
+        if txn_type == "Disbursement" and current_status == "Pending":
+            return "Endorsed" if action == "Approve" else "Rejected"
+        raise HTTPException(
+            status_code=403, 
+            detail="VP Finance can only endorse pending disbursements"
+        )
+    if user_role == "president":
+        # President has final say - can approve/reject both Pending and Endorsed disbursements
+        if txn_type == "Disbursement" and current_status in ["Pending", "Endorsed"]:
+            return "Approved" if action == "Approve" else "Rejected"
+        raise HTTPException(
+            status_code=403,
+            detail="President can only approve/reject disbursements"
+        )
+    raise HTTPException(
+        status_code=403,
+        detail="You do not have permission to approve transactions"
+    )
+
+
+@router.put("/transactions/{txn_id}/approve")
+def approve_transaction(txn_id: int, approval: ApprovalRequest):
+    """Approve, endorse or reject one transaction (see _next_status for the workflow rules)."""
     client = get_db_client()
     try:
         # Get current transaction status
         txn_res = client.sqlQuery(
-            f"SELECT txn_type, status FROM transactions WHERE id = {txn_id}"
+            q.select("transactions", TXN_STATE_COLUMNS, where=("id",)), {"id": txn_id}
         )
         if not txn_res:
             raise HTTPException(status_code=404, detail="Transaction not found")
         
-        txn_type = txn_res[0][0]
-        current_status = txn_res[0][1]
+        txn = dict(zip(TXN_STATE_COLUMNS, txn_res[0]))
+        txn_type = txn["txn_type"]
+        current_status = txn["status"]
         user_role = get_user_role(client, approval.admin_username)
-        
+        new_status = _next_status(user_role, txn_type, current_status, approval.action)
+
+        with rollups.writing():
+            client.sqlExec(
+                q.update("transactions", ("status", "approved_by"), now=("approval_date",)),
+                {"status": new_status, "approved_by": approval.admin_username, "id": txn_id},
+            )
+            deltas = {}
+            rollups.move(deltas, txn, new_status)
+            rollups.apply(client, deltas)
+        ledger.record(client, [txn_id], "status_changed")
+        cache.bump("transactions")
+        events.publish(
+            "status_changed", txn_id, txn_type=txn_type, status=new_status, previous_status=current_status,
+            student_id=txn["student_id"], staff_id=txn["staff_id"], actor=approval.admin_username,
+        )
+
+        return {"message": f"Transaction {new_status}"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Approval Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.put("/transactions/approve-batch")
+def approve_transactions_batch(batch: BatchApprovalRequest):
+    """
+    Approve, endorse or reject many transactions in one call (e.g. month-end disbursements).
+    One role lookup, one bulk status read and one UPDATE for every allowed id; each id gets its own
+    outcome, so ids that break the workflow rules don't block the rest.
+    """
+    txn_ids = list(dict.fromkeys(batch.txn_ids))
+    if not txn_ids:
+        return {"updated": 0, "results": []}
+    if len(txn_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} transactions per batch")
+
+    client = get_db_client()
+    try:
+        user_role = get_user_role(client, batch.admin_username)
         if not user_role:
             raise HTTPException(status_code=403, detail="Invalid user")
-        
-        # Determine new status based on role and action
-        if approval.action == "Reject":
-            new_status = "Rejected"
-        elif user_role == "admin":
-            # Admin can directly approve/reject anything
-            new_status = "Approved" if approval.action == "Approve" else "Rejected"
-        elif user_role == "vp_finance":
-            # VP Finance can endorse disbursements (marks as endorsed, but doesn't approve)
-            if txn_type == "Disbursement" and current_status == "Pending":
-                new_status = "Endorsed" if approval.action == "Approve" else "Rejected"
-            else:
-                raise HTTPException(
-                    status_code=403, 
-                    detail="VP Finance can only endorse pending disbursements"
+        if user_role not in APPROVER_ROLES:
+            raise HTTPException(status_code=403, detail="You do not have permission to approve transactions")
+
+        id_cond, id_params = q.in_list("id", txn_ids)
+        rows = client.sqlQuery(
+            q.select("transactions", ("id",) + TXN_STATE_COLUMNS, where=(id_cond,)),
+            id_params,
+        )
+        current = {row[0]: dict(zip(TXN_STATE_COLUMNS, row[1:])) for row in rows}
+
+        results = {}
+        allowed = []
+        new_status = None
+        for txn_id in txn_ids:
+            row = current.get(txn_id)
+            if row is None:
+                results[txn_id] = {"id": txn_id, "success": False, "detail": "Transaction not found"}
+                continue
+            try:
+                # _next_status lets any role reject a single row; in bulk, rejecting a row needs the
+                # same rights as approving it
+                permitted = _next_status(user_role, row["txn_type"], row["status"], "Approve")
+                new_status = "Rejected" if batch.action == "Reject" else permitted
+            except HTTPException as e:
+                results[txn_id] = {"id": txn_id, "success": False, "detail": e.detail}
+                continue
+            allowed.append(txn_id)
+
+        if allowed:
+            # The action is shared by the whole batch, so every allowed id gets the same new status
+            id_cond, id_params = q.in_list("id", allowed)
+            with rollups.writing():
+                client.sqlExec(
+                    q.update("transactions", ("status", "approved_by"), where=(id_cond,), now=("approval_date",)),
+                    {"status": new_status, "approved_by": batch.admin_username, **id_params},
                 )
-        elif user_role == "president":
-            # President has final say - can approve/reject both Pending and Endorsed disbursements
-            if txn_type == "Disbursement" and current_status in ["Pending", "Endorsed"]:
-                new_status = "Approved" if approval.action == "Approve" else "Rejected"
-            else:
-                raise HTTPException(
-                    status_code=403,
-                    detail="President can only approve/reject disbursements"
+                deltas = {}
+                for txn_id in allowed:
+                    rollups.move(deltas, current[txn_id], new_status)
+                rollups.apply(client, deltas)
+            ledger.record(client, allowed, "status_changed")
+            cache.bump("transactions")
+            for txn_id in allowed:
+                row = current[txn_id]
+                results[txn_id] = {"id": txn_id, "success": True, "status": new_status}
+                events.publish(
+                    "status_changed", txn_id, txn_type=row["txn_type"], status=new_status, previous_status=row["status"],
+                    student_id=row["student_id"], staff_id=row["staff_id"], actor=batch.admin_username,
                 )
-        else:
-            raise HTTPException(
-                status_code=403,
-                detail="You do not have permission to approve transactions"
-            )
 
-        query = f"""
-            UPDATE transactions
-            SET status = '{new_status}',
-                approved_by = '{approval.admin_username}',
-                approval_date = NOW()
-            WHERE id = {txn_id}
-        """
-        client.sqlExec(query)
-
-        return {"message": f"Transaction {new_status}"}
+        return {"updated": len(allowed), "results": [results[txn_id] for txn_id in txn_ids]}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Approval Error: {e}")
+        print(f"Batch Approval Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -375,33 +839,50 @@ def admin_update_transaction(txn_id: int, payload: TransactionUpdateAdmin):
     client = get_db_client()
     ensure_admin(client, payload.admin_username)
 
-    updates = []
+    updates = {}
     if payload.txn_type:
-        updates.append(f"txn_type = '{payload.txn_type}'")
+        updates["txn_type"] = payload.txn_type
     if payload.strand:
-        updates.append(f"strand = '{payload.strand}'")
+        updates["strand"] = payload.strand
     if payload.category:
-        updates.append(f"category = '{payload.category}'")
+        updates["category"] = payload.category
     if payload.description is not None:
-        updates.append(f"description = '{payload.description}'")
+        updates["description"] = payload.description
     if payload.amount is not None:
-        updates.append(f"amount = {int(payload.amount * 100)}")
+        updates["amount"] = _cents(payload.amount)
     if payload.status:
-        updates.append(f"status = '{payload.status}'")
+        updates["status"] = payload.status
     if payload.student_id is not None:
-        updates.append(f"student_id = '{payload.student_id}'")
+        updates["student_id"] = payload.student_id
     if payload.staff_id is not None:
-        updates.append(f"staff_id = '{_esc(payload.staff_id)}'")
+        updates["staff_id"] = payload.staff_id
     if payload.proof_reference is not None:
-        updates.append(f"proof_reference = '{payload.proof_reference}'")
+        updates["proof_reference"] = payload.proof_reference
 
     if not updates:
         return {"message": "No changes requested"}
 
-    set_clause = ", ".join(updates)
-
     try:
-        client.sqlExec(f"UPDATE transactions SET {set_clause} WHERE id = {txn_id}")
+        before = client.sqlQuery(q.select("transactions", TXN_STATE_COLUMNS, where=("id",)), {"id": txn_id})
+        old = dict(zip(TXN_STATE_COLUMNS, before[0])) if before else {}
+        with rollups.writing():
+            client.sqlExec(q.update("transactions", tuple(updates)), {**updates, "id": txn_id})
+            # Changes to what the rollup is keyed/summed by move the transaction between buckets
+            if old and updates.keys() & set(rollups.ROW_COLUMNS):
+                deltas = {}
+                rollups.change(deltas, old, sign=-1)
+                rollups.change(deltas, {**old, **updates})
+                rollups.apply(client, deltas)
+        ledger.record(client, [txn_id], "updated")
+        attachments.link(client, updates.get("proof_reference"), txn_id)
+        cache.bump("transactions")
+        # Same fields as other events (amount in pesos; type and owners for visible_to), plus what changed
+        row = {**old, **updates}
+        events.publish(
+            "updated", txn_id, actor=payload.admin_username,
+            **{**updates, "txn_type": row.get("txn_type"), "status": row.get("status"),
+               "amount": (row.get("amount") or 0) / 100.0, "student_id": row.get("student_id"), "staff_id": row.get("staff_id")},
+        )
         return {"message": "Transaction updated"}
     except Exception as e:
         print(f"Update Error: {e}")
@@ -417,15 +898,24 @@ def admin_void_transaction(txn_id: int, payload: AdminActionRequest):
     client = get_db_client()
     ensure_admin(client, payload.admin_username)
     try:
-        client.sqlExec(
-            f"""
-            UPDATE transactions
-            SET status = 'Voided',
-                approved_by = '{payload.admin_username}',
-                approval_date = NOW()
-            WHERE id = {txn_id}
-            """
-        )
+        txn_res = client.sqlQuery(q.select("transactions", TXN_STATE_COLUMNS, where=("id",)), {"id": txn_id})
+        with rollups.writing():
+            client.sqlExec(
+                q.update("transactions", ("status", "approved_by"), now=("approval_date",)),
+                {"status": "Voided", "approved_by": payload.admin_username, "id": txn_id},
+            )
+            txn = dict(zip(TXN_STATE_COLUMNS, txn_res[0])) if txn_res else None
+            if txn:
+                deltas = {}
+                rollups.move(deltas, txn, "Voided")
+                rollups.apply(client, deltas)
+        ledger.record(client, [txn_id], "status_changed")
+        cache.bump("transactions")
+        if txn:
+            events.publish(
+                "status_changed", txn_id, txn_type=txn["txn_type"], status="Voided", previous_status=txn["status"],
+                student_id=txn["student_id"], staff_id=txn["staff_id"], actor=payload.admin_username,
+            )
         return {"message": "Transaction voided"}
     except Exception as e:
         print(f"Void Error: {e}")
@@ -449,7 +939,8 @@ def acknowledge_transaction(txn_id: int, payload: AdminActionRequest):
     try:
         # Get transaction to verify it's a disbursement
         txn_res = client.sqlQuery(
-            f"SELECT txn_type, status FROM transactions WHERE id = {txn_id}"
+            q.select("transactions", ("txn_type", "status", "description", "student_id", "staff_id"), where=("id",)),
+            {"id": txn_id},
         )
         if not txn_res:
             raise HTTPException(status_code=404, detail="Transaction not found")
@@ -462,20 +953,16 @@ def acknowledge_transaction(txn_id: int, payload: AdminActionRequest):
             )
         
         # Add acknowledgment note to description
-        # Get current description first
-        desc_res = client.sqlQuery(
-            f"SELECT description FROM transactions WHERE id = {txn_id}"
-        )
-        current_desc = desc_res[0][0] if desc_res and desc_res[0][0] else ""
+        current_desc = txn_res[0][2] or ""
         ack_note = f" [Acknowledged by {payload.admin_username} on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]"
         new_desc = current_desc + ack_note
         
-        client.sqlExec(
-            f"""
-            UPDATE transactions
-            SET description = '{new_desc.replace("'", "''")}'
-            WHERE id = {txn_id}
-            """
+        client.sqlExec(q.update("transactions", ("description",)), {"description": new_desc, "id": txn_id})
+        ledger.record(client, [txn_id], "acknowledged")
+        cache.bump("transactions")
+        events.publish(
+            "acknowledged", txn_id, txn_type=txn_type, status=txn_res[0][1],
+            student_id=txn_res[0][3], staff_id=txn_res[0][4], actor=payload.admin_username,
         )
         return {"message": "Payment acknowledged"}
     except HTTPException:
@@ -15,6 +15,9 @@ class LoginResponse(BaseModel):
     name: str | None = None
     first_name: str | None = None
     last_name: str | None = None
+    strand: str | None = None
+    payment_plan: str | None = None
+    profile: dict | None = None  # Same payload as POST /profile, so the client needn't ask again
     message: str
 
 
@@ -146,11 +149,24 @@ class TransactionResponse(BaseModel):
     tx_hash: str | None = None
 
 
+class TransactionChanges(BaseModel):
+    transactions: List[TransactionResponse]
+    next_since_id: int  # pass back as since_id
+    next_since_seq: int  # pass back as since_seq
+    has_more: bool
+
+
 class ApprovalRequest(BaseModel):
     admin_username: str
     action: str  # 'Approve' or 'Reject'
 
 
+class BatchApprovalRequest(BaseModel):
+    admin_username: str
+    action: str  # 'Approve' or 'Reject'
+    txn_ids: List[int]
+
+
 class AdminActionRequest(BaseModel):
     admin_username: str
 
@@ -178,3 +194,74 @@ class DashboardStats(BaseModel):
     collections_by_category: dict
     disbursements_by_category: dict
     monthly_collections: dict | None = None
+
+
+class TrendPoint(BaseModel):
+    period: str  # YYYY-MM-DD (day, or Monday of the week) or YYYY-MM
+    total: float
+    count: int
+    by_type: dict
+
+
+class TrendsResponse(BaseModel):
+    granularity: str
+    from_date: str | None = None
+    to_date: str | None = None
+    total: float
+    points: List[TrendPoint]
+
+
+class BreakdownGroup(BaseModel):
+    key: dict  # one entry per group_by dimension
+    total: float
+    count: int
+
+
+class BreakdownResponse(BaseModel):
+    group_by: List[str]
+    total: float
+    count: int
+    groups: List[BreakdownGroup]
+
+
+# --- STATEMENT SCHEMAS ---
+class StatementBill(BaseModel):
+    assignment_id: int
+    bill_id: int
+    bill_type: str | None = None
+    description: str | None = None
+    billed_on: str
+    amount: float
+    paid_amount: float
+    balance: float
+    status: str
+
+
+class StatementPayment(BaseModel):
+    txn_id: int
+    date: str
+    category: str | None = None
+    description: str | None = None
+    amount: float
+    status: str
+    proof_reference: str | None = None
+
+
+class StatementAllocation(BaseModel):
+    name: str
+    amount: float
+
+
+class StatementResponse(BaseModel):
+    student_id: str
+    name: str
+    strand: str | None = None
+    section: str | None = None
+    payment_plan: str | None = None
+    generated_at: str
+    bills: List[StatementBill]
+    payments: List[StatementPayment]
+    allocations: List[StatementAllocation]
+    total_billed: float
+    total_paid: float
+    balance: float
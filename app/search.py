@@ -0,0 +1,122 @@
+"""In-memory inverted index over transaction text (description, category, parties, proof reference) for /transactions/search. Each worker builds it once, then keeps it current the same way as the analytics snapshot: new rows by id watermark, edited rows from the transaction_changes log."""
+import bisect
+import heapq
+import math
+import re
+
+from . import ledger
+
+# Indexed columns and how much a match in each counts towards the score
+FIELD_WEIGHTS = {
+    "description": 1.0,
+    "category": 1.5,
+    "recorded_by": 2.0,
+    "student_id": 3.0,
+    "staff_id": 3.0,
+    "approved_by": 2.0,
+    "proof_reference": 2.0,
+}
+INDEX_COLUMNS = ("id",) + tuple(FIELD_WEIGHTS)
+
+# A prefix match scores this fraction of an exact one
+PREFIX_FACTOR = 0.5
+
+_TOKEN = re.compile(r"[0-9a-z]+")
+
+
+def tokenize(text) -> list:
+    """Lowercase alphanumeric runs: 'juan.dc@gmail.com' -> ['juan', 'dc', 'gmail', 'com']."""
+    return _TOKEN.findall(str(text).lower()) if text else []
+
+
+class Index:
+    def __init__(self):
+        self.version = None
+        self.change_seq = 0
+        self.max_id = 0
+        self.postings = {}  # term -> {txn_id: weight}
+        self.docs = {}  # txn_id -> {term: weight}, to unindex a row before re-adding it
+        self._terms = None  # sorted terms for prefix lookups, rebuilt after changes
+
+    def append(self, rows):
+        for row in rows:
+            self.add(row)
+
+    replace = append  # Re-adding a row unindexes its old text first
+
+    def add(self, row):
+        """Index (or re-index) one INDEX_COLUMNS row."""
+        txn_id = row[0]
+        self.remove(txn_id)
+        weights = {}
+        for column, value in zip(INDEX_COLUMNS[1:], row[1:]):
+            for term in tokenize(value):
+                weights[term] = weights.get(term, 0.0) + FIELD_WEIGHTS[column]
+        for term, weight in weights.items():
+            self.postings.setdefault(term, {})[txn_id] = weight
+        self.docs[txn_id] = weights
+        self.max_id = max(self.max_id, txn_id)
+        self._terms = None
+
+    def remove(self, txn_id):
+        for term in self.docs.pop(txn_id, {}):
+            postings = self.postings[term]
+            postings.pop(txn_id, None)
+            if not postings:
+                del self.postings[term]
+
+    def _expand(self, word: str) -> list:
+        """Index terms `word` matches: itself (exact) and every term it is a prefix of."""
+        if self._terms is None:
+            self._terms = sorted(self.postings)
+        start = bisect.bisect_left(self._terms, word)
+        end = bisect.bisect_left(self._terms, word + "\uffff")
+        return self._terms[start:end]
+
+    def search(self, text: str, limit: int) -> list:
+        """
+        Ids of transactions matching every word of `text` (each word also matches as a prefix),
+        best first. Scores are tf-idf style: rarer terms and heavier fields rank higher.
+        """
+        words = list(dict.fromkeys(tokenize(text)))
+        if not words or not self.docs:
+            return []
+        total_docs = len(self.docs)
+        # Rarest word first, so later words only have to score the surviving candidates
+        expanded = sorted(
+            ((word, self._expand(word)) for word in words),
+            key=lambda item: sum(len(self.postings[term]) for term in item[1]),
+        )
+        scores = None
+        for word, terms in expanded:
+            word_scores = {}
+            for term in terms:
+                postings = self.postings[term]
+                term_weight = math.log(1 + total_docs / len(postings)) * (1.0 if term == word else PREFIX_FACTOR)
+                candidates = postings.keys() if scores is None else (t for t in scores if t in postings)
+                for txn_id in candidates:
+                    score = postings[txn_id] * term_weight
+                    if score > word_scores.get(txn_id, 0.0):
+                        word_scores[txn_id] = score
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {txn_id: s + word_scores[txn_id] for txn_id, s in scores.items() if txn_id in word_scores}
+            if not scores:
+                return []
+        # Best score first; newer transactions win ties
+        return heapq.nsmallest(limit, scores, key=lambda txn_id: (-scores[txn_id], -txn_id))
+
+
+# Refreshed in place (copying the postings on every write would cost more than the refresh), so
+# searches hold the follower's lock
+_follower = ledger.Follower(INDEX_COLUMNS, Index)
+
+
+def search(connect, text: str, limit: int) -> list:
+    """
+    Ranked transaction ids for `text`, refreshing the index first if the transactions cache version
+    moved. `connect` returns a db client and is only called when a refresh is needed.
+    """
+    with _follower.lock:
+        return _follower.current(connect).search(text, limit)
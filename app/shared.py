@@ -0,0 +1,92 @@
+"""Cross-worker version tokens for `uvicorn --workers N`. Each token is a tiny file in SHARED_STATE_DIR; bump() atomically replaces it with a fresh value and every worker reads the file, so an invalidation made by one worker is observed by all of them without an external service. Also the file lock the other shared-state modules serialize on."""
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from .core import SHARED_STATE_DIR
+
+os.makedirs(SHARED_STATE_DIR, exist_ok=True)
+
+
+def _path(name: str) -> str:
+    return os.path.join(SHARED_STATE_DIR, f"{name}.version")
+
+
+def token(name: str) -> str:
+    """Current token for `name` ("" until first bumped). Only equality between tokens is meaningful."""
+    for _ in range(3):
+        try:
+            with open(_path(name), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return ""
+        except PermissionError:
+            time.sleep(0.001)  # Windows: file is being replaced right now
+    return ""
+
+
+def bump(name: str) -> str:
+    """Give `name` a new token. Safe to call from any worker or thread."""
+    new_token = f"{os.getpid()}-{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+    tmp_path = f"{_path(name)}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(new_token)
+    for attempt in range(20):
+        try:
+            os.replace(tmp_path, _path(name))
+            return new_token
+        except PermissionError:
+            time.sleep(0.005 * (attempt + 1))  # Windows: a reader has it open
+    os.remove(tmp_path)
+    raise RuntimeError(f"Could not update shared version '{name}'")
+
+
+def _try_lock(fd: int, exclusive: bool) -> bool:
+    try:
+        if fcntl:
+            fcntl.flock(fd, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(fd: int):
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def locked(path: str, wait: float, poll: float = 0.002, exclusive: bool = True):
+    """
+    Hold an exclusive OS lock on the file at `path` (created if missing), across workers and threads.
+    With exclusive=False it is shared with other non-exclusive holders (on Windows, which has no shared
+    file locks, it stays exclusive).
+    The OS drops it if the holder dies, so there is no stale lock to break; lock files are kept, never
+    deleted, since removing one while another worker waits on it would let two holders in.
+    Raises TimeoutError if it isn't free within `wait` seconds.
+    """
+    fd = os.open(path, os.O_CREAT | os.O_RDWR)
+    try:
+        deadline = time.monotonic() + wait
+        while not _try_lock(fd, exclusive):
+            if time.monotonic() > deadline:
+                raise TimeoutError(path)
+            time.sleep(poll)
+        try:
+            yield
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,125 @@
+"""Rendering of student statements of account (HTML and CSV) and zipping batches of them. Pure functions over the statement dicts built in routers/statements.py."""
+import csv
+import html
+import io
+import re
+import zipfile
+
+FORMATS = ("html", "csv")
+
+
+def _peso(value: float) -> str:
+    return f"₱{value:,.2f}"
+
+
+def render_csv(statement: dict) -> str:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["Statement of Account", statement["student_id"]])
+    writer.writerow(["Name", statement["name"]])
+    writer.writerow(["Strand", statement["strand"] or "", "Section", statement["section"] or ""])
+    writer.writerow(["Generated", statement["generated_at"]])
+    writer.writerow([])
+    writer.writerow(["Bills"])
+    writer.writerow(["Billed On", "Bill", "Description", "Amount", "Paid", "Balance", "Status"])
+    for b in statement["bills"]:
+        writer.writerow([b["billed_on"], b["bill_type"], b["description"], f"{b['amount']:.2f}", f"{b['paid_amount']:.2f}", f"{b['balance']:.2f}", b["status"]])
+    writer.writerow([])
+    writer.writerow(["Payments"])
+    writer.writerow(["Date", "Transaction", "Category", "Description", "Amount", "Status", "Receipt"])
+    for p in statement["payments"]:
+        writer.writerow([p["date"], p["txn_id"], p["category"], p["description"], f"{p['amount']:.2f}", p["status"], p["proof_reference"] or ""])
+    if statement["allocations"]:
+        writer.writerow([])
+        writer.writerow(["Where your tuition goes"])
+        for a in statement["allocations"]:
+            writer.writerow([a["name"], f"{a['amount']:.2f}"])
+    writer.writerow([])
+    writer.writerow(["Total Billed", f"{statement['total_billed']:.2f}"])
+    writer.writerow(["Total Paid", f"{statement['total_paid']:.2f}"])
+    writer.writerow(["Balance", f"{statement['balance']:.2f}"])
+    return out.getvalue()
+
+
+def render_html(statement: dict) -> str:
+    e = html.escape
+    bill_rows = "".join(
+        f"<tr><td>{e(b['billed_on'])}</td><td>{e(b['bill_type'] or '')}</td><td>{e(b['description'] or '')}</td>"
+        f"<td class='n'>{_peso(b['amount'])}</td><td class='n'>{_peso(b['paid_amount'])}</td>"
+        f"<td class='n'>{_peso(b['balance'])}</td><td>{e(b['status'])}</td></tr>"
+        for b in statement["bills"]
+    ) or "<tr><td colspan='7'>No bills.</td></tr>"
+    payment_rows = "".join(
+        f"<tr><td>{e(p['date'])}</td><td>TX-{p['txn_id']:05d}</td><td>{e(p['category'] or '')}</td>"
+        f"<td>{e(p['description'] or '')}</td><td class='n'>{_peso(p['amount'])}</td><td>{e(p['status'])}</td></tr>"
+        for p in statement["payments"]
+    ) or "<tr><td colspan='6'>No payments.</td></tr>"
+    allocation_rows = "".join(
+        f"<tr><td>{e(a['name'])}</td><td class='n'>{_peso(a['amount'])}</td></tr>" for a in statement["allocations"]
+    )
+    allocations = (
+        f"<h2>Where your tuition goes</h2><table><tr><th>Item</th><th>Amount</th></tr>{allocation_rows}</table>"
+        if allocation_rows
+        else ""
+    )
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Statement of Account - {e(statement['student_id'])}</title>
+<style>
+body {{ font-family: Arial, sans-serif; margin: 32px; color: #1f2937; }}
+table {{ border-collapse: collapse; width: 100%; margin-bottom: 20px; }}
+th, td {{ border: 1px solid #d1d5db; padding: 6px 8px; text-align: left; font-size: 13px; }}
+th {{ background: #006241; color: #fff; }}
+.n {{ text-align: right; }}
+.totals td {{ font-weight: bold; }}
+</style></head><body>
+<h1>Statement of Account</h1>
+<p><b>{e(statement['name'])}</b> ({e(statement['student_id'])})<br>
+Strand: {e(statement['strand'] or '—')} &middot; Section: {e(statement['section'] or '—')} &middot; Generated {e(statement['generated_at'])}</p>
+<h2>Bills</h2>
+<table><tr><th>Billed On</th><th>Bill</th><th>Description</th><th>Amount</th><th>Paid</th><th>Balance</th><th>Status</th></tr>{bill_rows}</table>
+<h2>Payments</h2>
+<table><tr><th>Date</th><th>Transaction</th><th>Category</th><th>Description</th><th>Amount</th><th>Status</th></tr>{payment_rows}</table>
+{allocations}
+<table class="totals">
+<tr><td>Total Billed</td><td class="n">{_peso(statement['total_billed'])}</td></tr>
+<tr><td>Total Paid</td><td class="n">{_peso(statement['total_paid'])}</td></tr>
+<tr><td>Balance</td><td class="n">{_peso(statement['balance'])}</td></tr>
+</table>
+</body></html>
+"""
+
+
+def render(statement: dict, fmt: str) -> str:
+    return render_html(statement) if fmt == "html" else render_csv(statement)
+
+
+def _render_file(args) -> tuple[str, bytes]:
+    """(archive name, encoded file) for one statement."""
+    statement, fmt = args
+    name = re.sub(r"[^0-9A-Za-z@._-]+", "_", statement["student_id"]) or "student"
+    # utf-8-sig so Excel opens the CSV with the peso sign and accents intact
+    return f"{name}.{fmt}", render(statement, fmt).encode("utf-8-sig" if fmt == "csv" else "utf-8")
+
+
+def _summary_csv(statements: list) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["Student ID", "Name", "Strand", "Section", "Total Billed", "Total Paid", "Balance"])
+    for s in statements:
+        writer.writerow([s["student_id"], s["name"], s["strand"] or "", s["section"] or "", f"{s['total_billed']:.2f}", f"{s['total_paid']:.2f}", f"{s['balance']:.2f}"])
+    return out.getvalue().encode("utf-8-sig")
+
+
+def build_archive(statements: list, fmt: str) -> bytes:
+    """
+    Zip one rendered statement per student plus summary.csv. Rendered serially: a statement takes well
+    under a millisecond, far less than starting worker processes (each re-imports the app) would cost.
+    """
+    files = [_render_file((statement, fmt)) for statement in statements]
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("summary.csv", _summary_csv(statements))
+        for name, data in files:
+            archive.writestr(name, data)
+    return buffer.getvalue()
@@ -0,0 +1,226 @@
+"""Attempt limits for password checks (/login, /change-password). Every attempt costs a full scrypt derivation, so a burst of guesses could pin the CPU; each username and each client IP gets a token bucket that refills continuously over LOGIN_WINDOW_SECONDS, and an attempt with no token left is answered 429 before any hashing. Buckets are small JSON files under SHARED_STATE_DIR/throttle, locked per key with an OS file lock (see shared.locked), so all workers on the host share them (like shared.py and idempotency.py)."""
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+
+from fastapi import HTTPException, Request
+
+from . import shared
+from .core import (
+    LOGIN_ATTEMPTS_PER_IP,
+    LOGIN_ATTEMPTS_PER_USER,
+    LOGIN_WINDOW_SECONDS,
+    SHARED_STATE_DIR,
+    TRUST_FORWARDED_FOR,
+)
+
+STORE_DIR = os.path.join(SHARED_STATE_DIR, "throttle")
+os.makedirs(STORE_DIR, exist_ok=True)
+
+# Bucket locks (see _locked); the lock files are kept, so this bounds how many there are
+LOCK_STRIPES = 64
+# Leftover temp files older than this are removed by prune()
+STALE_TMP_SECONDS = 5
+# Give up on a contended lock after this long and refuse the attempt
+LOCK_WAIT_SECONDS = 0.5
+POLL_SECONDS = 0.002
+# Drop buckets that have refilled completely once every this many writes (per worker); a pruned
+# bucket's throttled count moves into a per-worker totals file first
+PRUNE_EVERY = 200
+
+_written = itertools.count(1)
+# Throttled counts of buckets this worker pruned, so stats() totals survive pruning. Only this
+# process writes its file, so it needs no cross-worker lock.
+TOTALS_PATH = os.path.join(STORE_DIR, f"_totals.{os.getpid()}.json")
+_totals_lock = threading.Lock()
+
+
+def _path(key: str) -> str:
+    return os.path.join(STORE_DIR, hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + ".json")
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _read(path: str) -> dict | None:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write(path: str, record: dict):
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(record, f)
+    os.replace(tmp_path, path)
+
+
+def _locked(path: str):
+    """
+    Hold the lock for bucket `path`: one of LOCK_STRIPES lock files, picked by the bucket's name, so
+    unrelated keys rarely wait on each other. Raises TimeoutError if it stays taken past LOCK_WAIT_SECONDS.
+    """
+    stripe = int(os.path.basename(path)[:8], 16) % LOCK_STRIPES
+    return shared.locked(os.path.join(STORE_DIR, f"_lock.{stripe}"), LOCK_WAIT_SECONDS, POLL_SECONDS)
+
+
+def _refilled(record: dict | None, capacity: int, now: float) -> dict:
+    if record is None:
+        return {"tokens": float(capacity), "at": now, "throttled": 0}
+    rate = capacity / LOGIN_WINDOW_SECONDS
+    record["tokens"] = min(float(capacity), record["tokens"] + (now - record["at"]) * rate)
+    record["at"] = now
+    return record
+
+
+def take(key: str, capacity: int) -> float:
+    """
+    Spend one attempt from `key`'s bucket. Returns 0 if allowed, otherwise the seconds until the
+    next attempt will be (the attempt is refused and counted).
+    """
+    path = _path(key)
+    now = time.time()
+    try:
+        with _locked(path):
+            record = _refilled(_read(path), capacity, now)
+            record["key"] = key
+            if record["tokens"] >= 1:
+                record["tokens"] -= 1
+                wait = 0.0
+            else:
+                record["throttled"] += 1
+                wait = (1 - record["tokens"]) * LOGIN_WINDOW_SECONDS / capacity
+            _write(path, record)
+    except TimeoutError:
+        wait = 1.0  # Hammered so hard the lock is never free: refuse rather than queue up more hashing
+    if next(_written) % PRUNE_EVERY == 0:
+        prune(now)
+    return wait
+
+
+def give_back(key: str, capacity: int):
+    """Return the token taken for an attempt that succeeded, so normal use never runs into the limit."""
+    path = _path(key)
+    try:
+        with _locked(path):
+            record = _refilled(_read(path), capacity, time.time())
+            record["tokens"] = min(float(capacity), record["tokens"] + 1)
+            _write(path, record)
+    except (OSError, TimeoutError) as e:
+        print(f"⚠️ Throttle refund warning: {e}")
+
+
+def client_ip(request: Request) -> str:
+    if TRUST_FORWARDED_FOR:
+        # The rightmost entry is the one our proxy appended; anything left of it came from the client
+        # and could be changed on every request to get a fresh bucket
+        forwarded = request.headers.get("x-forwarded-for", "").split(",")[-1].strip()
+        if forwarded:
+            return forwarded
+    return request.client.host if request.client else "unknown"
+
+
+def _keys(request: Request, username: str) -> list:
+    # IP first: a guess at a locked-out username still spends the sender's own allowance
+    return [(f"ip:{client_ip(request)}", LOGIN_ATTEMPTS_PER_IP), (f"user:{(username or '').lower()}", LOGIN_ATTEMPTS_PER_USER)]
+
+
+def check(request: Request, username: str):
+    """Spend an attempt for the caller's IP and for `username`; 429 (with Retry-After) when either is used up."""
+    for key, capacity in _keys(request, username):
+        wait = take(key, capacity)
+        if wait:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many attempts. Please wait before trying again.",
+                headers={"Retry-After": str(max(1, int(wait + 0.999)))},
+            )
+
+
+def succeeded(request: Request, username: str):
+    """Undo check()'s charge after a correct password."""
+    for key, capacity in _keys(request, username):
+        give_back(key, capacity)
+
+
+def _retire(path: str, now: float):
+    """Delete a bucket that has refilled completely, keeping its throttled count in this worker's totals."""
+    try:
+        with _locked(path):
+            record = _read(path)
+            if record is None or now - os.path.getmtime(path) <= LOGIN_WINDOW_SECONDS:
+                return  # Used again meanwhile
+            if record.get("throttled") and "key" in record:
+                kind = record["key"].split(":", 1)[0]
+                with _totals_lock:
+                    totals = _read(TOTALS_PATH) or {}
+                    totals[kind] = totals.get(kind, 0) + record["throttled"]
+                    _write(TOTALS_PATH, totals)
+            _remove(path)
+    except (OSError, TimeoutError) as e:
+        print(f"⚠️ Throttle prune warning: {e}")
+
+
+def prune(now: float | None = None):
+    """Remove buckets that have refilled completely (they equal a fresh bucket) and leftover temp files."""
+    now = now or time.time()
+    with os.scandir(STORE_DIR) as it:
+        for entry in it:
+            if entry.name.startswith("_"):
+                continue
+            try:
+                age = now - entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith(".json") and age > LOGIN_WINDOW_SECONDS:
+                _retire(entry.path, now)
+            elif entry.name.endswith(".tmp") and age > STALE_TMP_SECONDS:
+                _remove(entry.path)
+
+
+def stats() -> dict:
+    """
+    Throttled attempts so far (by ip/user), summed from the live buckets and the totals of pruned
+    ones, and the keys that are out of attempts right now.
+    """
+    now = time.time()
+    limited = []
+    throttled = {"ip": 0, "user": 0}
+    with os.scandir(STORE_DIR) as it:
+        for entry in it:
+            if not entry.name.endswith(".json"):
+                continue
+            if entry.name.startswith("_totals."):
+                for kind, count in (_read(entry.path) or {}).items():
+                    throttled[kind] = throttled.get(kind, 0) + count
+                continue
+            record = _read(entry.path)
+            if not record or "key" not in record:
+                continue
+            kind = record["key"].split(":", 1)[0]
+            throttled[kind] = throttled.get(kind, 0) + record.get("throttled", 0)
+            capacity = LOGIN_ATTEMPTS_PER_IP if kind == "ip" else LOGIN_ATTEMPTS_PER_USER
+            record = _refilled(record, capacity, now)
+            if record["tokens"] < 1:
+                limited.append({
+                    "key": record["key"],
+                    "throttled": record["throttled"],
+                    "retry_after": round((1 - record["tokens"]) * LOGIN_WINDOW_SECONDS / capacity, 1),
+                })
+    return {
+        "throttled": throttled,
+        "limited": sorted(limited, key=lambda item: item["key"]),
+        "attempts_per_user": LOGIN_ATTEMPTS_PER_USER,
+        "attempts_per_ip": LOGIN_ATTEMPTS_PER_IP,
+        "window_seconds": LOGIN_WINDOW_SECONDS,
+    }
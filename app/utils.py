@@ -1,51 +1,87 @@
 import binascii
+import hashlib
+import hmac
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+from .core import PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_P, PASSWORD_SCRYPT_R
 
+# Parameters of hashes stored as scrypt$salt_hex$hash_hex, before the parameters were written into the hash
+LEGACY_PARAMS = {"n": 2**14, "r": 8, "p": 1}
+# Refuse to derive with anything costlier than this, whatever a stored hash claims
+MAX_N = 2**20
 
-def get_password_hash(password: str) -> str:
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # hashlib's scrypt releases the GIL while deriving, so other threads (e.g. the profile
+    # lookup at login) keep running; cryptography's Scrypt holds it for the whole derivation
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=salt, n=n, r=r, p=p, dklen=32, maxmem=256 * n * r * p + (1 << 20)
+    )
+
+
+def _parse(hashed_password: str):
+    """(params, salt, key) from either stored format."""
+    parts = hashed_password.split("$")
+    if parts[0] != "scrypt":
+        raise ValueError("not a scrypt hash")
+    if len(parts) == 3:
+        params = LEGACY_PARAMS
+    elif len(parts) == 4:
+        params = {name: int(value) for name, value in (item.split("=") for item in parts[1].split(","))}
+    else:
+        raise ValueError("malformed hash")
+    return params, binascii.unhexlify(parts[-2]), binascii.unhexlify(parts[-1])
+
+
+def get_password_hash(password: str, n: int = PASSWORD_SCRYPT_N, r: int = PASSWORD_SCRYPT_R, p: int = PASSWORD_SCRYPT_P) -> str:
     """
-    Generate a secure Scrypt hash for a password.
-    Format: scrypt$salt_hex$hash_hex
+    Generate a secure Scrypt hash for a password (at the configured cost unless given).
+    Format: scrypt$n=<N>,r=<r>,p=<p>$salt_hex$hash_hex
     """
     # Generate a random 16-byte salt
     salt = os.urandom(16)
 
-    # Scrypt parameters (tuned for a balance of security and performance)
-    kdf = Scrypt(salt=salt, length=32, n=2**14, r=8, p=1, backend=default_backend())
-    key = kdf.derive(password.encode("utf-8"))
+    key = _scrypt(password, salt, n, r, p)
 
     # Encode salt and key to hex for storage
     salt_hex = binascii.hexlify(salt).decode("utf-8")
     key_hex = binascii.hexlify(key).decode("utf-8")
 
-    return f"scrypt${salt_hex}${key_hex}"
+    return f"scrypt$n={n},r={r},p={p}${salt_hex}${key_hex}"
+
+
+def get_password_hashes(passwords: list) -> list:
+    """Hash many passwords (each with its own salt), spread over the CPU cores."""
+    with ThreadPoolExecutor(max_workers=min(len(passwords), os.cpu_count() or 1) or 1) as pool:
+        return list(pool.map(get_password_hash, passwords))
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
-    Check if the provided password matches the stored hash.
+    Check if the provided password matches the stored hash, using the parameters it was made with.
     """
     try:
-        # Parse the stored string
-        parts = hashed_password.split("$")
-        if len(parts) != 3 or parts[0] != "scrypt":
+        params, salt, stored_key = _parse(hashed_password)
+        if params["n"] > MAX_N:
             return False
 
-        _, salt_hex, key_hex = parts
-
-        salt = binascii.unhexlify(salt_hex)
-        stored_key = binascii.unhexlify(key_hex)
+        # Re-derive key using the same parameters and salt, compare in constant time
+        return hmac.compare_digest(_scrypt(plain_password, salt, params["n"], params["r"], params["p"]), stored_key)
 
-        # Re-derive key using the same parameters and salt
-        kdf = Scrypt(salt=salt, length=32, n=2**14, r=8, p=1, backend=default_backend())
+    except Exception:
+        # Catch generic errors (bad format, etc.)
+        return False
 
-        # verify() raises an exception if the key doesn't match
-        kdf.verify(plain_password.encode("utf-8"), stored_key)
-        return True
 
+def needs_rehash(hashed_password: str) -> bool:
+    """True if the hash wasn't made with the configured parameters (or is in the old format)."""
+    try:
+        params, _, _ = _parse(hashed_password)
     except Exception:
-        # Catch generic errors (bad format, verification failure, etc.)
         return False
+    return hashed_password.count("$") == 2 or (params["n"], params["r"], params["p"]) != (
+        PASSWORD_SCRYPT_N,
+        PASSWORD_SCRYPT_R,
+        PASSWORD_SCRYPT_P,
+    )
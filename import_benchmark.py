@@ -0,0 +1,66 @@
+"""
+Measure how long an API worker takes to import the app, using `python -X importtime`.
+Request serving must not pull in spreadsheet/dataframe libraries: those are imported inside the
+specific export/import functions that use them (e.g. openpyxl in /users/import-students).
+
+Run this after adding imports to anything under app/:
+    python import_benchmark.py            # best of 3 runs
+    python import_benchmark.py --runs 10 --top 20
+Exits with status 1 if `import app` loads any module in HEAVY_MODULES.
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+# Only needed by frontend_test.py (streamlit dashboard) or by export/import code paths
+HEAVY_MODULES = ("pandas", "numpy", "plotly", "streamlit", "openpyxl", "xlsxwriter")
+
+
+def measure():
+    """Run one fresh interpreter; return {module: (self_us, cumulative_us)}."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        print(proc.stderr)
+        sys.exit(f"❌ 'import app' failed (exit {proc.returncode})")
+
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="take the fastest of N runs")
+    parser.add_argument("--top", type=int, default=15, help="how many top-level packages to list")
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(max(1, args.runs))]
+    best = min(runs, key=lambda m: m["app"][1])
+
+    print(f"import app: {best['app'][1] / 1000:.1f} ms (best of {len(runs)})")
+    print("\nSlowest top-level packages (cumulative):")
+    top_level = {name: cumulative for name, (_, cumulative) in best.items() if "." not in name}
+    for root, cumulative in sorted(top_level.items(), key=lambda kv: -kv[1])[: args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {root}")
+
+    loaded = sorted({name.split(".")[0] for name in best} & set(HEAVY_MODULES))
+    if loaded:
+        print(f"\n❌ Heavy modules imported at startup: {', '.join(loaded)}")
+        print("   Move these imports inside the function that needs them.")
+        sys.exit(1)
+    print("\n✅ No heavy modules imported at startup.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Measure what each scrypt cost means for login latency on this machine, to pick
+PASSWORD_SCRYPT_LOG_N / PASSWORD_SCRYPT_R / PASSWORD_SCRYPT_P for a deployment (see app/core.py).
+A login is dominated by one password verification; the database lookups overlap it.
+
+    python login_benchmark.py                      # N = 2**12 .. 2**17, r=8, p=1
+    python login_benchmark.py --log-n 14 15 16 --runs 20 --concurrency 8
+For each cost it prints the median and p95 time of one verification and how many logins per
+second the machine sustains with --concurrency logins at once. Existing users are moved to a new
+cost the next time they log in.
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core import PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_P, PASSWORD_SCRYPT_R
+from app.utils import get_password_hash, verify_password
+
+PASSWORD = "correct horse battery staple"
+
+
+def measure(log_n: int, r: int, p: int, runs: int, concurrency: int):
+    stored = get_password_hash(PASSWORD, n=2**log_n, r=r, p=p)
+    verify_password(PASSWORD, stored)  # Warm-up
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        assert verify_password(PASSWORD, stored)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+
+    # hashlib releases the GIL while deriving, so threads show what the cores can sustain
+    total = max(runs, concurrency * 2)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda _: verify_password(PASSWORD, stored), range(total)))
+        throughput = total / (time.perf_counter() - start)
+    return statistics.median(times), p95, throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log-n", type=int, nargs="+", default=[12, 13, 14, 15, 16, 17], help="costs to try, as log2(N)")
+    parser.add_argument("-r", type=int, default=PASSWORD_SCRYPT_R, help="scrypt block size")
+    parser.add_argument("-p", type=int, default=PASSWORD_SCRYPT_P, help="scrypt parallelism")
+    parser.add_argument("--runs", type=int, default=10, help="verifications timed per cost")
+    parser.add_argument("--concurrency", type=int, default=4, help="simultaneous logins for the throughput column")
+    args = parser.parse_args()
+
+    configured = PASSWORD_SCRYPT_N.bit_length() - 1
+    print(f"Configured: N=2**{configured}, r={PASSWORD_SCRYPT_R}, p={PASSWORD_SCRYPT_P}\n")
+    print(f"{'cost':>14}  {'memory':>8}  {'median':>9}  {'p95':>9}  {'logins/s':>9}")
+    for log_n in args.log_n:
+        median, p95, throughput = measure(log_n, args.r, args.p, max(1, args.runs), max(1, args.concurrency))
+        memory_mb = 128 * args.r * 2**log_n / (1024 * 1024)
+        marker = "  <- configured" if (2**log_n, args.r, args.p) == (PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P) else ""
+        print(
+            f"{f'N=2**{log_n} r={args.r}':>14}  {memory_mb:6.0f}MB  {median * 1000:7.1f}ms  {p95 * 1000:7.1f}ms"
+            f"  {throughput:9.1f}{marker}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -21,12 +21,11 @@ DB_PORT = int(os.getenv("DB_PORT", 3322))
 DB_USER = os.getenv("DB_USER", "immudb")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "immudb")
 
+from app import queries as q
 from app.utils import get_password_hash
 from app.database import _ensure_new_user_tables, ROLE_TABLES
 
-
-def esc(s):
-    return str(s).replace("'", "''") if s else ""
+INSERT_USER = q.insert("users", ("username", "hashed_password", "role", "active"))
 
 
 # (username, password_env_key, default_pass, role, first_name, last_name, contact_info, gender)
@@ -78,42 +77,53 @@ def reset_users():
         for username, env_key, default_pass, role, first_name, last_name, contact, gender in ROLE_USERS:
             password = os.getenv(env_key, default_pass)
             hashed = get_password_hash(password)
-            client.sqlExec(
-                f"INSERT INTO users (username, hashed_password, role, active) "
-                f"VALUES ('{esc(username)}', '{esc(hashed)}', '{esc(role)}', true)"
-            )
-            client.sqlExec(
-                f"INSERT INTO {role} (username, first_name, middle_name, last_name, gender, contact_information) "
-                f"VALUES ('{esc(username)}', '{esc(first_name)}', '', '{esc(last_name)}', '{esc(gender)}', '{esc(contact)}')"
-            )
+            client.sqlExec(INSERT_USER, {"username": username, "hashed_password": hashed, "role": role, "active": True})
+            row = {
+                "username": username,
+                "first_name": first_name,
+                "middle_name": "",
+                "last_name": last_name,
+                "gender": gender,
+                "contact_information": contact,
+            }
+            client.sqlExec(q.insert(role, tuple(row)), row)
             print(f"  ✅ {username} ({role})")
 
         print("\n👤 Creating staff user...")
         (username, env_key, default_pass, fn, mn, ln, gender, position, department, date_hired, status, monthly_salary) = STAFF_USER
         password = os.getenv(env_key, default_pass)
         hashed = get_password_hash(password)
-        client.sqlExec(
-            f"INSERT INTO users (username, hashed_password, role, active) "
-            f"VALUES ('{esc(username)}', '{esc(hashed)}', 'staff', true)"
-        )
-        client.sqlExec(
-            f"INSERT INTO staff (username, first_name, middle_name, last_name, gender, position, department, date_hired, status, monthly_salary) "
-            f"VALUES ('{esc(username)}', '{esc(fn)}', '{esc(mn)}', '{esc(ln)}', '{esc(gender)}', "
-            f"'{esc(position)}', '{esc(department)}', '{esc(date_hired)}', '{esc(status)}', {int(monthly_salary)})"
-        )
+        client.sqlExec(INSERT_USER, {"username": username, "hashed_password": hashed, "role": "staff", "active": True})
+        row = {
+            "username": username,
+            "first_name": fn,
+            "middle_name": mn,
+            "last_name": ln,
+            "gender": gender,
+            "position": position,
+            "department": department,
+            "date_hired": date_hired,
+            "status": status,
+            "monthly_salary": int(monthly_salary),
+        }
+        client.sqlExec(q.insert("staff", tuple(row)), row)
         print(f"  ✅ {username} (staff)")
 
         print("\n👤 Creating student user...")
         username, password, first_name, middle_name, last_name, gender, strand, section, payment_plan = STUDENT_USER
         hashed = get_password_hash(password)
-        client.sqlExec(
-            f"INSERT INTO users (username, hashed_password, role, active) "
-            f"VALUES ('{esc(username)}', '{esc(hashed)}', 'student', true)"
-        )
-        client.sqlExec(
-            f"INSERT INTO students (username, first_name, middle_name, last_name, gender, strand, section, payment_plan) "
-            f"VALUES ('{esc(username)}', '{esc(first_name)}', '{esc(middle_name)}', '{esc(last_name)}', '{esc(gender)}', '{esc(strand)}', '{esc(section)}', '{esc(payment_plan)}')"
-        )
+        client.sqlExec(INSERT_USER, {"username": username, "hashed_password": hashed, "role": "student", "active": True})
+        row = {
+            "username": username,
+            "first_name": first_name,
+            "middle_name": middle_name,
+            "last_name": last_name,
+            "gender": gender,
+            "strand": strand,
+            "section": section,
+            "payment_plan": payment_plan,
+        }
+        client.sqlExec(q.insert("students", tuple(row)), row)
         print(f"  ✅ {username} (student)")
 
         print("\n✅ User reset completed successfully!")